@@ -1,21 +1,59 @@
 #!/usr/bin/env python
 
-from sensors import Sensor, outputGPIO
+from sensors import Sensor
 from logs import Logs
+from analytics import LogAnalytics
 from notifier import Notify
+from settingswatcher import SettingsWatcher
+from runtime import getRuntime
+from journal import StateJournal
+from latency import getLatencyTracer
+from satellite import getSatelliteServer
+from memory import LRUCache, getProfile
+import tracer
 from colors import bcolors
+import serializer
 from datetime import datetime
 import pytz
-import json
+import os
 import threading
 import time
 import subprocess
 import sys
-import smtplib
 import re
-from email.mime.text import MIMEText
 import uuid
-from collections import OrderedDict
+from collections import OrderedDict, deque
+
+
+# Seconds between the writes of the settings file and the number of state
+# changes that are kept in the journal before writing it
+JOURNAL_COMPACT_INTERVAL = 300
+JOURNAL_MAX_ENTRIES = 1000
+# Number of writes of the settings file that the watcher may still report
+WRITTEN_SETTINGS_KEPT = 16
+
+STRING_TYPES = (str, type(u''))
+NUMBER_TYPES = (int, float)
+
+# The types of the settings that the UI changes with updateSettings. The
+# other values of these sections are kept.
+SETTINGS_FIELDS = {
+    'serene': {'enable': bool, 'pin': int},
+    'mail': {'enable': bool, 'username': STRING_TYPES,
+             'password': STRING_TYPES, 'smtpServer': STRING_TYPES,
+             'smtpPort': int, 'recipients': list,
+             'messageSubject': STRING_TYPES, 'messageBody': STRING_TYPES},
+    'voip': {'enable': bool, 'username': STRING_TYPES,
+             'password': STRING_TYPES, 'domain': STRING_TYPES,
+             'numbersToCall': list,
+             'timesOfRepeat': STRING_TYPES + NUMBER_TYPES},
+    'mqtt': {'enable': bool, 'host': STRING_TYPES, 'port': int,
+             'authentication': bool, 'username': STRING_TYPES,
+             'password': STRING_TYPES, 'state_topic': STRING_TYPES,
+             'command_topic': STRING_TYPES, 'qos': dict},
+}
+SETTINGS_NAMES = {'serene': 'Serene', 'mail': 'Mail', 'voip': 'VoIP',
+                  'mqtt': 'MQTT', 'timezone': 'UI'}
 
 
 class Worker():
@@ -28,59 +66,129 @@ class Worker():
     the main application.
     """
 
-    def __init__(self, jsonfile, logfile, sipcallfile, optsUpdateUI=None):
-        """ Init for the Worker class """
+    def __init__(self, jsonfile, logfile, sipcallfile, optsUpdateUI=None,
+                 tracefile=None):
+        """ Init for the Worker class. With a tracefile the sensor events
+            and the MQTT messages are recorded for replay.py """
 
         print("{0}------------ INIT FOR DOOR SENSOR CLASS! ----------------{1}"
               .format(bcolors.HEADER, bcolors.ENDC))
+        self.startupTimes = OrderedDict()
+        self._phaseStart = time.time()
+
         # Global Variables
         self.jsonfile = jsonfile
         self.logfile = logfile
         self.sipcallfile = sipcallfile
         self.settings = self.ReadSettings()
-        self.limit = 10
-        self.logtypes = 'all'
+        # The settings of the file, to find what another program changes
+        self.lastWrittenSettings = serializer.dumps(self.settings)
+        # The writes of this process that the watcher hasn't reported yet
+        self.writtenSettings = deque([self.lastWrittenSettings],
+                                     maxlen=WRITTEN_SETTINGS_KEPT)
+        # The state changes since the last write of the settings file
+        self.settingsLock = threading.RLock()
+        self.journal = StateJournal(
+            os.path.splitext(self.jsonfile)[0] + '.journal')
+        restoredChanges = self.journal.replay(self.settings)
+        self.logSubscribers = {}
+        # Version of the state, increased on every change. The payloads of
+        # the status endpoints are cached for the current version.
+        self.stateId = uuid.uuid4().hex[:8]
+        self.stateVersion = 0
+        self.stateCondition = threading.Condition()
+        self.snapshots = LRUCache()
+        self.runtime = getRuntime()
+        self.latency = getLatencyTracer()
+        # The clock of the logs, replaced by the virtual clock of replay.py
+        self.now = datetime.now
+        self.tracer = None
+        if tracefile:
+            self.tracer = tracer.EventTracer(tracefile, self.settings)
 
         # Stop execution on exit
         self.kill_now = False
+        self._startupPhase('settings')
 
         # Init Alarm
-        self.mynotify = Notify(self.settings)
+        self.mynotify = Notify(
+            self.settings, os.path.splitext(self.jsonfile)[0] + '.outbox')
         self.mynotify.setupUpdateUI(optsUpdateUI)
-        self.mynotify.setupSendStateMQTT()
-        mylogs = Logs(self.logfile)
-        self.getSensorsLog = mylogs.getSensorsLog
+        if restoredChanges:
+            print("{0}Restored {2} state changes from the journal{1}".format(
+                bcolors.WARNING, bcolors.ENDC, restoredChanges))
+            self.writeNewSettingsToFile(self.settings)
+        self.runtime.schedule(
+            JOURNAL_COMPACT_INTERVAL, 'journal', self.compactJournal,
+            owner=self.journal, interval=JOURNAL_COMPACT_INTERVAL)
+        self.logs = Logs(self.logfile)
+        self.getSensorsLog = self.logs.getSensorsLog
+        self.getEpisodes = self.logs.getEpisodes
+        self.analytics = LogAnalytics(self.logfile)
         self.writeLog("system", "Alarm Booted")
-        mylogs.startTrimThread()
+        self.logs.startTrimming()
+        self._startupPhase('logs')
 
         # Event Listeners
+        # The sensors are armed before connecting to the MQTT server,
+        # so that no event is lost while waiting for the broker.
         self.sensors = Sensor()
+        if self.tracer is not None:
+            self.sensors.on_alert(self.tracer.recordSensor(tracer.SENSOR_ALERT))
+            self.sensors.on_alert_stop(
+                self.tracer.recordSensor(tracer.SENSOR_ALERT_STOP))
+            self.sensors.on_error(self.tracer.recordSensor(tracer.SENSOR_ERROR))
+            self.sensors.on_error_stop(
+                self.tracer.recordSensor(tracer.SENSOR_ERROR_STOP))
+            self.mynotify.on_message_received(self.tracer.recordMQTT)
         self.sensors.on_alert(self.sensorAlert)
         self.sensors.on_alert_stop(self.sensorStopAlert)
         self.sensors.on_error(self.sensorError)
         self.sensors.on_error_stop(self.sensorStopError)
         self.sensors.add_sensors(self.settings)
+        self._startupPhase('sensors')
 
         # Init MQTT Messages
         self.mynotify.on_disarm_mqtt(self.deactivateAlarm)
         self.mynotify.on_arm_mqtt(self.activateAlarm)
         self.mynotify.on_sensor_set_alert(self.sensorAlert)
         self.mynotify.on_sensor_set_stopalert(self.sensorStopAlert)
-        self.mynotify.sendStateMQTT()
+        self.mynotify.on_sensor_heartbeat(self.sensors.heartbeat)
+        self.mynotify.on_sensor_availability(self.sensors.set_availability)
+        self.mynotify.setupSendStateMQTT()
+        self._startupPhase('mqtt')
+
+        # Apply the changes made to the settings file by other programs
+        self.settingsWatcher = SettingsWatcher(
+            self.jsonfile, self.settingsFileChanged,
+            useThread=getProfile()['watcher_thread'])
+        self.settingsWatcher.start()
+
+    def _startupPhase(self, phase):
+        """ Keeps the seconds that each phase of the startup needed """
 
+        now = time.time()
+        self.startupTimes[phase] = now - self._phaseStart
+        self._phaseStart = now
 
     def sensorAlert(self, sensorUUID):
         """ On Sensor Alert, write logs and check for intruder """
 
+        trace = self.latency.current()
+        if trace is not None:
+            trace.sensor = sensorUUID
+        self.latency.mark(trace, 'sensorAlert')
         name = self.settings['sensors'][sensorUUID]['name']
         print("{0}-> Alert Sensor: {2}{1}".format(
             bcolors.OKGREEN, bcolors.ENDC, name))
         self.settings['sensors'][sensorUUID]['alert'] = True
         self.settings['sensors'][sensorUUID]['online'] = True
-        self.writeNewSettingsToFile(self.settings)
+        self.saveState(('sensors', sensorUUID, 'alert'),
+                       ('sensors', sensorUUID, 'online'))
         stateTopic = self.settings['mqtt']['state_topic'] + '/sensor/' + name
         self.mynotify.sendSensorMQTT(stateTopic, 'on')
         self.mynotify.updateUI('settingsChanged', self.getSensorsArmed())
+        self.latency.mark(trace, 'updateUI')
         self.writeLog("sensor,start," + sensorUUID, name)
         self.checkIntruderAlert()
 
@@ -92,7 +200,8 @@ class Worker():
             bcolors.OKGREEN, bcolors.ENDC, name))
         self.settings['sensors'][sensorUUID]['alert'] = False
         self.settings['sensors'][sensorUUID]['online'] = True
-        self.writeNewSettingsToFile(self.settings)
+        self.saveState(('sensors', sensorUUID, 'alert'),
+                       ('sensors', sensorUUID, 'online'))
         stateTopic = self.settings['mqtt']['state_topic'] + '/sensor/' + name
         self.mynotify.sendSensorMQTT(stateTopic, 'off')
         self.mynotify.updateUI('settingsChanged', self.getSensorsArmed())
@@ -108,7 +217,8 @@ class Worker():
         name = self.settings['sensors'][sensorUUID]['name']
         self.settings['sensors'][sensorUUID]['alert'] = True
         self.settings['sensors'][sensorUUID]['online'] = False
-        self.writeNewSettingsToFile(self.settings)
+        self.saveState(('sensors', sensorUUID, 'alert'),
+                       ('sensors', sensorUUID, 'online'))
         self.writeLog("error", "Lost connection to: " + name)
         self.mynotify.updateUI('settingsChanged', self.getSensorsArmed())
 
@@ -120,7 +230,7 @@ class Worker():
             bcolors.FAIL, bcolors.ENDC, name))
         name = self.settings['sensors'][sensorUUID]['name']
         self.settings['sensors'][sensorUUID]['online'] = True
-        self.writeNewSettingsToFile(self.settings)
+        self.saveState(('sensors', sensorUUID, 'online'))
         self.writeLog("error", "Restored connection to: " + name)
         self.mynotify.updateUI('settingsChanged', self.getSensorsArmed())
 
@@ -134,8 +244,14 @@ class Worker():
                         sensorvalue['enabled'] is True and
                         self.settings['settings']['alarmTriggered'] is False):
                     self.settings['settings']['alarmTriggered'] = True
+                    self.saveState(('settings', 'alarmTriggered'))
+                    trace = self.latency.current()
+                    self.latency.mark(trace, 'checkIntruderAlert')
+                    # The siren has its own thread, so it never waits for
+                    # the calls and the mails on the shared pool
                     threadIntruderAlert = threading.Thread(
-                        target=self.intruderAlert)
+                        target=self.intruderAlert, args=(trace,),
+                        name='intruder-alert')
                     threadIntruderAlert.daemon = True
                     threadIntruderAlert.start()
 
@@ -143,50 +259,288 @@ class Worker():
         """ Reads the json settings file and returns it """
 
         with open(self.jsonfile) as data_file:
-            settings = json.load(data_file)
+            settings = serializer.loads(data_file.read())
         return settings
 
+    def stateChanged(self):
+        """ Increases the state version and wakes up the requests that
+            wait for a newer version """
+
+        with self.stateCondition:
+            self.stateVersion += 1
+            self.snapshots.clear()
+            self.stateCondition.notify_all()
+
+    def getSnapshot(self, name, build):
+        """ Returns the json of a payload for the current state version.
+            The payload is built with the build function only once for
+            each version. """
+
+        with self.stateCondition:
+            version = self.stateVersion
+            snapshot = self.snapshots.get(name)
+        if snapshot is not None:
+            return snapshot
+        snapshot = {
+            'version': version,
+            'etag': '{0}-{1}'.format(self.stateId, version),
+            'body': serializer.dumps(build()),
+            'gzip': None
+        }
+        with self.stateCondition:
+            if self.stateVersion == version:
+                self.snapshots[name] = snapshot
+        return snapshot
+
+    def waitStateVersion(self, version, timeout):
+        """ Waits until the state version is newer than the given one or
+            until the timeout. Returns the current version. """
+
+        endTime = time.time() + timeout
+        with self.stateCondition:
+            while self.stateVersion <= version:
+                remaining = endTime - time.time()
+                if remaining <= 0:
+                    break
+                self.stateCondition.wait(remaining)
+            return self.stateVersion
+
     def writeNewSettingsToFile(self, settings):
-        """ Write the new settings to the json file """
-        self.mynotify.updateSettings(settings)
-        with open(self.jsonfile, 'w') as outfile:
-            json.dump(settings, outfile, sort_keys=True,
-                      indent=4, separators=(',', ': '))
+        """ Write the new settings to the json file. The file is replaced
+            atomically and then the journal is emptied. """
+        with self.settingsLock:
+            self.mynotify.updateSettings(settings)
+            self.stateChanged()
+            self.lastWrittenSettings = serializer.dumps(settings)
+            self.writtenSettings.append(self.lastWrittenSettings)
+            tmpfile = self.jsonfile + '.tmp'
+            with open(tmpfile, 'w') as outfile:
+                outfile.write(self.lastWrittenSettings)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            os.rename(tmpfile, self.jsonfile)
+            self.journal.clear()
+
+    def saveState(self, *paths):
+        """ Saves the values of the settings at these paths, e.g.
+            ('settings', 'alarmArmed'), in the journal instead of writing
+            the whole settings file on every sensor event """
+        with self.settingsLock:
+            self.mynotify.updateSettings(self.settings)
+            self.stateChanged()
+            changes = []
+            for path in paths:
+                value = self.settings
+                for key in path:
+                    value = value[key]
+                changes.append((path, value))
+            self.journal.append(changes)
+            if self.journal.entries >= JOURNAL_MAX_ENTRIES:
+                self.runtime.submit('journal', self.compactJournal,
+                                    owner=self.journal)
+
+    def compactJournal(self):
+        """ Writes the settings file if the journal has changes """
+        with self.settingsLock:
+            if self.journal.entries:
+                self.writeNewSettingsToFile(self.settings)
+
+    def close(self):
+        """ Stops the background work of the Worker when the server stops:
+            the journal is written to the settings file, the index of the
+            logs and the MQTT messages that weren't sent are saved and the
+            trace file is closed """
+
+        self.settingsWatcher.stop()
+        for owner in (self, self.journal, self.logs, self.mynotify.outbox):
+            self.runtime.cancel(owner=owner)
+        self.compactJournal()
+        self.logs.index.save()
+        self.mynotify.outbox.save()
+        if self.tracer is not None:
+            self.tracer.close()
+
+    def settingsFileChanged(self, content):
+        """ Applies the changes of the settings file that were made by
+            another program. Only the changed parts are restarted. The
+            state of the alarm that the other program didn't change is
+            kept, because the newest state may be only in the journal.
+            The watcher can report an older write of this process after
+            a newer one was made, so all the writes that it hasn't
+            reported yet are ignored. """
+
+        with self.settingsLock:
+            if content in self.writtenSettings:
+                # The writes before this one won't be reported any more
+                while self.writtenSettings[0] != content:
+                    self.writtenSettings.popleft()
+                return
+            try:
+                newSettings = serializer.loads(content)
+            except ValueError:
+                return
+            print("{0}Settings file changed{1}".format(
+                bcolors.WARNING, bcolors.ENDC))
+            self.keepRuntimeState(newSettings)
+            mqttChanged = newSettings['mqtt'] != self.settings['mqtt']
+            alarmChanged = (newSettings['settings'] !=
+                            self.settings['settings'])
+            for section, values in newSettings.items():
+                if section != 'sensors':
+                    self.settings[section] = values
+            self.applySensorsSettings(newSettings['sensors'])
+            # The merged settings are the new snapshot, so the journal is
+            # emptied only after they are written
+            self.writeNewSettingsToFile(self.settings)
+        if mqttChanged:
+            self.mynotify.setupSendStateMQTT()
+        elif alarmChanged:
+            self.mynotify.sendStateMQTT()
+        self.mynotify.updateUI('sensorsChanged', None)
 
+    def keepRuntimeState(self, newSettings):
+        """ Copies the alarm and sensor state of the running alarm to the
+            settings of another program, except for the values that the
+            program changed in the last written settings file """
 
-    def writeLog(self, logType, message):
-        """ Write log events into a file and send the last to UI.
-            It also uses the timezone from json file to get the local time.
-        """
+        try:
+            base = serializer.loads(self.lastWrittenSettings)
+        except (TypeError, ValueError):
+            base = None
+        paths = [('settings', 'alarmArmed'), ('settings', 'alarmTriggered')]
+        for sensor in newSettings.get('sensors', {}):
+            if sensor in self.settings['sensors']:
+                paths.extend(('sensors', sensor, key)
+                             for key in ('alert', 'online', 'enabled'))
+
+        def getValue(settings, path):
+            for key in path:
+                if type(settings) != dict or key not in settings:
+                    return None
+                settings = settings[key]
+            return settings
+
+        for path in paths:
+            current = getValue(self.settings, path)
+            if current is None:
+                continue
+            newValue = getValue(newSettings, path)
+            if base is None or newValue == getValue(base, path):
+                parent = getValue(newSettings, path[:-1])
+                if type(parent) == dict:
+                    parent[path[-1]] = current
+
+    def applySensorsSettings(self, newSensors):
+        """ Replaces the sensors with the new ones. Only the drivers of the
+            sensors that changed are restarted and only their MQTT topics
+            are subscribed or unsubscribed. """
+
+        oldSensors = self.settings['sensors']
+        self.settings['sensors'] = newSensors
+        for sensor, sensorvalue in oldSensors.items():
+            if sensor not in newSensors:
+                self.sensors.del_sensor(sensor)
+                self.mynotify.unsubscribeSensor(sensor, sensorvalue)
+        for sensor, sensorvalue in newSensors.items():
+            oldvalue = oldSensors.get(sensor)
+            if oldvalue is None:
+                self.sensors.add_sensor(sensor, sensorvalue)
+                self.mynotify.subscribeSensor(sensor, sensorvalue)
+                continue
+            if (self.mynotify.sensorTopics(oldvalue) !=
+                    self.mynotify.sensorTopics(sensorvalue)):
+                self.mynotify.unsubscribeSensor(sensor, oldvalue)
+                self.mynotify.subscribeSensor(sensor, sensorvalue)
+            self.sensors.update_sensor(sensor, sensorvalue)
+
+
+    def getLogTime(self):
+        """ Returns the current time in the timezone of the settings and
+            in the format of the log file """
         try:
             mytimezone = pytz.timezone(self.settings['settings']['timezone'])
         except Exception:
             mytimezone = pytz.utc
 
-        myTimeLog = datetime.now(tz=mytimezone).strftime("%Y-%m-%d %H:%M:%S")
-        logmsg = '({0}) [{1}] {2}\n'.format(logType, myTimeLog, message)
-        with open(self.logfile, "a") as myfile:
-            myfile.write(logmsg)
-        self.mynotify.updateUI('sensorsLog', self.getSensorsLog(
-            self.limit, selectTypes=self.logtypes))
+        return self.now(tz=mytimezone).strftime("%Y-%m-%d %H:%M:%S")
 
-    def intruderAlert(self):
+    def writeLog(self, logType, message):
+        """ Write log events into a file and send the new event to the
+            UI clients that have subscribed with matching filters.
+            It also uses the timezone from json file to get the local time.
+            A sensor stop log is merged with its start log, so the clients
+            that combine the sensors and have the json format get the start
+            log again with its end time and duration, and they replace the
+            entry that has its cursor.
+        """
+        log = self.logs.writeLog(logType, self.getLogTime(), message)
+        endedLog = None
+        for client, filters in list(self.logSubscribers.items()):
+            if self.logs.matchLog(log, filters['types'], filters['text'],
+                                  filters['combine']):
+                self.mynotify.updateUI(
+                    'sensorLogEntry',
+                    self.logs.formatLog(log, filters['format']),
+                    room=client)
+            elif filters['combine'] and filters['format'] == 'json':
+                if endedLog is None:
+                    endedLog = self.logs.getEndedSensorLog(log) or False
+                if endedLog and self.logs.matchLog(
+                        endedLog, filters['types'], filters['text']):
+                    self.mynotify.updateUI(
+                        'sensorLogEntry',
+                        self.logs.formatLog(endedLog, 'json'), room=client)
+
+    def subscribeLog(self, client, limit=None, logtypes=None,
+                     filterText=None, getFormat=None, combineSensors=None):
+        """ Registers the log filters of a UI client, so that it receives
+            only the new events that match them. Returns the current logs
+            for these filters. """
+
+        returnedLogs = self.getSensorsLog(
+            limit=limit,
+            selectTypes=logtypes,
+            filterText=filterText,
+            getFormat=getFormat,
+            combineSensors=combineSensors)
+        self.logSubscribers[client] = {
+            'types': self.logs.parseSelectTypes(logtypes),
+            'text': filterText,
+            'format': getFormat or 'text',
+            'combine': str(combineSensors).lower() != 'false'
+        }
+        return returnedLogs
+
+    def unsubscribeLog(self, client):
+        """ Stops sending new events to the UI client """
+
+        self.logSubscribers.pop(client, None)
+
+    def intruderAlert(self, trace=None):
         """ This method is called when an intruder is detected. It calls
             all the methods whith the actions that we want to do.
             Sends MQTT message, enables serene, Send mail, Call Voip.
+            The trace of the sensor event gets the time of each action.
         """
         self.writeLog("alarm", "Intruder Alert")
-        self.enableSerene()
-        self.mynotify.sendStateMQTT()
+        self.enableSerene(trace)
+        self.mynotify.sendStateMQTT(trace)
         self.mynotify.updateUI('alarmStatus', self.getTriggeredStatus())
-        threadSendMail = threading.Thread(target=self.sendMail)
-        threadSendMail.daemon = True
-        threadSendMail.start()
-        threadCallVoip = threading.Thread(target=self.callVoip)
-        threadCallVoip.daemon = True
-        threadCallVoip.start()
-
-    def callVoip(self):
+        self.submitAlarmTask('mail', self.sendMail, trace)
+        self.submitAlarmTask('voip', self.callVoip, trace)
+
+    def submitAlarmTask(self, taskClass, function, trace):
+        """ Runs a notification of the intruder alert on the pool, or on
+            its own thread if the pool doesn't accept it """
+
+        if self.runtime.submit(taskClass, function, args=(trace,),
+                               owner=self) is None:
+            thread = threading.Thread(target=function, args=(trace,),
+                                      name=taskClass)
+            thread.daemon = True
+            thread.start()
+
+    def callVoip(self, trace=None):
         """ This method uses a prebuild application in C to connect to the SIP provider
             and call all the numbers in the json settings file.
         """
@@ -206,6 +560,7 @@ class Worker():
                     print("{0}Voip command: {2}{1}".format(
                         bcolors.FADE, bcolors.ENDC, " ".join(cmd)))
                     proc = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+                    self.latency.mark(trace, 'callVoip')
                     for line in proc.stderr:
                         sys.stderr.write(line)
                     proc.wait()
@@ -214,11 +569,13 @@ class Worker():
                     print("{0}Call Ended{1}".format(
                         bcolors.FADE, bcolors.ENDC))
 
-    def sendMail(self):
+    def sendMail(self, trace=None):
         """ This method sends an email to all recipients
             in the json settings file. """
 
         if self.settings['mail']['enable'] is True:
+            import smtplib
+            from email.mime.text import MIMEText
             mail_user = self.settings['mail']['username']
             mail_pwd = self.settings['mail']['password']
             smtp_server = self.settings['mail']['smtpServer']
@@ -243,21 +600,25 @@ class Worker():
             smtpserver.login(mail_user, mail_pwd)
             smtpserver.sendmail(sender, recipients, msg.as_string())
             smtpserver.close()
+            self.latency.mark(trace, 'sendMail')
 
             self.writeLog("alarm", "Mail sent to: " + ", ".join(recipients))
 
-    def enableSerene(self):
+    def enableSerene(self, trace=None):
         """ This method enables the output pin for the serene """
 
         if self.settings['serene']['enable'] is True:
             self.writeLog("alarm", "Serene started")
+            from sensordrivers.gpio import outputGPIO
             serenePin = int(self.settings['serene']['pin'])
             outputGPIO().enableOutputPin(serenePin)
+            self.latency.mark(trace, 'enableSerene')
 
     def stopSerene(self):
         """ This method disables the output pin for the serene """
 
         if self.settings['serene']['enable'] is True:
+            from sensordrivers.gpio import outputGPIO
             serenePin = self.settings['serene']['pin']
             outputGPIO().disableOutputPin(serenePin)
 
@@ -271,9 +632,9 @@ class Worker():
 
         self.writeLog("user_action", "Alarm activated")
         self.settings['settings']['alarmArmed'] = True
+        self.saveState(('settings', 'alarmArmed'))
         self.mynotify.sendStateMQTT()
         self.mynotify.updateUI('settingsChanged', self.getSensorsArmed())
-        self.writeNewSettingsToFile(self.settings)
 
     def deactivateAlarm(self):
         """ Deactivates the alarm """
@@ -281,10 +642,13 @@ class Worker():
         self.writeLog("user_action", "Alarm deactivated")
         self.settings['settings']['alarmTriggered'] = False
         self.settings['settings']['alarmArmed'] = False
+        # The mail and the calls that haven't started yet are not needed
+        self.runtime.cancel(owner=self)
+        self.saveState(('settings', 'alarmTriggered'),
+                       ('settings', 'alarmArmed'))
         self.stopSerene()
         self.mynotify.sendStateMQTT()
         self.mynotify.updateUI('settingsChanged', self.getSensorsArmed())
-        self.writeNewSettingsToFile(self.settings)
 
     def getSensorsArmed(self):
         """ Returns the sensors and alarm status
@@ -304,11 +668,57 @@ class Worker():
 
         return {"alert": self.settings['settings']['alarmTriggered']}
 
-    def setLogFilters(self, limit, logtypes):
-        """ Sets the global filters for the getSensorsLog method """
+    def getSensorHistory(self, sensorUUID, limit=None):
+        """ Returns the last activations of a sensor and their summary,
+            or None if there is no such sensor """
+
+        if sensorUUID not in self.settings['sensors']:
+            return None
+        history = self.logs.getSensorHistory(
+            sensorUUID, limit, today=self.getLogTime()[:10])
+        history['name'] = self.settings['sensors'][sensorUUID]['name']
+        return history
+
+    def getSensorsStats(self, fromTime=None, toTime=None):
+        """ Returns the statistics of the sensors from the log history """
+
+        sensorNames = dict(
+            (sensor, sensorvalue['name'])
+            for sensor, sensorvalue in self.settings['sensors'].items())
+        return self.analytics.getStats(fromTime, toTime, sensorNames)
+
+    def getLatency(self, limit=None, sensor=None):
+        """ Returns the latency histograms of the stages and the latest
+            traces of the sensors of this user, optionally of one sensor """
 
-        self.limit = limit
-        self.logtypes = logtypes
+        if (type(limit) != int):
+            if (limit is not None and limit.isdigit()):
+                limit = int(limit)
+            else:
+                limit = 20
+        sensors = set(self.settings['sensors'])
+        tracer = getLatencyTracer()
+        return {
+            'stages': tracer.getHistograms(sensors=sensors),
+            'traces': tracer.getTraces(limit=limit, sensor=sensor,
+                                       sensors=sensors)
+        }
+
+    def getRuntimeStats(self):
+        """ Returns the threads of the runtime and the counters of the
+            tasks of this Worker """
+
+        return self.runtime.getStats(owners=(
+            self, self.journal, self.logs, self.settingsWatcher))
+
+    def getSatellites(self):
+        """ Returns the connection of the satellite nodes of the sensors of
+            this user """
+
+        nodes = set(sensor['node'] for sensor in
+                    self.settings['sensors'].values()
+                    if sensor.get('type') == 'Satellite' and 'node' in sensor)
+        return getSatelliteServer().getStats(nodes=nodes)
 
     def getSereneSettings(self):
         """ Gets the Serene Settings """
@@ -329,46 +739,107 @@ class Worker():
         """ Gets the MQTT Settings """
         return self.settings['mqtt']
 
+    def validateSettings(self, changes):
+        """ Checks the sections of a settings update, e.g.
+            {'mail': {...}, 'mqtt': {...}, 'timezone': 'Europe/Athens'}.
+            Raises ValueError for the first wrong value. """
+
+        for section, values in changes.items():
+            if section == 'timezone':
+                if values not in pytz.all_timezones_set:
+                    raise ValueError("Unknown timezone: {0}".format(values))
+                continue
+            if section not in SETTINGS_FIELDS:
+                raise ValueError("Unknown settings: {0}".format(section))
+            if type(values) != dict:
+                raise ValueError("Wrong settings: {0}".format(section))
+            for key, value in values.items():
+                valueType = SETTINGS_FIELDS[section].get(key)
+                if valueType is None:
+                    continue
+                if (not isinstance(value, valueType) or
+                        (type(value) == bool and valueType is not bool)):
+                    raise ValueError("Wrong value of {0}.{1}: {2}".format(
+                        section, key, value))
+        pin = changes.get('serene', {}).get('pin')
+        if pin is not None and not 1 <= pin <= 27:
+            raise ValueError("Wrong serene pin: {0}".format(pin))
+        for section, key in (('mail', 'smtpPort'), ('mqtt', 'port')):
+            port = changes.get(section, {}).get(key)
+            if port is not None and not 0 < port < 65536:
+                raise ValueError("Wrong port of {0}: {1}".format(
+                    section, port))
+
+    def updateSettings(self, changes):
+        """ Changes several sections of the settings at once. They are
+            validated together and nothing is changed if one is wrong.
+            Only the changed values are applied, the settings file is
+            written once, and only the parts whose settings changed are
+            restarted (the MQTT connection and the serene if it is on).
+            Returns the names of the changed sections. """
+
+        self.validateSettings(changes)
+        with self.settingsLock:
+            changed = {}
+            for section, values in changes.items():
+                if section == 'timezone':
+                    values = {'timezone': values}
+                    current = self.settings['settings']
+                else:
+                    current = self.settings[section]
+                keys = [key for key, value in values.items()
+                        if key not in current or current[key] != value]
+                if keys:
+                    changed[section] = keys
+            if not changed:
+                return []
+
+            sereneOn = (self.settings['settings']['alarmTriggered'] and
+                        'serene' in changed)
+            if sereneOn:
+                self.stopSerene()
+            for section in changed:
+                if section == 'timezone':
+                    self.settings['settings']['timezone'] = \
+                        changes['timezone']
+                else:
+                    self.settings[section].update(changes[section])
+            self.writeLog("user_action", "Settings for {0} changed".format(
+                ", ".join(sorted(SETTINGS_NAMES[section]
+                                 for section in changed))))
+            self.writeNewSettingsToFile(self.settings)
+
+        # The QoS is read on each message, the rest needs a new connection
+        if [key for key in changed.get('mqtt', []) if key != 'qos']:
+            self.mynotify.setupSendStateMQTT()
+        if sereneOn:
+            self.enableSerene()
+        return sorted(changed)
+
     def setSereneSettings(self, message):
         """ set Serene Settings """
-        if self.settings['serene'] != message:
-            self.settings['serene'] = message
-            self.writeLog("user_action", "Settings for Serene changed")
-            self.writeNewSettingsToFile(self.settings)
+        return self.updateSettings({'serene': message})
 
     def setMailSettings(self, message):
         """ Set Mail Settings """
-        if self.settings['mail'] != message:
-            self.settings['mail'] = message
-            self.writeLog("user_action", "Settings for Mail changed")
-            self.writeNewSettingsToFile(self.settings)
+        return self.updateSettings({'mail': message})
 
     def setVoipSettings(self, message):
         """ Set Voip Settings """
-        if self.settings['voip'] != message:
-            self.settings['voip'] = message
-            self.writeLog("user_action", "Settings for VoIP changed")
-            self.writeNewSettingsToFile(self.settings)
+        return self.updateSettings({'voip': message})
 
     def setTimezoneSettings(self, message):
         """ Set the Timezone """
-        if self.settings['settings']['timezone'] != message:
-            self.settings['settings']['timezone'] = message
-            self.writeLog("user_action", "Settings for UI changed")
-            self.writeNewSettingsToFile(self.settings)
+        return self.updateSettings({'timezone': message})
 
     def setMQTTSettings(self, message):
         """ Set MQTT Settings """
-        if self.settings['mqtt'] != message:
-            self.settings['mqtt'] = message
-            self.writeLog("user_action", "Settings for MQTT changed")
-            self.writeNewSettingsToFile(self.settings)
-            self.mynotify.setupSendStateMQTT()
+        return self.updateSettings({'mqtt': message})
 
     def setSensorState(self, sensorUUID, state):
         """ Activate or Deactivate a sensor """
         self.settings['sensors'][sensorUUID]['enabled'] = state
-        self.writeNewSettingsToFile(self.settings)
+        self.saveState(('sensors', sensorUUID, 'enabled'))
 
         logState = "Deactivated"
         if state is True:
@@ -376,7 +847,6 @@ class Worker():
         logSensorName = self.settings['sensors'][sensorUUID]['name']
         self.writeLog("user_action", "{0} sensor: {1}".format(
             logState, logSensorName))
-        self.writeNewSettingsToFile(self.settings)
 
     def setSensorsZone(self, zones):
         for sensor, sensorvalue in self.settings['sensors'].items():
@@ -386,29 +856,34 @@ class Worker():
                 sensorvalue['enabled'] = True
             else:
                 sensorvalue['enabled'] = False
+        self.saveState(*[('sensors', sensor, 'enabled')
+                         for sensor in self.settings['sensors']])
         self.mynotify.updateUI('settingsChanged', self.getSensorsArmed())
-        self.writeNewSettingsToFile(self.settings)
 
     def addSensor(self, sensorValues):
         """ Add a new sensor """
         print("{0}New Sensor: {2}{1}".format(
             bcolors.WARNING, bcolors.ENDC, sensorValues))
         key = next(iter(sensorValues))
-        sensorValues[key]['enabled'] = True
-        sensorValues[key]['online'] = False
-        sensorValues[key]['alert'] = True
+        newSensors = dict(self.settings['sensors'])
+        oldValues = newSensors.get(key)
+        if oldValues is None:
+            sensorValues[key]['enabled'] = True
+            sensorValues[key]['online'] = False
+            sensorValues[key]['alert'] = True
+        else:
+            for state in ('enabled', 'online', 'alert'):
+                sensorValues[key][state] = oldValues[state]
         if 'undefined' in sensorValues:
             sensorUUID = str(uuid.uuid4())
             sensorValues[sensorUUID] = sensorValues.pop('undefined')
-        else:
-            self.sensors.del_sensor(key)
-        self.settings['sensors'].update(sensorValues)
+        newSensors.update(sensorValues)
+        self.applySensorsSettings(newSensors)
         self.writeNewSettingsToFile(self.settings)
-        self.sensors.add_sensors(self.settings)
-        self.mynotify.setupSendStateMQTT()
 
     def delSensor(self, sensorUUID):
         """ Delete a sensor """
-        self.sensors.del_sensor(sensorUUID)
-        del self.settings['sensors'][sensorUUID]
+        newSensors = dict(self.settings['sensors'])
+        del newSensors[sensorUUID]
+        self.applySensorsSettings(newSensors)
         self.writeNewSettingsToFile(self.settings)
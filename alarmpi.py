@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 
-import json
 import os
 import sys
+import threading
+import time
+import uuid
+import zlib
 
 from flask import Flask, send_from_directory, request, Response, redirect
+from flask import stream_with_context
 from flask_socketio import SocketIO, join_room
 import flask_login
 from distutils.util import strtobool
@@ -12,6 +16,26 @@ from copy import deepcopy
 import logging
 
 from Worker import Worker
+from runtime import getRuntime
+import satellite
+from colors import bcolors
+import memory
+import messagequeue
+import serializer
+
+# Longest time in seconds that a request waits for a new state version
+MAX_WAIT = 60
+
+# Socket.IO events that the front-end processes handle themselves
+LOCAL_EVENTS = ('join',)
+
+# Seconds that a front-end process waits for the reply of the main process
+QUERY_TIMEOUT = 5
+
+# Routes that a front-end process serves, the rest need the Workers
+FRONTEND_ENDPOINTS = ('login', 'logout', 'index', 'main', 'icon', 'mycss',
+                      'mycssMobile', 'myjs', 'jqueryfile', 'socketiofile',
+                      'play_alert', 'bootstrap', 'static')
 
 
 class User(flask_login.UserMixin):
@@ -30,14 +54,16 @@ class AlarmPiServer(object):
         self.webDirectory = os.path.join(self.wd, 'web')
         self.sipcallfile = os.path.join(
             os.path.join(self.wd, "voip"), "sipcall")
+        self.frontend = False
 
     def setServerConfig(self, jsonfile):
         """ Set the server file to use and initialize the users """
 
         self.serverfile = os.path.join(self.wd, jsonfile)
         with open(self.serverfile) as data_file:
-            self.serverJson = json.load(data_file)
+            self.serverJson = serializer.loads(data_file.read())
         self.users = deepcopy(self.serverJson['users'])
+        memory.applyProfile(self.serverJson.get('memory'))
 
     def create_app(self):
         """ Define the RESTfull Services and call the
@@ -48,7 +74,26 @@ class AlarmPiServer(object):
         self.app.secret_key = 'super secret string'
         self.login_manager = flask_login.LoginManager()
         self.login_manager.init_app(self.app)
-        self.socketio = SocketIO(self.app)
+        messageQueue = self.serverJson['ui'].get('message_queue')
+        socketioOptions = messagequeue.socketioOptions(messageQueue)
+        socketioOptions['json'] = serializer
+        if self.serverJson['ui'].get('socketio_serializer') == 'msgpack':
+            # Binary packets, for clients with the msgpack parser
+            socketioOptions['serializer'] = 'msgpack'
+        self.socketio = SocketIO(self.app, **socketioOptions)
+        self.socketHandlers = {}
+        self.commandBus = None
+        self.replyBus = None
+        self.pendingReplies = {}
+        self.commandSecret = self.serverJson['ui'].get('message_queue_secret')
+        # The ids of the received messages, a message can't be sent again
+        self.seenCommands = messagequeue.SeenMessages()
+        self.seenReplies = messagequeue.SeenMessages()
+        if messageQueue:
+            self.commandBus = messagequeue.createBus(
+                messageQueue, 'alarmpi-commands')
+            self.replyBus = messagequeue.createBus(
+                messageQueue, 'alarmpi-replies')
 
         @self.login_manager.user_loader
         def user_loader(email):
@@ -90,6 +135,17 @@ class AlarmPiServer(object):
             flask_login.logout_user()
             return redirect('/login')
 
+        @self.app.before_request
+        def frontendRoutes():
+            # A front-end process has no Workers, the other routes are
+            # served by the main process
+            if (self.frontend and request.endpoint is not None and
+                    request.endpoint not in FRONTEND_ENDPOINTS):
+                return Response(
+                    serializer.dumps({'error': 'Served by the process of '
+                                      'the Workers'}),
+                    status=503, mimetype='application/json')
+
         @self.login_manager.unauthorized_handler
         def unauthorized_handler():
             return redirect('/login')
@@ -164,64 +220,210 @@ class AlarmPiServer(object):
         def play_alert():
             return send_from_directory(self.webDirectory, 'play_alert.mp3')
 
+        def snapshotResponse(sensorClass, name, build):
+            """ Answers with the cached payload of the current state
+                version. The ETag is the version, so an unchanged state is
+                answered with 304. With wait=N the request waits (up to
+                timeout seconds) until the version is newer than N. """
+
+            wait = request.args.get('wait')
+            if wait is not None and wait.isdigit():
+                try:
+                    timeout = float(request.args.get('timeout', 30))
+                except ValueError:
+                    timeout = 30
+                sensorClass.waitStateVersion(
+                    int(wait), max(0, min(timeout, MAX_WAIT)))
+            return sendSnapshot(sensorClass.getSnapshot(name, build))
+
+        def sendSnapshot(snapshot):
+            """ Answers with a snapshot, gzipped if the client accepts it """
+
+            headers = {
+                'X-State-Version': str(snapshot['version']),
+                'Cache-Control': 'no-cache',
+                'Vary': 'Accept-Encoding'
+            }
+            body = snapshot['body']
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                if snapshot.get('gzip') is None:
+                    snapshot['gzip'] = b''.join(gzipChunks([body]))
+                body = snapshot['gzip']
+                headers['Content-Encoding'] = 'gzip'
+            response = Response(body, mimetype='application/json',
+                                headers=headers)
+            response.set_etag(snapshot['etag'])
+            return response.make_conditional(request)
+
         @self.app.route('/getSensors.json')
         @flask_login.login_required
         def getSensors():
             user = flask_login.current_user.id
             sensorClass = self.users[user]['obj']
-            return json.dumps(sensorClass.getSensorsArmed())
+            return snapshotResponse(
+                sensorClass, 'sensors', sensorClass.getSensorsArmed)
 
         @self.app.route('/getAlarmStatus.json')
         @flask_login.login_required
         def getAlarmStatus():
             user = flask_login.current_user.id
             sensorClass = self.users[user]['obj']
-            return json.dumps(sensorClass.getTriggeredStatus())
+            return snapshotResponse(
+                sensorClass, 'alarmStatus', sensorClass.getTriggeredStatus)
 
         @self.app.route('/getSensorsLog.json', methods=['Get', 'POST'])
         @flask_login.login_required
         def getSensorsLog():
             user = flask_login.current_user.id
             sensorClass = self.users[user]['obj']
-            if request.args.get('saveLimit') == 'True':
-                sensorClass.setLogFilters(
-                    request.args.get('limit'),
-                    request.args.get('type'))
             returnedLogs = sensorClass.getSensorsLog(
                 limit=request.args.get('limit'),
                 fromText=request.args.get('fromText'),
                 selectTypes=request.args.get('type'),
                 filterText=request.args.get('filterText'),
                 getFormat=request.args.get('format'),
-                combineSensors=request.args.get('combineSensors')
+                combineSensors=request.args.get('combineSensors'),
+                since=request.args.get('since'),
+                before=request.args.get('before'),
+                fromTime=request.args.get('from'),
+                toTime=request.args.get('to')
             )
-            return json.dumps(returnedLogs)
+            return serializer.dumps(returnedLogs)
+
+        @self.app.route('/exportSensorsLog')
+        @flask_login.login_required
+        def exportSensorsLog():
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            getFormat = request.args.get('format', 'ndjson')
+            chunks = sensorClass.logs.exportSensorsLog(
+                getFormat=getFormat,
+                selectTypes=request.args.get('type'),
+                filterText=request.args.get('filterText'),
+                combineSensors=request.args.get('combineSensors'),
+                fromTime=request.args.get('from'),
+                toTime=request.args.get('to'))
+            headers = {}
+            if request.args.get('gzip') == 'True':
+                chunks = gzipChunks(chunks)
+                headers['Content-Encoding'] = 'gzip'
+            mimetype = 'text/csv' if getFormat == 'csv' else \
+                'application/x-ndjson'
+            return Response(stream_with_context(chunks),
+                            mimetype=mimetype, headers=headers)
+
+        def gzipChunks(chunks):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            for chunk in chunks:
+                compressed = compressor.compress(chunk.encode('utf-8'))
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+
+        @self.app.route('/getSensorEpisodes.json')
+        @flask_login.login_required
+        def getSensorEpisodes():
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            return serializer.dumps(sensorClass.getEpisodes(
+                sensorUUID=request.args.get('sensor'),
+                onlyOpen=request.args.get('open'),
+                limit=request.args.get('limit')
+            ))
+
+        @self.app.route('/sensors/<sensorUUID>/history')
+        @flask_login.login_required
+        def getSensorHistory(sensorUUID):
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            history = sensorClass.getSensorHistory(
+                sensorUUID, limit=request.args.get('limit'))
+            if history is None:
+                return Response(
+                    serializer.dumps({'error': 'Unknown sensor'}),
+                    status=404, mimetype='application/json')
+            return serializer.dumps(history)
+
+        @self.app.route('/getSensorsStats.json')
+        @flask_login.login_required
+        def getSensorsStats():
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            return serializer.dumps(sensorClass.getSensorsStats(
+                fromTime=request.args.get('from'),
+                toTime=request.args.get('to')
+            ))
+
+        @self.app.route('/exportSettings.json')
+        @flask_login.login_required
+        def exportSettings():
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            return Response(
+                serializer.dumpsPretty(sensorClass.settings),
+                mimetype='application/json',
+                headers={'Content-Disposition':
+                         'attachment; filename=settings.json'})
+
+        @self.app.route('/getRuntimeStats.json')
+        @flask_login.login_required
+        def getRuntimeStats():
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            return serializer.dumps(sensorClass.getRuntimeStats())
+
+        @self.app.route('/getLatency.json')
+        @flask_login.login_required
+        def getLatency():
+            """ The latency histograms of the stages of the alarm and the
+                latest traces of the sensors of the user, optionally of
+                one sensor """
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            return serializer.dumps(sensorClass.getLatency(
+                limit=request.args.get('traces'),
+                sensor=request.args.get('sensor')))
+
+        @self.app.route('/getSatellites.json')
+        @flask_login.login_required
+        def getSatellites():
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            return serializer.dumps(sensorClass.getSatellites())
 
         @self.app.route('/getSereneSettings.json')
         @flask_login.login_required
         def getSereneSettings():
             user = flask_login.current_user.id
             sensorClass = self.users[user]['obj']
-            return json.dumps(sensorClass.getSereneSettings())
+            return snapshotResponse(
+                sensorClass, 'sereneSettings', sensorClass.getSereneSettings)
 
         @self.app.route('/getAllSettings.json')
         @flask_login.login_required
         def getAllSettings():
             user = flask_login.current_user.id
             sensorClass = self.users[user]['obj']
-            uisettings = {
-                'username': user,
-                'password': self.serverJson['users'][user]['pw'],
-                'timezone': sensorClass.getTimezoneSettings(),
-                'https': self.serverJson['ui']['https'],
-                'port': self.serverJson['ui']['port']
-            }
-            return json.dumps({
-                "mail": sensorClass.getMailSettings(),
-                "voip": sensorClass.getVoipSettings(),
-                "ui": uisettings,
-                "mqtt": sensorClass.getMQTTSettings()
-            })
+            return snapshotResponse(sensorClass, 'allSettings',
+                                    lambda: self.getAllSettings(user))
+
+        @self.app.route('/bootstrap.json')
+        @flask_login.login_required
+        def bootstrap():
+            user = flask_login.current_user.id
+            sensorClass = self.users[user].get('obj')
+            if sensorClass is None:
+                # A front-end process gets it from the process of the
+                # Workers, without waiting for a newer version
+                snapshot = self.queryMain(user, 'bootstrap')
+                if snapshot is None:
+                    return Response(
+                        serializer.dumps({'error': 'No reply from the '
+                                          'process of the Workers'}),
+                        status=503, mimetype='application/json')
+                return sendSnapshot(snapshot)
+            return snapshotResponse(sensorClass, 'bootstrap',
+                                    lambda: self.getBootstrap(user))
 
         @self.app.route('/activateAlarmOnline')
         @flask_login.login_required
@@ -231,7 +433,7 @@ class AlarmPiServer(object):
             sensorClass.activateAlarm()
             self.socketio.emit('settingsChanged',
                                sensorClass.getSensorsArmed(), room=user)
-            return json.dumps("done")
+            return serializer.dumps("done")
 
         @self.app.route('/activateAlarmZone', methods=['GET', 'POST'])
         @flask_login.login_required
@@ -243,7 +445,7 @@ class AlarmPiServer(object):
             sensorClass.activateAlarm()
             self.socketio.emit('settingsChanged',
                                sensorClass.getSensorsArmed(), room=user)
-            return json.dumps("done")
+            return serializer.dumps("done")
 
         @self.app.route('/deactivateAlarmOnline')
         @flask_login.login_required
@@ -253,7 +455,7 @@ class AlarmPiServer(object):
             sensorClass.deactivateAlarm()
             self.socketio.emit('settingsChanged',
                                sensorClass.getSensorsArmed(), room=user)
-            return json.dumps("done")
+            return serializer.dumps("done")
 
         @self.app.route('/setSensorStateOnline', methods=['GET', 'POST'])
         @flask_login.login_required
@@ -269,9 +471,9 @@ class AlarmPiServer(object):
             sensorClass.setSensorState(message['sensor'], message['enabled'])
             self.socketio.emit('settingsChanged',
                                sensorClass.getSensorsArmed(), room=user)
-            return json.dumps("done")
+            return serializer.dumps("done")
 
-        @self.socketio.on('setSensorState')
+        @self.socketEvent('setSensorState')
         @flask_login.login_required
         def setSensorState(message):
             user = flask_login.current_user.id
@@ -280,7 +482,7 @@ class AlarmPiServer(object):
             self.socketio.emit('settingsChanged',
                                sensorClass.getSensorsArmed(), room=user)
 
-        @self.socketio.on('activateAlarm')
+        @self.socketEvent('activateAlarm')
         @flask_login.login_required
         def activateAlarm():
             user = flask_login.current_user.id
@@ -289,7 +491,7 @@ class AlarmPiServer(object):
             self.socketio.emit('settingsChanged',
                                sensorClass.getSensorsArmed(), room=user)
 
-        @self.socketio.on('deactivateAlarm')
+        @self.socketEvent('deactivateAlarm')
         @flask_login.login_required
         def deactivateAlarm():
             user = flask_login.current_user.id
@@ -298,7 +500,7 @@ class AlarmPiServer(object):
             self.socketio.emit('settingsChanged',
                                sensorClass.getSensorsArmed(), room=user)
 
-        # @self.socketio.on('addSensor')
+        # @self.socketEvent('addSensor')
         # @flask_login.login_required
         # def addSensor(message):
         #     user = flask_login.current_user.id
@@ -314,9 +516,9 @@ class AlarmPiServer(object):
             sensorClass = self.users[user]['obj']
             sensorClass.addSensor(message)
             self.socketio.emit('sensorsChanged', room=user)
-            return json.dumps("done")
+            return serializer.dumps("done")
 
-        @self.socketio.on('delSensor')
+        @self.socketEvent('delSensor')
         @flask_login.login_required
         def delSensor(message):
             user = flask_login.current_user.id
@@ -324,81 +526,400 @@ class AlarmPiServer(object):
             sensorClass.delSensor(str(message['sensor']))
             self.socketio.emit('sensorsChanged', room=user)
 
-        @self.socketio.on('setSereneSettings')
+        @self.socketEvent('setSettings')
         @flask_login.login_required
-        def setSereneSettings(message):
+        def setSettings(message):
+            # All the sections of the settings dialog are saved at once,
+            # the reply has the changed sections or the error
             user = flask_login.current_user.id
             sensorClass = self.users[user]['obj']
-            sensorClass.setSereneSettings(message)
-            self.socketio.emit('settingsChanged',
-                               sensorClass.getSensorsArmed(), room=user)
+            changes = dict((section, values) for section, values
+                           in message.items() if section != 'ui')
+            ui = message.get('ui')
+            try:
+                if ui is not None:
+                    self.validateUISettings(ui)
+                    changes['timezone'] = ui['timezone']
+                changed = sensorClass.updateSettings(changes)
+            except ValueError as e:
+                print("{0}Settings: {2}{1}".format(
+                    bcolors.FAIL, bcolors.ENDC, str(e)))
+                return {'error': str(e)}
+            if ui is not None and self.setUISettings(user, ui):
+                changed.append('ui')
+            if changed:
+                self.socketio.emit('settingsChanged',
+                                   sensorClass.getSensorsArmed(), room=user)
+            return {'changed': changed}
+
+        @self.socketEvent('setSereneSettings')
+        @flask_login.login_required
+        def setSereneSettings(message):
+            user = flask_login.current_user.id
+            return self.updateSettingsSection(
+                user, self.users[user]['obj'].setSereneSettings, message)
 
-        @self.socketio.on('setMailSettings')
+        @self.socketEvent('setMailSettings')
         @flask_login.login_required
         def setMailSettings(message):
             user = flask_login.current_user.id
-            sensorClass = self.users[user]['obj']
-            sensorClass.setMailSettings(message)
-            self.socketio.emit('settingsChanged',
-                               sensorClass.getSensorsArmed(), room=user)
+            return self.updateSettingsSection(
+                user, self.users[user]['obj'].setMailSettings, message)
 
-        @self.socketio.on('setVoipSettings')
+        @self.socketEvent('setVoipSettings')
         @flask_login.login_required
         def setVoipSettings(message):
             user = flask_login.current_user.id
-            sensorClass = self.users[user]['obj']
-            sensorClass.setVoipSettings(message)
-            self.socketio.emit('settingsChanged',
-                               sensorClass.getSensorsArmed(), room=user)
+            return self.updateSettingsSection(
+                user, self.users[user]['obj'].setVoipSettings, message)
 
-        @self.socketio.on('setUISettings')
+        @self.socketEvent('setUISettings')
         @flask_login.login_required
         def setUISettings(message):
             user = flask_login.current_user.id
             sensorClass = self.users[user]['obj']
-            sensorClass.setTimezoneSettings(message['timezone'])
-            self.serverJson['users'][user]['pw'] = message['password']
-            self.serverJson['ui']['port'] = message['port']
-            self.serverJson['ui']['https'] = message['https']
-            with open(self.serverfile, 'w') as outfile:
-                json.dump(self.serverJson, outfile, sort_keys=True,
-                          indent=4, separators=(',', ': '))
-            print("You might want to restart...")
-            self.socketio.emit('settingsChanged',
-                               sensorClass.getSensorsArmed(), room=user)
 
-        @self.socketio.on('setMQTTSettings')
+            def setter(message):
+                self.validateUISettings(message)
+                changed = sensorClass.setTimezoneSettings(
+                    message.get('timezone'))
+                if self.setUISettings(user, message):
+                    changed.append('ui')
+                return changed
+            return self.updateSettingsSection(user, setter, message)
+
+        @self.socketEvent('setMQTTSettings')
         @flask_login.login_required
         def setMQTTSettings(message):
             user = flask_login.current_user.id
-            sensorClass = self.users[user]['obj']
-            sensorClass.setMQTTSettings(message)
-            self.socketio.emit('settingsChanged',
-                               sensorClass.getSensorsArmed(), room=user)
+            return self.updateSettingsSection(
+                user, self.users[user]['obj'].setMQTTSettings, message)
 
-        @self.socketio.on('join')
+        @self.socketEvent('join')
         @flask_login.login_required
         def on_join(data):
             # print('joining room:', flask_login.current_user.id)
-            join_room(flask_login.current_user.id)
+            user = flask_login.current_user.id
+            join_room(user)
+            # The reply has the bootstrap snapshot, a front-end process
+            # gets it from the process of the Workers
+            if self.users[user].get('obj') is not None:
+                snapshot = self.getBootstrapSnapshot(user)
+            else:
+                snapshot = self.queryMain(user, 'bootstrap')
+            if snapshot is not None:
+                return snapshot['version'], snapshot['body']
+
+        @self.socketEvent('subscribeLogs')
+        @flask_login.login_required
+        def subscribeLogs(message):
+            user = flask_login.current_user.id
+            sensorClass = self.users[user]['obj']
+            returnedLogs = sensorClass.subscribeLog(
+                request.sid,
+                limit=message.get('limit'),
+                logtypes=message.get('type'),
+                filterText=message.get('filterText'),
+                getFormat=message.get('format'),
+                combineSensors=message.get('combineSensors'))
+            self.socketio.emit('sensorsLog', returnedLogs, room=request.sid)
+
+        @self.socketEvent('disconnect')
+        def on_disconnect():
+            for user, properties in self.users.items():
+                if 'obj' in properties:
+                    properties['obj'].unsubscribeLog(request.sid)
 
         return self.app
 
-    def startMyApp(self):
-        """ Call the Worker class for each user """
+    def getBootstrapSnapshot(self, user):
+        """ Returns the version, the etag and the json of the bootstrap
+            snapshot of a user """
+
+        sensorClass = self.users[user]['obj']
+        snapshot = sensorClass.getSnapshot(
+            'bootstrap', lambda: self.getBootstrap(user))
+        return dict((key, snapshot[key]) for key in
+                    ('version', 'etag', 'body'))
+
+    def getAllSettings(self, user):
+        """ Returns the settings of the settings dialog of the UI """
+
+        sensorClass = self.users[user]['obj']
+        uisettings = {
+            'username': user,
+            'password': self.serverJson['users'][user]['pw'],
+            'timezone': sensorClass.getTimezoneSettings(),
+            'https': self.serverJson['ui']['https'],
+            'port': self.serverJson['ui']['port']
+        }
+        return {
+            "mail": sensorClass.getMailSettings(),
+            "voip": sensorClass.getVoipSettings(),
+            "ui": uisettings,
+            "mqtt": sensorClass.getMQTTSettings()
+        }
+
+    def updateSettingsSection(self, user, setter, message):
+        """ Changes a section of the settings for the events of the old
+            settings dialog, which saved each section on its own. The reply
+            is like the one of setSettings, the changed sections or the
+            error if a value is wrong. """
+
+        sensorClass = self.users[user]['obj']
+        try:
+            changed = setter(message)
+        except ValueError as e:
+            print("{0}Settings: {2}{1}".format(
+                bcolors.FAIL, bcolors.ENDC, str(e)))
+            return {'error': str(e)}
+        self.socketio.emit('settingsChanged',
+                           sensorClass.getSensorsArmed(), room=user)
+        return {'changed': changed}
+
+    def validateUISettings(self, message):
+        """ Checks the UI settings of the settings dialog. Raises
+            ValueError for the first wrong value. """
+
+        if type(message) != dict:
+            raise ValueError("Wrong settings: ui")
+        if type(message.get('password')) not in (str, type(u'')):
+            raise ValueError("Wrong password")
+        port = message.get('port')
+        if type(port) != int or not 0 < port < 65536:
+            raise ValueError("Wrong port of the UI: {0}".format(port))
+        if type(message.get('https')) != bool:
+            raise ValueError("Wrong https: {0}".format(message.get('https')))
+
+    def setUISettings(self, user, message):
+        """ Writes the password of the user, the port and https to
+            server.json if they have changed. Returns True if they have. """
+
+        ui = {'port': message['port'], 'https': message['https']}
+        if (self.serverJson['users'][user]['pw'] == message['password'] and
+                all(self.serverJson['ui'][key] == value
+                    for key, value in ui.items())):
+            return False
+        self.serverJson['users'][user]['pw'] = message['password']
+        self.serverJson['ui'].update(ui)
+        with open(self.serverfile, 'w') as outfile:
+            outfile.write(serializer.dumpsPretty(self.serverJson))
+        for properties in self.users.values():
+            if 'obj' in properties:
+                properties['obj'].stateChanged()
+        print("You might want to restart...")
+        return True
+
+    def getBootstrap(self, user):
+        """ Returns everything that the UI needs when it is loaded: the
+            sensors and the alarm status and the serene. It is cached for
+            each state version like the other snapshots. The settings of
+            the dialog have passwords, so they are loaded only when it is
+            opened. """
+
+        sensorClass = self.users[user]['obj']
+        return {
+            "status": sensorClass.getSensorsArmed(),
+            "serene": sensorClass.getSereneSettings()
+        }
+
+    def socketEvent(self, event):
+        """ Registers the handler of a Socket.IO event. The front-end
+            processes send the event to the process of the Workers. """
+
+        def decorator(handler):
+            self.socketHandlers[event] = handler
+            if self.frontend and event not in LOCAL_EVENTS:
+                self.socketio.on(event)(self._relayEvent(event))
+            else:
+                self.socketio.on(event)(handler)
+            return handler
+        return decorator
+
+    def _relayEvent(self, event):
+        """ Returns a handler that publishes the event to the
+            alarmpi-commands channel """
+
+        def relay(*args):
+            user = None
+            if flask_login.current_user.is_authenticated:
+                user = flask_login.current_user.id
+            if event == 'disconnect':
+                # The handler doesn't take the reason of the disconnect
+                args = []
+            self.commandBus.publish(messagequeue.signMessage(
+                self.commandSecret, {
+                    'event': event,
+                    'args': list(args),
+                    'user': user,
+                    'sid': request.sid
+                }))
+        return relay
+
+    def runCommands(self):
+        """ Runs the Socket.IO events of the front-end processes as if
+            their clients were connected to this process """
+
+        for message in self.commandBus.listen():
+            # The user of a command is logged in, so only the front-end
+            # processes that have the secret can send them
+            command = messagequeue.verifyMessage(
+                self.commandSecret, message, self.seenCommands)
+            if command is None:
+                print("{0}Dropped a command that is not signed with "
+                      "ui.message_queue_secret, is too old or was already "
+                      "run{1}".format(bcolors.FAIL, bcolors.ENDC))
+                continue
+            if 'query' in command:
+                self.answerQuery(command)
+                continue
+            handler = self.socketHandlers.get(command.get('event'))
+            if handler is None:
+                continue
+            with self.app.test_request_context('/'):
+                request.sid = command['sid']
+                request.namespace = '/'
+                if command['user'] in self.users:
+                    user = User()
+                    user.id = command['user']
+                    flask_login.login_user(user)
+                try:
+                    handler(*command['args'])
+                except Exception as e:
+                    print("{0}Command {2}: {3}{1}".format(
+                        bcolors.FAIL, bcolors.ENDC, command['event'], str(e)))
+
+    def answerQuery(self, command):
+        """ Sends to the front-end processes the reply of a query, e.g. the
+            bootstrap snapshot of a user """
+
+        queries = {'bootstrap': self.getBootstrapSnapshot}
+        user = command.get('user')
+        if (command['query'] not in queries or user not in self.users or
+                'obj' not in self.users[user]):
+            return
+        try:
+            result = queries[command['query']](user)
+        except Exception as e:
+            print("{0}Query {2}: {3}{1}".format(
+                bcolors.FAIL, bcolors.ENDC, command['query'], str(e)))
+            return
+        self.replyBus.publish(messagequeue.signMessage(
+            self.commandSecret, {'reply': command['reply'], 'result': result}))
+
+    def queryMain(self, user, query):
+        """ Asks the process of the Workers for the reply of a query. Returns
+            None if there is no reply in QUERY_TIMEOUT seconds. """
+
+        replyId = uuid.uuid4().hex
+        pending = {'event': threading.Event(), 'result': None}
+        self.pendingReplies[replyId] = pending
+        try:
+            self.commandBus.publish(messagequeue.signMessage(
+                self.commandSecret,
+                {'query': query, 'user': user, 'reply': replyId}))
+            pending['event'].wait(QUERY_TIMEOUT)
+            return pending['result']
+        finally:
+            del self.pendingReplies[replyId]
+
+    def runReplies(self):
+        """ Hands the replies of the main process to the waiting queries """
+
+        for message in self.replyBus.listen():
+            reply = messagequeue.verifyMessage(
+                self.commandSecret, message, self.seenReplies)
+            if reply is None:
+                continue
+            pending = self.pendingReplies.get(reply.get('reply'))
+            if pending is not None:
+                pending['result'] = reply.get('result')
+                pending['event'].set()
+
+    def stopWorkers(self):
+        """ Closes the Worker of each user when the server stops """
+
+        for user in self.users:
+            if 'obj' in self.users[user]:
+                self.users[user]['obj'].close()
+
+    def startMyApp(self, parallel=True):
+        """ Call the Worker class for each user. With parallel the Workers
+            of all the users are initialized at the same time.
+            A front-end process has no Workers, it sends the events of
+            its clients to the process of the Workers. """
+
+        if self.commandBus is not None and not self.commandSecret:
+            raise RuntimeError(
+                "ui.message_queue needs ui.message_queue_secret")
+        if self.frontend:
+            if self.commandBus is None:
+                raise RuntimeError(
+                    "The front-end processes need ui.message_queue")
+            print("{0}Front-end process, the Workers run in the process "
+                  "without --frontend{1}".format(bcolors.FADE, bcolors.ENDC))
+            threadReplies = threading.Thread(target=self.runReplies)
+            threadReplies.daemon = True
+            threadReplies.start()
+            return
+        startTime = time.time()
+        threads = []
+        for user in self.users:
+            if parallel:
+                thread = threading.Thread(target=self.startWorker, args=[user])
+                thread.start()
+                threads.append(thread)
+            else:
+                self.startWorker(user)
+        for thread in threads:
+            thread.join()
 
-        mysocket = self.socketio
         for user, properties in self.users.items():
-            jsonfile = os.path.join(self.wd, properties['settings'])
-            logfile = os.path.join(self.wd, properties['logfile'])
-            optsUpdateUI = {'obj': mysocket.emit, 'room': user}
-            self.users[user]['obj'] = Worker(
-                jsonfile,
-                logfile,
-                self.sipcallfile,
-                optsUpdateUI
-            )
-
+            if 'obj' not in properties:
+                raise RuntimeError("Failed to start the alarm of " + user)
+            print("{0}Startup of {2}: {3}{1}".format(
+                bcolors.FADE, bcolors.ENDC, user, ", ".join(
+                    "{0} {1:.3f}s".format(phase, seconds)
+                    for phase, seconds in properties['obj'].startupTimes.items())))
+        print("{0}Startup finished in {2:.3f}s{1}".format(
+            bcolors.FADE, bcolors.ENDC, time.time() - startTime))
+
+        satelliteConfig = self.serverJson.get('satellite')
+        if satelliteConfig:
+            try:
+                satellite.getSatelliteServer().start(
+                    host=satelliteConfig.get('host', '0.0.0.0'),
+                    port=satelliteConfig.get('port', satellite.DEFAULT_PORT),
+                    password=satelliteConfig.get('password', ''))
+            except ValueError as e:
+                print("{0}Satellite: {2}, set satellite.password in "
+                      "server.json{1}".format(bcolors.FAIL, bcolors.ENDC,
+                                              str(e)))
+
+        if self.commandBus is not None:
+            threadCommands = threading.Thread(target=self.runCommands)
+            threadCommands.daemon = True
+            threadCommands.start()
+
+    def startWorker(self, user):
+        """ Initialize the Worker class of a user """
+
+        properties = self.users[user]
+        if 'obj' in properties:
+            properties['obj'].close()
+        jsonfile = os.path.join(self.wd, properties['settings'])
+        logfile = os.path.join(self.wd, properties['logfile'])
+        optsUpdateUI = {'obj': self.socketio.emit, 'room': user}
+        tracefile = None
+        if properties.get('trace'):
+            tracefile = os.path.join(self.wd, properties['trace'])
+        self.users[user]['obj'] = Worker(
+            jsonfile,
+            logfile,
+            self.sipcallfile,
+            optsUpdateUI,
+            tracefile
+        )
 
     def startServer(self):
         """ Start the Flask App """
@@ -429,6 +950,14 @@ if __name__ == '__main__':
                 f.write(str(os.getpid()))
     myserver = AlarmPiServer()
     myserver.setServerConfig('server.json')
+    if '--frontend' in sys.argv:
+        # Extra UI process, e.g. python alarmpi.py --frontend 5001
+        myserver.frontend = True
+        index = sys.argv.index('--frontend')
+        if len(sys.argv) > index + 1:
+            myserver.serverJson['ui']['port'] = int(sys.argv[index + 1])
     myserver.create_app()
     myserver.startMyApp()
     myserver.startServer()
+    myserver.stopWorkers()
+    getRuntime().shutdown()
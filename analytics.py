@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+
+import glob
+import gzip
+import itertools
+import os
+import re
+import threading
+
+from memory import LRUCache
+
+np = None
+
+
+def importNumpy():
+    """ Imports numpy on the first request, so that it doesn't slow down
+        the startup. Returns False if it is not installed. """
+
+    global np
+    if np is None:
+        try:
+            import numpy
+            np = numpy
+        except Exception:
+            return False
+    return True
+
+
+KIND_OTHER = 0
+KIND_START = 1
+KIND_STOP = 2
+KIND_ALARM = 3
+
+
+class LogAnalytics():
+    """ Loads the log file and its rotated archives (alert.log.1,
+    alert.log.2.gz, ...) into columns of numpy arrays (epoch time, kind of
+    event and interned sensor id) and calculates the sensor statistics on
+    them. The columns of each file are cached, so only the new lines of
+    the log file are parsed on each request.
+    """
+
+    def __init__(self, logfile):
+        self.logfile = logfile
+        self.lock = threading.Lock()
+        self.sensorIds = {}
+        self.sensorNames = []
+        # The columns of each file, at most cache_entries files
+        self.columns = LRUCache()
+
+    def _getArchives(self):
+        """ Returns the rotated log files from the oldest to the newest """
+
+        def archiveNumber(path):
+            match = re.match(r'.*\.(\d+)(\.gz)?$', path)
+            return int(match.group(1)) if match else 0
+
+        archives = [path for path in glob.glob(self.logfile + '.*')
+                    if archiveNumber(path) > 0]
+        return sorted(archives, key=archiveNumber, reverse=True)
+
+    def _internSensor(self, uuid, name):
+        """ Returns the integer id of a sensor uuid """
+
+        sensorId = self.sensorIds.get(uuid)
+        if sensorId is None:
+            sensorId = len(self.sensorNames)
+            self.sensorIds[uuid] = sensorId
+            self.sensorNames.append(name)
+        else:
+            self.sensorNames[sensorId] = name
+        return sensorId
+
+    def _parseLines(self, lines):
+        """ Converts the log lines to the time, kind and sensor columns """
+
+        times = []
+        kinds = []
+        sensors = []
+        for line in lines:
+            if not isinstance(line, str):
+                line = line.decode('utf-8', 'replace')
+            typeEnd = line.find(') [')
+            if not line.startswith('(') or typeEnd < 0:
+                continue
+            logType = line[1:typeEnd].split(',')
+            kind = KIND_OTHER
+            sensorId = -1
+            category = logType[0].lower()
+            if 'sensor' in category and len(logType) > 2:
+                if logType[1] == 'start':
+                    kind = KIND_START
+                elif logType[1] == 'stop':
+                    kind = KIND_STOP
+                sensorId = self._internSensor(
+                    logType[2], line[typeEnd + 24:].rstrip('\n'))
+            elif category == 'alarm' and 'Intruder Alert' in line:
+                kind = KIND_ALARM
+            times.append(line[typeEnd + 3:typeEnd + 22])
+            kinds.append(kind)
+            sensors.append(sensorId)
+        times = self._parseTimes(times)
+        # The lines with a malformed time are skipped
+        valid = ~np.isnat(times)
+        return {
+            'time': times[valid].astype(np.int64),
+            'kind': np.array(kinds, dtype=np.int8)[valid],
+            'sensor': np.array(sensors, dtype=np.int32)[valid]
+        }
+
+    def _parseTimes(self, times):
+        """ Converts the times of the log lines to a datetime64 array, with
+            NaT for the ones that can't be parsed. All of them are converted
+            at once and only a chunk with a malformed time is converted one
+            by one. """
+
+        try:
+            return np.array(times, dtype='datetime64[s]')
+        except ValueError:
+            pass
+
+        def parseTime(logTime):
+            try:
+                return np.datetime64(logTime, 's')
+            except ValueError:
+                return np.datetime64('NaT', 's')
+        return np.array([parseTime(logTime) for logTime in times],
+                        dtype='datetime64[s]')
+
+    def _parseFile(self, f, chunkLines=10000):
+        """ Parses the lines of a file in chunks, so that only the columns
+            are kept in memory and not the text of the file. Returns the
+            columns and the size of the lines that were parsed. """
+
+        chunks = []
+        size = 0
+        while True:
+            lines = list(itertools.islice(f, chunkLines))
+            complete = [line for line in lines if line.endswith(b'\n')]
+            if complete:
+                chunks.append(self._parseLines(complete))
+                size += sum(len(line) for line in complete)
+            if len(complete) < chunkLines:
+                # The end of the file, the last line may still be written
+                break
+        if not chunks:
+            return self._parseLines([]), size
+        return self._concatenate(chunks), size
+
+    def _concatenate(self, allColumns):
+        return dict((name, np.concatenate([columns[name]
+                                           for columns in allColumns]))
+                    for name in allColumns[0])
+
+    def _appendColumns(self, columns, newColumns):
+        return dict((name, np.concatenate((columns[name], newColumns[name])))
+                    for name in columns)
+
+    def _loadFile(self, path):
+        """ Returns the columns of a log file. The archives are parsed only
+            once and the log file is parsed from where it was left. """
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.columns.pop(path, None)
+            return None
+        cached = self.columns.get(path)
+
+        if path.endswith('.gz'):
+            if cached is not None and cached['mtime'] == stat.st_mtime:
+                return cached['columns']
+            with gzip.open(path, 'rb') as f:
+                columns, size = self._parseFile(f)
+            self.columns[path] = {'mtime': stat.st_mtime, 'columns': columns}
+            return columns
+
+        with open(path, 'rb') as f:
+            head = f.read(64)
+            if cached is not None and (cached['head'] != head or
+                                       cached['size'] > stat.st_size):
+                # The file has been trimmed or replaced
+                cached = None
+            offset = 0 if cached is None else cached['size']
+            f.seek(offset)
+            newColumns, size = self._parseFile(f)
+        if cached is None:
+            columns = newColumns
+        else:
+            columns = self._appendColumns(cached['columns'], newColumns)
+        self.columns[path] = {
+            'head': head,
+            'size': offset + size,
+            'columns': columns
+        }
+        return columns
+
+    def _loadColumns(self):
+        """ Returns the columns of all the log files in time order """
+
+        allColumns = []
+        for path in self._getArchives() + [self.logfile]:
+            columns = self._loadFile(path)
+            if columns is not None:
+                allColumns.append(columns)
+        if not allColumns:
+            return self._parseLines([])
+        return self._concatenate(allColumns)
+
+    def getStats(self, fromTime=None, toTime=None, sensorNames=None):
+        """ Returns for each sensor the activations, the total and mean
+            open time, the activations for each hour of the week and the
+            number of intruder alerts for each month.
+            fromTime and toTime are in the format of the log file.
+        """
+
+        if not importNumpy():
+            return {"error": "numpy is not installed"}
+        with self.lock:
+            columns = self._loadColumns()
+            names = list(self.sensorNames)
+            uuids = sorted(self.sensorIds, key=self.sensorIds.get)
+        times = columns['time']
+        kinds = columns['kind']
+        sensors = columns['sensor']
+
+        mask = np.ones(len(times), dtype=bool)
+        try:
+            if fromTime not in (None, ''):
+                mask &= times >= np.datetime64(fromTime, 's').astype(np.int64)
+            if toTime not in (None, ''):
+                mask &= times <= np.datetime64(toTime, 's').astype(np.int64)
+        except ValueError as e:
+            return {"error": str(e)}
+        times, kinds, sensors = times[mask], kinds[mask], sensors[mask]
+
+        # Activations and open time of each sensor. A stop is paired with
+        # the previous event of the same sensor if it is a start.
+        numSensors = len(names)
+        starts = kinds == KIND_START
+        activations = np.bincount(sensors[starts], minlength=numSensors)
+        sensorEvents = np.flatnonzero((kinds == KIND_START) |
+                                      (kinds == KIND_STOP))
+        order = sensorEvents[np.argsort(sensors[sensorEvents],
+                                        kind='stable')]
+        paired = ((kinds[order[1:]] == KIND_STOP) &
+                  (kinds[order[:-1]] == KIND_START) &
+                  (sensors[order[1:]] == sensors[order[:-1]]))
+        stopIndex = order[1:][paired]
+        startIndex = order[:-1][paired]
+        durations = times[stopIndex] - times[startIndex]
+        openTime = np.bincount(sensors[stopIndex], weights=durations,
+                               minlength=numSensors)
+        closedEpisodes = np.bincount(sensors[stopIndex],
+                                     minlength=numSensors)
+
+        # Activations for each hour of the week (Monday is the first day)
+        startTimes = times[starts]
+        weekday = (startTimes // 86400 + 3) % 7
+        hour = (startTimes % 86400) // 3600
+        heatmap = np.bincount(weekday * 24 + hour, minlength=7 * 24)
+
+        # Intruder alerts for each month
+        alarmMonths = times[kinds == KIND_ALARM].astype(
+            'datetime64[s]').astype('datetime64[M]')
+        months, monthCounts = np.unique(alarmMonths, return_counts=True)
+
+        sensorsStats = {}
+        for sensorId, uuid in enumerate(uuids):
+            if activations[sensorId] == 0 and closedEpisodes[sensorId] == 0:
+                continue
+            name = names[sensorId]
+            if sensorNames is not None and uuid in sensorNames:
+                name = sensorNames[uuid]
+            meanOpenTime = None
+            if closedEpisodes[sensorId] > 0:
+                meanOpenTime = float(openTime[sensorId]) / \
+                    int(closedEpisodes[sensorId])
+            sensorsStats[uuid] = {
+                'name': name,
+                'activations': int(activations[sensorId]),
+                'openTime': int(openTime[sensorId]),
+                'meanOpenTime': meanOpenTime
+            }
+        return {
+            'events': int(len(times)),
+            'sensors': sensorsStats,
+            'heatmap': heatmap.reshape(7, 24).tolist(),
+            'alarms': dict((str(month), int(count))
+                           for month, count in zip(months, monthCounts))
+        }
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+import sys
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from itertools import islice
+
+try:
+    intern = sys.intern
+except AttributeError:
+    # Python 2 has the builtin intern
+    pass
+
+# Number of the latest episodes of each sensor that are kept by its uuid
+MAX_SENSOR_EPISODES = 1000
+
+
+class Episode(object):
+    """ The activation of a sensor. It has no __dict__, because there is
+    one for every sensor start in the log file, and it can be read like a
+    dictionary (episode['duration'], dict(episode)).
+    """
+
+    __slots__ = ('sensor', 'name', 'start', 'end', 'duration', 'cursor')
+
+    def __init__(self, sensor, name, start, cursor):
+        self.sensor = intern(sensor)
+        self.name = intern(name)
+        self.start = start
+        self.end = None
+        self.duration = None
+        self.cursor = cursor
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def keys(self):
+        return self.__slots__
+
+
+class SensorSummary(object):
+    """ Counters of the activations of a sensor that are updated with
+    each of its logs """
+
+    __slots__ = ('activations', 'day', 'today', 'lastSeen', 'openSeconds',
+                 'closed')
+
+    def __init__(self):
+        self.activations = 0
+        self.day = None
+        self.today = 0
+        self.lastSeen = None
+        self.openSeconds = 0
+        self.closed = 0
+
+
+class Episodes():
+    """ Keeps a table with one episode for each activation of a sensor.
+    An episode starts with the sensor start log and ends with the next
+    sensor stop log of the same sensor. It is updated every time a sensor
+    log is written, so the durations are not calculated on each query.
+    The episodes are stored by the cursor of their start log, and the
+    cursors of the last episodes of each sensor are kept in a ring by its
+    uuid, with the summary of its activations.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.episodes = OrderedDict()
+        self.openEpisodes = {}
+        self.sensorEpisodes = {}
+        self.summaries = {}
+
+    def addLog(self, log):
+        """ Starts or ends an episode if the log is from a sensor """
+
+        if 'sensor' not in log['type'][0].lower() or len(log['type']) < 3:
+            return
+        status, uuid = log['type'][1], log['type'][2]
+        with self.lock:
+            summary = self.summaries.get(uuid)
+            if summary is None:
+                summary = self.summaries[intern(uuid)] = SensorSummary()
+            summary.lastSeen = log['time']
+            if status == 'start':
+                self.episodes[log['cursor']] = Episode(
+                    uuid, log['event'], log['time'], log['cursor'])
+                self.openEpisodes[uuid] = log['cursor']
+                cursors = self.sensorEpisodes.get(uuid)
+                if cursors is None:
+                    cursors = self.sensorEpisodes[uuid] = deque(
+                        maxlen=MAX_SENSOR_EPISODES)
+                cursors.append(log['cursor'])
+                day = log['time'][:10]
+                if summary.day != day:
+                    summary.day = day
+                    summary.today = 0
+                summary.today += 1
+                summary.activations += 1
+            elif status == 'stop':
+                cursor = self.openEpisodes.pop(uuid, None)
+                episode = self.episodes.get(cursor)
+                if episode is not None:
+                    episode.end = log['time']
+                    episode.duration = self._getDuration(
+                        episode.start, episode.end)
+                    if episode.duration is not None:
+                        summary.openSeconds += episode.duration
+                        summary.closed += 1
+
+    def _getDuration(self, start, end):
+        """ Returns the seconds between the start and end time """
+
+        try:
+            starttime = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
+            endtime = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
+            duration = endtime - starttime
+            return duration.days * 86400 + duration.seconds
+        except Exception as e:
+            print(e)
+            return None
+
+    def get(self, cursor):
+        """ Returns the episode that started with the log of the cursor """
+
+        return self.episodes.get(cursor)
+
+    def getEnded(self, uuid):
+        """ Returns the last episode of a sensor if it has ended """
+
+        with self.lock:
+            if uuid in self.openEpisodes:
+                return None
+            cursors = self.sensorEpisodes.get(uuid)
+            if not cursors:
+                return None
+            return self.episodes.get(cursors[-1])
+
+    def getOpen(self):
+        """ Returns the episodes of the sensors that are still active """
+
+        with self.lock:
+            return [self.episodes[cursor]
+                    for cursor in self.openEpisodes.values()]
+
+    def getSensorHistory(self, uuid, limit=None):
+        """ Returns the last episodes of a sensor, the oldest first. Only
+            the last ones are read from the ring of the sensor. """
+
+        with self.lock:
+            cursors = reversed(self.sensorEpisodes.get(uuid, ()))
+            episodes = [self.episodes[cursor]
+                        for cursor in islice(cursors, limit)]
+        episodes.reverse()
+        return episodes
+
+    def getSensorSummary(self, uuid, today):
+        """ Returns the activations of a sensor on the day of today
+            (e.g. 2018-01-01), its last log and the mean seconds that it
+            stays active. The counters include the logs that have been
+            trimmed since the log file was loaded. """
+
+        with self.lock:
+            summary = self.summaries.get(uuid)
+            if summary is None:
+                summary = SensorSummary()
+            meanOpenTime = None
+            if summary.closed:
+                meanOpenTime = round(
+                    float(summary.openSeconds) / summary.closed, 1)
+            return {
+                'activations': summary.activations,
+                'activationsToday': summary.today
+                if summary.day == today else 0,
+                'lastSeen': summary.lastSeen,
+                'meanOpenTime': meanOpenTime
+            }
+
+    def getAll(self, limit=None):
+        """ Returns the last episodes of all the sensors """
+
+        with self.lock:
+            episodes = list(self.episodes.values())
+        if limit is not None:
+            episodes = episodes[-limit:]
+        return episodes
+
+    def shift(self, offset):
+        """ Removes the episodes that started before the offset and moves
+            the rest by the offset. Used when the log file is trimmed. """
+
+        with self.lock:
+            episodes = OrderedDict()
+            for cursor, episode in self.episodes.items():
+                if cursor >= offset:
+                    episode.cursor = cursor - offset
+                    episodes[cursor - offset] = episode
+            self.episodes = episodes
+            self.openEpisodes = dict(
+                (uuid, cursor - offset)
+                for uuid, cursor in self.openEpisodes.items()
+                if cursor >= offset)
+            sensorEpisodes = {}
+            for uuid, cursors in self.sensorEpisodes.items():
+                cursors = deque((cursor - offset for cursor in cursors
+                                 if cursor >= offset),
+                                maxlen=MAX_SENSOR_EPISODES)
+                if cursors:
+                    sensorEpisodes[uuid] = cursors
+            self.sensorEpisodes = sensorEpisodes
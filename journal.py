@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import threading
+import zlib
+
+from colors import bcolors
+import serializer
+
+
+class StateJournal():
+    """ Append-only journal of the state changes of the alarm (armed,
+    triggered and the alert, online and enabled status of the sensors).
+    Each change is one line with the crc32 of its json and the json of
+    [path, value], e.g. ["settings", "alarmArmed"] and true. The settings
+    file is the snapshot: when it is written the journal is emptied, and
+    on startup the changes of the journal are applied to it. A line that
+    was cut by a power loss fails its checksum and the journal is
+    truncated there.
+    """
+
+    def __init__(self, journalfile, sync=True):
+        self.journalfile = journalfile
+        self.sync = sync
+        self.lock = threading.Lock()
+        self.entries = 0
+        self.file = None
+
+    def _open(self):
+        if self.file is None:
+            self.file = open(self.journalfile, 'ab')
+
+    def append(self, changes):
+        """ Writes the changes, a list of (path, value), to the journal """
+
+        with self.lock:
+            self._open()
+            lines = []
+            for path, value in changes:
+                payload = serializer.dumps([list(path), value]).encode('utf-8')
+                checksum = zlib.crc32(payload) & 0xffffffff
+                lines.append('{0:08x} '.format(checksum).encode('ascii') +
+                             payload + b'\n')
+            self.file.write(b''.join(lines))
+            self.file.flush()
+            if self.sync:
+                getattr(os, 'fdatasync', os.fsync)(self.file.fileno())
+            self.entries += len(lines)
+
+    def replay(self, settings):
+        """ Applies the changes of the journal to the settings. Returns
+            the number of changes that were applied. """
+
+        with self.lock:
+            if not os.path.exists(self.journalfile):
+                return 0
+            applied = 0
+            validSize = 0
+            with open(self.journalfile, 'rb') as f:
+                for line in f:
+                    change = self._parseLine(line)
+                    if change is None:
+                        print("{0}Journal: ignoring the damaged end of "
+                              "{2}{1}".format(bcolors.WARNING, bcolors.ENDC,
+                                              self.journalfile))
+                        break
+                    validSize += len(line)
+                    self.entries += 1
+                    if self._apply(settings, *change):
+                        applied += 1
+            if validSize < os.path.getsize(self.journalfile):
+                with open(self.journalfile, 'ab') as f:
+                    f.truncate(validSize)
+            return applied
+
+    def _parseLine(self, line):
+        if not line.endswith(b'\n') or len(line) < 10:
+            return None
+        try:
+            checksum = int(line[:8], 16)
+        except ValueError:
+            return None
+        payload = line[9:-1]
+        if zlib.crc32(payload) & 0xffffffff != checksum:
+            return None
+        try:
+            return serializer.loads(payload)
+        except ValueError:
+            return None
+
+    def _apply(self, settings, path, value):
+        """ Sets the value of the path, if the section still exists
+            (e.g. the sensor may have been deleted) """
+
+        target = settings
+        for key in path[:-1]:
+            target = target.get(key) if isinstance(target, dict) else None
+            if target is None:
+                return False
+        target[path[-1]] = value
+        return True
+
+    def clear(self):
+        """ Empties the journal after the settings file has been written """
+
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if self.entries or os.path.exists(self.journalfile):
+                with open(self.journalfile, 'wb'):
+                    pass
+            self.entries = 0
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+""" Latency of the alarm from the event of a sensor to each notification.
+The drivers start a trace when a sensor changes state (and the notifier
+when an MQTT message arrives) and the Worker marks the stages that the
+event reaches, e.g. the siren, the MQTT state, the UI, the mail and the
+first call. The time of each stage is measured from the event and kept in
+a histogram for each stage and, with the other stages of the event, in a
+ring buffer of the latest traces.
+"""
+
+import bisect
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from memory import getProfile
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+# Upper bounds of the buckets of the histograms in milliseconds, the last
+# bucket has the slower ones
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+           30000, 60000)
+
+
+class Trace():
+    """ The stages that an event has reached, with the milliseconds from
+    the event to each stage """
+
+    __slots__ = ('traceId', 'source', 'sensor', 'time', 'startTime', 'stages')
+
+    def __init__(self, source, sensor=None):
+        self.traceId = uuid.uuid4().hex[:16]
+        self.source = source
+        self.sensor = sensor
+        self.time = time.time()
+        self.startTime = monotonic()
+        self.stages = {}
+
+    def toDict(self):
+        return {
+            'id': self.traceId,
+            'source': self.source,
+            'sensor': self.sensor,
+            'time': self.time,
+            'stages': dict(self.stages)
+        }
+
+
+class LatencyTracer():
+    """ Keeps the latest traces and the histograms of the stages, of all
+    the events and of the events of each sensor """
+
+    def __init__(self, maxTraces=1000):
+        self.lock = threading.Lock()
+        self.traces = deque(maxlen=maxTraces)
+        self.histograms = {}
+        self.sensorHistograms = {}
+        self.local = threading.local()
+
+    @contextmanager
+    def traceEvent(self, source, sensor=None):
+        """ Makes a new trace the current one of this thread while the
+            event is handled, e.g. with tracer.traceEvent('gpio', uuid): """
+
+        previous = self.current()
+        self.local.trace = Trace(source, sensor)
+        try:
+            yield self.local.trace
+        finally:
+            self.local.trace = previous
+
+    def current(self):
+        """ Returns the trace of the event that this thread handles """
+
+        return getattr(self.local, 'trace', None)
+
+    def mark(self, trace, stage):
+        """ Records the time from the event to a stage. Only the first
+            time that a trace reaches each stage is recorded. """
+
+        if trace is None:
+            return
+        elapsed = (monotonic() - trace.startTime) * 1000
+        with self.lock:
+            if stage in trace.stages:
+                return
+            if not trace.stages:
+                self.traces.append(trace)
+            trace.stages[stage] = round(elapsed, 3)
+            self._addToHistogram(self.histograms, stage, elapsed)
+            if trace.sensor is not None:
+                self._addToHistogram(self.sensorHistograms,
+                                     (trace.sensor, stage), elapsed)
+
+    def _newHistogram(self):
+        return {'buckets': [0] * (len(BUCKETS) + 1),
+                'count': 0, 'sum': 0.0, 'max': 0.0}
+
+    def _addToHistogram(self, histograms, key, elapsed):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = self._newHistogram()
+        histogram['buckets'][bisect.bisect_left(BUCKETS, elapsed)] += 1
+        histogram['count'] += 1
+        histogram['sum'] += elapsed
+        histogram['max'] = max(histogram['max'], elapsed)
+
+    def _percentile(self, histogram, percent):
+        """ Returns the upper bound of the bucket of the percentile """
+
+        rank = histogram['count'] * percent / 100.0
+        total = 0
+        for index, count in enumerate(histogram['buckets']):
+            total += count
+            if total >= rank and count:
+                if index < len(BUCKETS):
+                    return min(BUCKETS[index], histogram['max'])
+                return histogram['max']
+        return None
+
+    def getHistograms(self, sensors=None):
+        """ Returns the histogram of each stage in milliseconds. The
+            buckets are [upper bound, count], null for the last one.
+            With sensors, only the events of these sensors are counted. """
+
+        with self.lock:
+            if sensors is None:
+                histograms = dict((stage, dict(histogram, buckets=list(
+                    histogram['buckets']))) for stage, histogram
+                    in self.histograms.items())
+            else:
+                histograms = {}
+                for (sensor, stage), histogram in \
+                        self.sensorHistograms.items():
+                    if sensor not in sensors:
+                        continue
+                    total = histograms.get(stage)
+                    if total is None:
+                        total = histograms[stage] = self._newHistogram()
+                    total['buckets'] = [count + other for count, other in zip(
+                        total['buckets'], histogram['buckets'])]
+                    total['count'] += histogram['count']
+                    total['sum'] += histogram['sum']
+                    total['max'] = max(total['max'], histogram['max'])
+        result = {}
+        for stage, histogram in histograms.items():
+            result[stage] = {
+                'count': histogram['count'],
+                'mean': round(histogram['sum'] / histogram['count'], 3),
+                'max': round(histogram['max'], 3),
+                'p50': self._percentile(histogram, 50),
+                'p95': self._percentile(histogram, 95),
+                'p99': self._percentile(histogram, 99),
+                'buckets': [[bound, count] for bound, count in zip(
+                    list(BUCKETS) + [None], histogram['buckets'])]
+            }
+        return result
+
+    def getTraces(self, limit=20, sensor=None, sensors=None):
+        """ Returns the latest traces, the newest first, optionally of one
+            sensor or of a set of sensors """
+
+        with self.lock:
+            traces = [trace.toDict() for trace in reversed(self.traces)
+                      if (sensor is None or trace.sensor == sensor) and
+                      (sensors is None or trace.sensor in sensors)]
+        return traces[:limit]
+
+
+_latencyTracer = None
+_latencyTracerLock = threading.Lock()
+
+
+def getLatencyTracer():
+    """ Returns the latency tracer that is shared by the drivers and the
+        Workers """
+
+    global _latencyTracer
+    with _latencyTracerLock:
+        if _latencyTracer is None:
+            _latencyTracer = LatencyTracer(
+                maxTraces=getProfile()['latency_traces'])
+    return _latencyTracer
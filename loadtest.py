@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+""" Load test of the Socket.IO fan-out of the UI, e.g.:
+    python loadtest.py http://pi:5000 test1 secret --clients 50 --pid 1234
+It connects N Socket.IO clients that join the room of the user and
+subscribe to the logs like web/myjs.js does. Then one more client toggles
+a sensor (setSensorState) at the given rate, which makes the server send
+settingsChanged and sensorLogEntry to all of them. It reports how long
+each message needed to reach the clients, how many were dropped and, with
+the pid of the server, its CPU usage and memory per connected client.
+The sensor is set back to its state at the end, but prefer a test user.
+Requires the Socket.IO client: pip install "python-socketio[client]"
+"""
+
+import argparse
+import os
+import threading
+import time
+from base64 import b64encode
+
+import requests
+
+from colors import bcolors
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+FANOUT_EVENTS = ('settingsChanged', 'sensorLogEntry')
+
+
+def readProcessCPU(pid):
+    """ Returns the CPU seconds (user and system) used by a process """
+
+    if pid is None:
+        return None
+    try:
+        with open('/proc/{0}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, OSError):
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    return (int(fields[11]) + int(fields[12])) / float(ticks)
+
+
+def readProcessRSS(pid):
+    """ Returns the resident memory of a process in kB """
+
+    if pid is None:
+        return None
+    try:
+        with open('/proc/{0}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        return None
+    return None
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class LoadClient():
+    """ A dashboard that keeps the arrival time of the fan-out messages """
+
+    def __init__(self, url, auth, logLimit=10, transports=None):
+        import socketio
+        self.url = url
+        self.auth = auth
+        self.logLimit = logLimit
+        self.transports = transports
+        self.arrivals = dict((event, []) for event in FANOUT_EVENTS)
+        self.subscribed = threading.Event()
+        self.client = socketio.Client(reconnection=False)
+        self.client.on('connect', self.on_connect)
+        self.client.on('sensorsLog', self.on_sensorsLog)
+        for event in FANOUT_EVENTS:
+            self.client.on(event, self._arrival(event))
+
+    def _arrival(self, event):
+        return lambda data: self.arrivals[event].append(monotonic())
+
+    def connect(self):
+        self.client.connect(
+            self.url, headers={'Authorization': self.auth},
+            transports=self.transports)
+
+    def on_connect(self):
+        self.client.emit('join', {})
+        self.client.emit('subscribeLogs',
+                         {'limit': self.logLimit, 'type': 'user_action'})
+
+    def on_sensorsLog(self, data):
+        self.subscribed.set()
+
+    def disconnect(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+class LoadTest():
+
+    def __init__(self, url, username, password, clients=10, rate=5.0,
+                 events=50, sensor=None, pid=None, transports=None,
+                 timeout=5.0):
+        self.url = url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.numClients = clients
+        self.rate = rate
+        self.numEvents = events
+        self.sensor = sensor
+        self.pid = pid
+        self.transports = transports
+        self.timeout = timeout
+        self.auth = 'Basic ' + b64encode(
+            (username + ':' + password).encode('utf-8')).decode('ascii')
+        self.clients = []
+        self.driver = None
+
+    def getSensors(self):
+        response = requests.get(self.url + '/getSensors.json',
+                                headers={'Authorization': self.auth})
+        response.raise_for_status()
+        return response.json()['sensors']
+
+    def connectClients(self):
+        """ Connects the dashboards and returns the seconds it needed """
+
+        start = monotonic()
+        for index in range(self.numClients):
+            client = LoadClient(self.url, self.auth,
+                                transports=self.transports)
+            try:
+                client.connect()
+            except Exception as e:
+                print("{0}Client {2} failed to connect: {3}{1}".format(
+                    bcolors.FAIL, bcolors.ENDC, index, str(e)))
+                continue
+            self.clients.append(client)
+        for client in self.clients:
+            client.subscribed.wait(self.timeout)
+        return monotonic() - start
+
+    def run(self):
+        """ Connects the clients, sends the sensor events and returns
+            the statistics """
+
+        sensors = self.getSensors()
+        if self.sensor is None:
+            self.sensor = sorted(sensors)[0]
+        enabled = sensors[self.sensor]['enabled']
+
+        rssBefore = readProcessRSS(self.pid)
+        connectTime = self.connectClients()
+        rssAfter = readProcessRSS(self.pid)
+
+        self.driver = LoadClient(self.url, self.auth,
+                                 transports=self.transports)
+        self.driver.connect()
+        self.driver.subscribed.wait(self.timeout)
+
+        sent = []
+        cpuBefore = readProcessCPU(self.pid)
+        start = monotonic()
+        for index in range(self.numEvents):
+            delay = start + index / float(self.rate) - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            enabled = not enabled
+            sent.append(monotonic())
+            self.driver.client.emit('setSensorState', {
+                'sensor': self.sensor, 'enabled': enabled})
+        self._waitDelivered(len(sent))
+        duration = monotonic() - start
+        cpuAfter = readProcessCPU(self.pid)
+
+        # Set the sensor back to the state it had
+        if enabled != sensors[self.sensor]['enabled']:
+            self.driver.client.emit('setSensorState', {
+                'sensor': self.sensor,
+                'enabled': sensors[self.sensor]['enabled']})
+
+        stats = {
+            'clients': len(self.clients),
+            'connectTime': connectTime,
+            'events': len(sent),
+            'duration': duration,
+            'fanout': {}
+        }
+        for event in FANOUT_EVENTS:
+            latencies = []
+            received = 0
+            for client in self.clients:
+                arrivals = client.arrivals[event][:len(sent)]
+                received += len(arrivals)
+                # The messages of a connection arrive in order, so the nth
+                # message is the answer to the nth event
+                latencies.extend(arrival - sentTime
+                                 for arrival, sentTime in zip(arrivals, sent))
+            expected = len(sent) * len(self.clients)
+            stats['fanout'][event] = {
+                'expected': expected,
+                'received': received,
+                'dropped': expected - received,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': max(latencies) if latencies else 0
+            }
+        if cpuBefore is not None and cpuAfter is not None:
+            stats['cpuPercent'] = 100 * (cpuAfter - cpuBefore) / duration
+        if rssBefore is not None and rssAfter is not None:
+            stats['rss'] = rssAfter
+            stats['rssPerClient'] = \
+                float(rssAfter - rssBefore) / max(1, len(self.clients))
+        return stats
+
+    def _waitDelivered(self, count):
+        """ Waits until all the clients got all the messages or until
+            there is no new message for the timeout """
+
+        def received():
+            return sum(len(client.arrivals[event])
+                       for client in self.clients for event in FANOUT_EVENTS)
+
+        expected = count * len(self.clients) * len(FANOUT_EVENTS)
+        lastReceived = -1
+        lastChange = monotonic()
+        while True:
+            current = received()
+            if current >= expected:
+                return
+            if current != lastReceived:
+                lastReceived = current
+                lastChange = monotonic()
+            elif monotonic() - lastChange > self.timeout:
+                return
+            time.sleep(0.05)
+
+    def close(self):
+        for client in self.clients + [self.driver]:
+            if client is not None:
+                client.disconnect()
+
+
+def printStats(stats):
+    print("{0}{2} clients connected in {3:.2f}s, {4} events in {5:.2f}s{1}"
+          .format(bcolors.OKGREEN, bcolors.ENDC, stats['clients'],
+                  stats['connectTime'], stats['events'], stats['duration']))
+    for event, fanout in stats['fanout'].items():
+        print("{0}: received {1}/{2}, dropped {3}, latency (ms) "
+              "p50 {4:.1f}, p95 {5:.1f}, p99 {6:.1f}, max {7:.1f}".format(
+                  event, fanout['received'], fanout['expected'],
+                  fanout['dropped'], fanout['p50'] * 1000,
+                  fanout['p95'] * 1000, fanout['p99'] * 1000,
+                  fanout['max'] * 1000))
+    if 'cpuPercent' in stats:
+        print("Server CPU: {0:.1f}%".format(stats['cpuPercent']))
+    if 'rss' in stats:
+        print("Server memory: {0} kB, {1:.1f} kB per client".format(
+            stats['rss'], stats['rssPerClient']))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test of the AlarmPI Socket.IO fan-out')
+    parser.add_argument('url', help='e.g. http://localhost:5000')
+    parser.add_argument('username')
+    parser.add_argument('password')
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=5.0,
+                        help='sensor events per second')
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--sensor', help='uuid of the sensor to toggle')
+    parser.add_argument('--pid', type=int,
+                        help='pid of the server for the CPU and memory')
+    parser.add_argument('--transport', choices=['polling', 'websocket'])
+    args = parser.parse_args()
+
+    loadtest = LoadTest(
+        args.url, args.username, args.password, clients=args.clients,
+        rate=args.rate, events=args.events, sensor=args.sensor,
+        pid=args.pid,
+        transports=[args.transport] if args.transport else None)
+    try:
+        stats = loadtest.run()
+    finally:
+        loadtest.close()
+    printStats(stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+import os
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+
+from colors import bcolors
+import serializer
+
+# Number of texts (e.g. "alarm activated") that have a pointer to their
+# last log
+MAX_WATCHED = 16
+
+# A trigram that is in more than half of the logs (and in more than this
+# number of them) is common: its cursors are removed and it isn't used to
+# find the candidates, because reading the log is as fast
+COMMON_MIN = 1000
+
+
+def trigrams(text):
+    """ Returns the set of the 3 character substrings of a lower case
+        text. Every text that contains another one also contains all its
+        trigrams, so they find the candidates of a substring search. """
+
+    return set(text[index:index + 3] for index in range(len(text) - 2))
+
+
+class LogIndex():
+    """ Inverted index of the log file, updated when each log is written.
+    It has the cursors (byte offsets) of the logs for each trigram of their
+    lower case event and for each sensor uuid, and a pointer to the last
+    log that contains each of the watched texts, e.g. "Alarm activated"
+    (the sensor stop logs excluded).
+    It is saved next to the log file (alert.log.index) with the size of
+    the log that it covers and the checksum of the last indexed line, so
+    on startup only the newer lines are indexed. The cursors of a text are
+    candidates: the logs that contain the text are among them. They are
+    kept in arrays, which use 8 bytes or less for each cursor, and the
+    trigrams that are in most of the logs are not kept.
+    The base is the number of bytes that the trims have removed from the
+    start of the log file. The cursors that are given to the clients are
+    the byte offsets plus the base, so they stay valid after a trim.
+    """
+
+    def __init__(self, logfile):
+        self.indexfile = logfile + '.index'
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.count = 0
+        self.base = 0
+        self.last = None
+        self.common = set()
+        self.trigrams = {}
+        self.sensors = {}
+        self.watched = OrderedDict([('alarm activated', None)])
+
+    def load(self, readLine):
+        """ Loads the saved index. readLine(offset) returns the line of the
+            log at an offset and is used to check that the log file is the
+            one that was indexed. Returns the size of the log file that is
+            already indexed. """
+
+        with self.lock:
+            self._reset()
+            if not os.path.exists(self.indexfile):
+                return 0
+            try:
+                with open(self.indexfile, 'rb') as f:
+                    data = serializer.loads(f.read().decode('utf-8'))
+                if data['last'] is not None:
+                    offset, checksum = data['last']
+                    line = readLine(offset).encode('utf-8')
+                    if zlib.crc32(line) & 0xffffffff != checksum:
+                        raise ValueError('the log file has changed')
+                self.size = data['size']
+                self.count = data['count']
+                self.base = data.get('base', 0)
+                self.last = data['last']
+                self.common = set(data['common'])
+                self.trigrams = dict((key, array('l', cursors)) for key,
+                                     cursors in data['trigrams'].items())
+                self.sensors = dict((key, array('l', cursors)) for key,
+                                    cursors in data['sensors'].items())
+                self.watched = OrderedDict(data['watched'])
+            except Exception as e:
+                print("{0}Rebuilding the log index: {2}{1}".format(
+                    bcolors.WARNING, bcolors.ENDC, str(e)))
+                self._reset()
+                self.dirty = True
+            return self.size
+
+    def save(self):
+        """ Writes the index next to the log file if it has changed """
+
+        with self.lock:
+            if not self.dirty:
+                return
+            data = serializer.dumps({
+                'size': self.size,
+                'count': self.count,
+                'base': self.base,
+                'last': self.last,
+                'common': sorted(self.common),
+                'trigrams': dict((key, cursors.tolist()) for key, cursors
+                                 in self.trigrams.items()),
+                'sensors': dict((key, cursors.tolist()) for key, cursors
+                                in self.sensors.items()),
+                'watched': list(self.watched.items())
+            })
+            self.dirty = False
+        tmpfile = self.indexfile + '.tmp'
+        with open(tmpfile, 'wb') as f:
+            f.write(data.encode('utf-8'))
+        os.rename(tmpfile, self.indexfile)
+
+    def addLog(self, log, line, nextOffset):
+        """ Adds a parsed log (with its cursor) and its line to the index """
+
+        cursor = log['cursor']
+        event = log['event'].lower()
+        with self.lock:
+            self.count += 1
+            for trigram in trigrams(event):
+                if trigram in self.common:
+                    continue
+                cursors = self.trigrams.setdefault(trigram, array('l'))
+                cursors.append(cursor)
+                if (len(cursors) > COMMON_MIN and
+                        len(cursors) * 2 > self.count):
+                    del self.trigrams[trigram]
+                    self.common.add(trigram)
+            stop = False
+            if 'sensor' in log['type'][0].lower() and len(log['type']) > 2:
+                self.sensors.setdefault(
+                    log['type'][2], array('l')).append(cursor)
+                stop = log['type'][1] == 'stop'
+            # The sensor stop logs are merged with their start log, so they
+            # don't move the pointers
+            for text in self.watched:
+                if not stop and text in event:
+                    self.watched[text] = cursor
+            self.size = nextOffset
+            self.last = [cursor, zlib.crc32(line.encode('utf-8')) & 0xffffffff]
+            self.dirty = True
+
+    def shift(self, start, count):
+        """ Updates the cursors after the logs before the start byte offset
+            have been removed from the log file and count logs are left """
+
+        def shiftCursors(cursors):
+            return array('l', [cursor - start for cursor in cursors
+                               if cursor >= start])
+
+        with self.lock:
+            for postings in (self.trigrams, self.sensors):
+                for key in list(postings):
+                    postings[key] = shiftCursors(postings[key])
+                    if not postings[key]:
+                        del postings[key]
+            for text, cursor in self.watched.items():
+                if cursor is not None:
+                    # The last log of the text has been removed, so there
+                    # are no others left
+                    self.watched[text] = cursor - start \
+                        if cursor >= start else None
+            self.size = max(0, self.size - start)
+            self.count = count
+            self.base += start
+            if self.last is not None:
+                self.last = [self.last[0] - start, self.last[1]] \
+                    if self.last[0] >= start else None
+            self.dirty = True
+
+    def getCandidates(self, text, before=None):
+        """ Returns the cursors of the logs that may contain the text, the
+            newest first, or None if the text is too short for the index """
+
+        keys = trigrams(text.lower())
+        with self.lock:
+            keys -= self.common
+        if not keys:
+            return None
+        with self.lock:
+            postings = sorted((self.trigrams.get(key, ()) for key in keys),
+                              key=len)
+            candidates = postings[0]
+            if len(postings) > 1:
+                others = set(postings[1])
+                candidates = [cursor for cursor in candidates
+                              if cursor in others]
+            else:
+                candidates = list(candidates)
+        if before is not None:
+            candidates = [cursor for cursor in candidates if cursor < before]
+        candidates.reverse()
+        return candidates
+
+    def getSensorCursors(self, sensorUUID):
+        """ Returns the cursors of the logs of a sensor, the oldest first """
+
+        with self.lock:
+            return list(self.sensors.get(sensorUUID, ()))
+
+    def getLastMatch(self, text):
+        """ Returns (True, cursor) with the cursor of the last log that
+            contains the text (None if there is none) when the text is
+            watched, or (False, None) otherwise """
+
+        text = text.lower()
+        with self.lock:
+            if text not in self.watched:
+                return False, None
+            # The texts that are not used are the first to be removed
+            cursor = self.watched.pop(text)
+            self.watched[text] = cursor
+            return True, cursor
+
+    def watch(self, text, cursor):
+        """ Keeps a pointer to the last log that contains the text. The
+            cursor is the current last log, or None if there is none. """
+
+        with self.lock:
+            self.watched[text.lower()] = cursor
+            while len(self.watched) > MAX_WATCHED:
+                self.watched.popitem(last=False)
+            self.dirty = True
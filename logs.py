@@ -1,20 +1,50 @@
 #!/usr/bin/env python
 
+import csv
+import io
+import os
 import re
+import shutil
 import threading
-import time
-from datetime import datetime
+from datetime import timedelta
+from episodes import Episodes
+from logindex import LogIndex
+from runtime import getRuntime
+import serializer
 
 
 class Logs():
 
     def __init__(self, logfile):
         self.logfile = logfile
+        self.lock = threading.Lock()
+        self.episodes = Episodes()
+        self.index = LogIndex(logfile)
+        self._loadEpisodes()
 
-    def startTrimThread(self):
-        threadTrimLogFile = threading.Thread(target=self.trimLogFile)
-        threadTrimLogFile.daemon = True
-        threadTrimLogFile.start()
+    def _loadEpisodes(self):
+        """ Fills the episodes table from the existing log file and adds
+            the lines that are not in the saved index to it """
+
+        if not os.path.exists(self.logfile):
+            return
+        indexed = self.index.load(self._readLineAt)
+        for offset, nextOffset, line in self._readLines():
+            log = self.parseLogLine(line)
+            if log is not None:
+                log['cursor'] = offset
+                self.episodes.addLog(log)
+                if offset >= indexed:
+                    self.index.addLog(log, line, nextOffset)
+
+    def startTrimming(self):
+        """ Trims the log file now and every 24 hours, and saves the index
+            of the logs every minute """
+
+        getRuntime().schedule(0, 'trim', self.trimLogFile,
+                              owner=self, interval=86400)
+        getRuntime().schedule(60, 'logindex', self.index.save,
+                              owner=self, interval=60)
 
 
     def _convert_timedelta(self, duration):
@@ -39,39 +69,275 @@ class Logs():
 
 
     def trimLogFile(self):
-        """ Trims the log file in an interval of 24 hours to 1000 lines """
+        """ Trims the log file to 1000 lines """
 
         lines = 1000  # Number of lines of logs to keep
-        repeat_every_n_sec = 86400  # 24 Hours
-        while True:
-            with open(self.logfile, 'r') as f:
-                data = f.readlines()
-            with open(self.logfile, 'w') as f:
-                f.writelines(data[-lines:])
-            time.sleep(repeat_every_n_sec)
+        with self.lock:
+            # Find the first line to keep reading backwards, and copy the
+            # rest in blocks, so that the file is never loaded in memory
+            start = 0
+            for count, (offset, line) in enumerate(self._readLinesReverse()):
+                if count + 1 >= lines:
+                    start = offset
+                    break
+            if start == 0:
+                return
+            tmpfile = self.logfile + '.tmp'
+            with open(self.logfile, 'rb') as source:
+                source.seek(start)
+                with open(tmpfile, 'wb') as destination:
+                    shutil.copyfileobj(source, destination, 65536)
+            os.rename(tmpfile, self.logfile)
+            self.episodes.shift(start)
+            self.index.shift(start, lines)
+        self.index.save()
+
+
+    def writeLog(self, logType, logTime, message):
+        """ Appends a new event to the log file and returns it
+            in the same format as the parsed log lines """
+
+        logmsg = '({0}) [{1}] {2}\n'.format(logType, logTime, message)
+        data = logmsg.encode('utf-8')
+        with self.lock:
+            with open(self.logfile, "ab") as myfile:
+                myfile.seek(0, os.SEEK_END)
+                cursor = myfile.tell()
+                myfile.write(data)
+            log = self.parseLogLine(logmsg)
+            log['cursor'] = cursor
+            self.episodes.addLog(log)
+            self.index.addLog(log, logmsg, cursor + len(data))
+        return log
+
+    def parseLogLine(self, line):
+        """ Converts a line of the log file into a dictionary with
+            the type, time and event. Returns None if it can't be parsed """
+
+        logType = None
+        logTime = None
+        logText = None
+
+        # Analyze log line for each category
+        try:
+            mymatch = re.match(r'^\((.*)\) \[(.*)\] (.*)', line)
+            if mymatch:
+                logType = mymatch.group(1).split(',')
+                logTime = mymatch.group(2)
+                logText = mymatch.group(3)
+        except Exception:
+            mymatch = re.match(r'^\[(.*)\] (.*)', line)
+            if mymatch:
+                logType = ["unknown", "unknown"]
+                logTime = mymatch.group(1)
+                logText = mymatch.group(2)
+
+        if logType is None or logTime is None or logText is None:
+            return None
+        return {
+            'type': logType,
+            'event': logText,
+            'time': logTime
+        }
+
+    def parseSelectTypes(self, selectTypes):
+        """ Converts the comma separated types to a list """
+
+        if (type(selectTypes) == str):
+            selectTypes = selectTypes.split(',')
+        elif selectTypes is None:
+            selectTypes = 'all'.split(',')
+        return selectTypes
+
+    def matchLog(self, log, selectTypes='all', filterText=None,
+                 combineSensors=False):
+        """ Checks if a parsed log matches the type and text filters.
+            When combineSensors is set, the sensor stop events don't match
+            because they are merged with their start event """
+
+        if (combineSensors and 'sensor' in log['type'][0].lower() and
+                log['type'][1:2] == ['stop']):
+            return False
+        if (selectTypes is not None and 'all' not in selectTypes):
+            if (log['type'][0].lower() not in selectTypes):
+                return False
+        if (filterText not in (None, 'all')):
+            if (filterText.lower() not in log['event'].lower()):
+                return False
+        return True
+
+    def formatLog(self, log, getFormat='text'):
+        """ Converts a parsed log to the human readable format
+            if the getFormat is text """
+
+        if (getFormat != 'text'):
+            if 'cursor' in log:
+                return dict(log, cursor=self._toCursor(log['cursor']))
+            return log
+        if ('timediff' in log):
+            return '[{0}] ({1}) {2}'.format(
+                log['time'], log['timediff'], log['event'])
+        return '[{0}] {1}'.format(log['time'], log['event'])
+
+    def _parseCursor(self, cursor):
+        """ Converts a cursor given by the user to a byte offset. A cursor
+            of a log that has been trimmed is the start of the file, where
+            the logs after it begin and there are no logs before it. """
 
+        if type(cursor) != int:
+            if cursor is None or not cursor.isdigit():
+                return None
+            cursor = int(cursor)
+        return max(0, cursor - self.index.base)
+
+    def _toCursor(self, offset):
+        """ Converts a byte offset to the cursor that is given to the user,
+            which doesn't change when the log file is trimmed """
+
+        if offset is None:
+            return None
+        return offset + self.index.base
+
+    def _readLines(self, start=0, end=None):
+        """ Reads the log file forward from the start byte offset and yields
+            the offset of each line, the offset after it and the line """
+
+        with open(self.logfile, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if start > f.tell():
+                # The file has been trimmed since the cursor was given
+                start = 0
+            f.seek(start)
+            offset = start
+            for line in iter(f.readline, b''):
+                if end is not None and offset >= end:
+                    break
+                if not line.endswith(b'\n'):
+                    # Don't consume a line that is still being written
+                    break
+                nextOffset = offset + len(line)
+                yield offset, nextOffset, line.decode('utf-8', 'replace')
+                offset = nextOffset
+
+    def _parseTime(self, logTime):
+        """ Converts a time given by the user (e.g. 2018-01-01 02:00 or
+            2018-01-01T02:00:00) to the format of the log file """
+
+        if logTime in (None, ''):
+            return None
+        return logTime.strip().replace('T', ' ')
+
+    def _findTime(self, logTime, after=False, blockSize=4096):
+        """ Returns the byte offset of the first log with a time equal or
+            later than logTime (later if after is set), or the size of the
+            file if there is none. The logs are appended in time order, so
+            it is a binary search over the offsets of the file, which reads
+            a few lines even for a very long log. """
+
+        def isBefore(line):
+            log = self.parseLogLine(line.decode('utf-8', 'replace'))
+            if log is None:
+                return True
+            if after:
+                return log['time'] <= logTime
+            return log['time'] < logTime
+
+        with open(self.logfile, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            low, high = 0, f.tell()
+            # The first log of the time is a line between low and high
+            while high - low > blockSize:
+                middle = (low + high) // 2
+                f.seek(middle - 1)
+                f.readline()
+                offset = f.tell()
+                if offset >= high:
+                    break
+                line = f.readline()
+                if isBefore(line):
+                    low = offset + len(line)
+                else:
+                    high = offset
+            f.seek(low)
+            offset = low
+            for line in iter(f.readline, b''):
+                if offset >= high or not isBefore(line):
+                    return offset
+                offset += len(line)
+            return min(offset, high)
+
+    def _readLineAt(self, offset):
+        """ Returns the line of the log file at a byte offset """
+
+        with open(self.logfile, 'rb') as f:
+            f.seek(offset)
+            return f.readline().decode('utf-8', 'replace')
+
+    def _readLinesAt(self, offsets):
+        """ Yields the offset and the line of the log file at each of the
+            byte offsets, in their order """
+
+        with open(self.logfile, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                line = f.readline()
+                if line.endswith(b'\n'):
+                    yield offset, line.decode('utf-8', 'replace')
+
+    def _readLinesReverse(self, end=None, blockSize=8192):
+        """ Reads the log file backwards from the end byte offset (or the
+            end of the file) and yields the offset of each line and the line
+        """
+
+        with open(self.logfile, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if end is None or end > f.tell():
+                end = f.tell()
+            position = end
+            remainder = b''
+            while position > 0:
+                readSize = min(blockSize, position)
+                position -= readSize
+                f.seek(position)
+                block = f.read(readSize) + remainder
+                lines = block.split(b'\n')
+                remainder = lines.pop(0)
+                lineEnd = position + len(block)
+                for line in reversed(lines):
+                    lineStart = lineEnd - len(line)
+                    if line:
+                        yield lineStart, line.decode('utf-8', 'replace')
+                    lineEnd = lineStart - 1
+            if remainder:
+                yield 0, remainder.decode('utf-8', 'replace')
 
     def getSensorsLog(self, limit=100, fromText=None,
                       selectTypes='all', filterText=None,
-                      getFormat='text', combineSensors=True):
+                      getFormat='text', combineSensors=True,
+                      since=None, before=None, fromTime=None, toTime=None):
         """ Returns the last n lines if the log file.
         If selectTypes is specified, then it returns only this type of logs.
         Available types: user_action, sensor,
                          system, alarm
         If the getFormat is specified as json, then it returns it in a
         json format (programmer friendly)
+        Each log has a cursor (byte offset in the log file plus the bytes
+        that the trims have removed before it). If since is
+        specified, then it returns the first n logs after this cursor,
+        if before is specified it returns the last n logs before it.
+        The next cursor returned is used as since to get the newer logs and
+        the prev cursor is used as before to get the older logs.
+        If fromTime or toTime are specified (e.g. 2018-01-01 02:00), then
+        it returns only the logs of this time range.
         """
 
         # Fix inputs
-        if (type(limit) != int and limit is not None):
-            if (limit.isdigit()):
+        if (type(limit) != int):
+            if (limit is not None and limit.isdigit()):
                 limit = int(limit)
-        else:
-            limit = 100
-        if (type(selectTypes) == str):
-            selectTypes = selectTypes.split(',')
-        elif selectTypes is None:
-            selectTypes = 'all'.split(',')
+            else:
+                limit = 100
+        selectTypes = self.parseSelectTypes(selectTypes)
         if (type(combineSensors) != bool and combineSensors is not None):
             if (combineSensors.lower() == 'true'):
                 combineSensors = True
@@ -81,113 +347,318 @@ class Logs():
             combineSensors = True
         if getFormat is None:
             getFormat = 'text'
+        if fromText in (None, 'all'):
+            fromText = None
+        since = self._parseCursor(since)
+        before = self._parseCursor(before)
+
+        # The time range is converted to a range of cursors
+        start = 0
+        fromTime = self._parseTime(fromTime)
+        toTime = self._parseTime(toTime)
+        if fromTime is not None:
+            start = self._findTime(fromTime)
+            if since is not None:
+                since = max(since, start)
+        if toTime is not None:
+            end = self._findTime(toTime, after=True)
+            before = end if before is None else min(before, end)
+
+        if since is not None:
+            logs, nextCursor, prevCursor = self._getLogsAfter(
+                limit, fromText, selectTypes, filterText,
+                combineSensors, since, before)
+        else:
+            logs, nextCursor, prevCursor = self._getLogsBefore(
+                limit, fromText, selectTypes, filterText,
+                combineSensors, before, start)
+
+        # Convert to Human format
+        logs = [self.formatLog(log, getFormat) for log in logs]
+
+        return {"log": logs, "next": self._toCursor(nextCursor),
+                "prev": self._toCursor(prevCursor)}
+
+    def _sensorStatus(self, log):
+        """ Returns the status (start, stop) and the uuid of a sensor log """
+
+        if 'sensor' in log['type'][0].lower() and len(log['type']) > 2:
+            return log['type'][1], log['type'][2]
+        return None, None
+
+    def _combineSensorLog(self, log):
+        """ Adds the end time and the duration of the episode to a sensor
+            start log. Returns None for the rest of the sensor logs,
+            because they are merged with their start log """
+
+        status, uuid = self._sensorStatus(log)
+        if status is None:
+            return log
+        if status != 'start':
+            return None
+        episode = self.episodes.get(log['cursor'])
+        if episode is not None and episode['duration'] is not None:
+            log['timediff'] = self._convert_timedelta(
+                timedelta(seconds=episode['duration']))
+            log['timeend'] = episode['end']
+        return log
+
+    def getEndedSensorLog(self, log):
+        """ Returns the start log of the episode that a sensor stop log has
+            ended, with its cursor, end time and duration, or None """
+
+        status, uuid = self._sensorStatus(log)
+        if status != 'stop':
+            return None
+        episode = self.episodes.getEnded(uuid)
+        if episode is None or episode.end != log['time']:
+            return None
+        startLog = self.parseLogLine(self._readLineAt(episode.cursor))
+        if startLog is None:
+            return None
+        startLog['cursor'] = episode.cursor
+        return self._combineSensorLog(startLog)
+
+    def getEpisodes(self, sensorUUID=None, onlyOpen=False, limit=100):
+        """ Returns the episodes (start, end, duration) of the sensors.
+            If sensorUUID is specified, then it returns the episodes of
+            this sensor. If onlyOpen is True, it returns only the sensors
+            that haven't stopped yet """
+
+        if (type(limit) != int):
+            if (limit is not None and limit.isdigit()):
+                limit = int(limit)
+            else:
+                limit = 100
+        if (type(onlyOpen) != bool):
+            onlyOpen = str(onlyOpen).lower() == 'true'
+
+        if onlyOpen:
+            episodes = self.episodes.getOpen()
+            if sensorUUID is not None:
+                episodes = [episode for episode in episodes
+                            if episode['sensor'] == sensorUUID]
+        elif sensorUUID is not None:
+            episodes = self.episodes.getSensorHistory(sensorUUID, limit)
+        else:
+            episodes = self.episodes.getAll(limit)
+        episodes = [dict(episode) for episode in episodes]
+        for episode in episodes:
+            episode['cursor'] = self._toCursor(episode['cursor'])
+        return {"episodes": episodes}
+
+    def getSensorHistory(self, sensorUUID, limit=100, today=None):
+        """ Returns the last activations of a sensor, the newest first,
+            with their duration and the summary of its activations.
+            today is the day of the activations today, e.g. 2018-01-01 """
+
+        if (type(limit) != int):
+            if (limit is not None and limit.isdigit()):
+                limit = int(limit)
+            else:
+                limit = 100
+        activations = []
+        for episode in reversed(
+                self.episodes.getSensorHistory(sensorUUID, limit)):
+            activation = dict(episode)
+            activation['cursor'] = self._toCursor(episode['cursor'])
+            if episode['duration'] is not None:
+                activation['timediff'] = self._convert_timedelta(
+                    timedelta(seconds=episode['duration']))
+            activations.append(activation)
+        return {
+            "sensor": sensorUUID,
+            "activations": activations,
+            "summary": self.episodes.getSensorSummary(sensorUUID, today)
+        }
+
+    def _getLastMatch(self, text, before, latest):
+        """ Finds the last log before the before cursor that contains the
+            text, without the sensor stop logs. Returns (True, cursor),
+            where the cursor is None if there is no log, or (False, None)
+            if the index can't find the text. When latest is set (before is
+            the end of the log file) the index keeps a pointer to the last
+            log of the text, so the next searches don't read the log. """
+
+        watched, cursor = self.index.getLastMatch(text)
+        if watched and (cursor is None or cursor < before):
+            return True, cursor
+        if latest and not watched:
+            with self.lock:
+                found, cursor = self._searchLast(text)
+                if found:
+                    self.index.watch(text, cursor)
+            if cursor is None or cursor < before:
+                return found, cursor
+        return self._searchLast(text, before)
+
+    def _searchLast(self, text, before=None):
+        """ Reads the candidates of the index for the text, the newest first,
+            until one contains it """
+
+        candidates = self.index.getCandidates(text, before)
+        if candidates is None:
+            return False, None
+        for offset, line in self._readLinesAt(candidates):
+            log = self.parseLogLine(line)
+            if (log is not None and self._sensorStatus(log)[0] != 'stop'
+                    and text.lower() in log['event'].lower()):
+                return True, offset
+        return True, None
+
+    def _getLogsBefore(self, limit, fromText, selectTypes, filterText,
+                       combineSensors, before, start=0):
+        """ Reads the log file backwards until it finds n logs that
+            match the filters or it reaches the start cursor. The index
+            gives the logs that contain the filterText and the last log of
+            the fromText, so only these are read when the texts are long
+            enough for it (3 characters). """
 
-        # Read from File the Logs
         logs = []
-        with open(self.logfile, "r") as f:
-            lines = f.readlines()
-        startedSensors = {}
-        for line in lines:
-            logType = None
-            logTime = None
-            logText = None
-
-            # Analyze log line for each category
-            try:
-                mymatch = re.match(r'^\((.*)\) \[(.*)\] (.*)', line)
-                if mymatch:
-                    logType = mymatch.group(1).split(',')
-                    logTime = mymatch.group(2)
-                    logText = mymatch.group(3)
-            except Exception:
-                mymatch = re.match(r'^\[(.*)\] (.*)', line)
-                if mymatch:
-                    logType = ["unknown", "unknown"]
-                    logTime = mymatch.group(1)
-                    logText = mymatch.group(2)
-
-            # append them to a list
-            if logType is not None and logTime is not None and logText is not None:
-                logs.append({
-                    'type': logType,
-                    'event': logText,
-                    'time': logTime
-                })
-
-        # Add endtime to the sensors
-        if (combineSensors):
-            tmplogs = []
-            index = 0
-            startedSensors = {}
-            for log in logs:
-                if 'sensor' in log['type'][0].lower():
-                    status, uuid = log['type'][1], log['type'][2]
-                    if status == 'start':
-                        startedSensors[uuid] = {
-                            'start': log['time'],
-                            'ind': index
-                        }
-                        index += 1
-                        tmplogs.append(log)
-                    elif status == 'stop':
-                        try:
-                            info = startedSensors.pop(uuid, None)
-                            if info is not None:
-                                starttime = datetime.strptime(
-                                    info['start'], "%Y-%m-%d %H:%M:%S")
-                                endtime = datetime.strptime(
-                                    log['time'], "%Y-%m-%d %H:%M:%S")
-                                timediff = self._convert_timedelta(endtime - starttime)
-                                tmplogs[info['ind']]['timediff'] = timediff
-                                tmplogs[info['ind']]['timeend'] = log['time']
-                        except Exception as e:
-                            print(e)
-                            print(info)
-                            print(log)
-                            pass
-                else:
-                    index += 1
-                    tmplogs.append(log)
-            logs = tmplogs
-
-        # Filter from last found text till the end (e.g. Alarm activated)
-        if (fromText not in (None, 'all')):
-            tmplogs = []
-            index = 0
-            for log in reversed(logs):
-                index += 1
-                if (fromText.lower() in log['event'].lower()):
+        latest = before is None
+        if before is None:
+            before = os.path.getsize(self.logfile)
+        nextCursor = before
+
+        # The last log of the fromText (e.g. Alarm activated), the logs
+        # before it are not returned
+        fromCursor = None
+        stopText = None
+        if fromText is not None:
+            found = False
+            if combineSensors:
+                found, fromCursor = self._getLastMatch(
+                    fromText, before, latest)
+            if not found:
+                stopText = fromText.lower()
+        if fromCursor is None or fromCursor < start:
+            fromCursor = start or None
+        prevCursor = fromCursor or 0
+
+        candidates = None
+        if filterText not in (None, 'all') and stopText is None:
+            candidates = self.index.getCandidates(filterText, before)
+        if candidates is not None:
+            if fromCursor is not None:
+                candidates = [cursor for cursor in candidates
+                              if cursor >= fromCursor]
+            lines = self._readLinesAt(candidates)
+        else:
+            lines = self._readLinesReverse(before)
+
+        for offset, line in lines:
+            if fromCursor is not None and offset < fromCursor:
+                break
+            log = self.parseLogLine(line)
+            if log is None:
+                continue
+            log['cursor'] = offset
+
+            # Add endtime to the sensors
+            if (combineSensors):
+                log = self._combineSensorLog(log)
+                if log is None:
+                    continue
+
+            if self.matchLog(log, selectTypes, filterText):
+                logs.append(log)
+                if len(logs) >= limit:
+                    prevCursor = offset
                     break
-            logs = logs[-index:]
-
-        # Filter by Types (e.g. sensor, user_action, ...)
-        if (selectTypes is not None):
-            if ('all' not in selectTypes):
-                tmplogs = []
-                for log in logs:
-                    if (log['type'][0].lower() in selectTypes):
-                        tmplogs.append(log)
-                logs = tmplogs
-
-        # Filter by text (e.g. pir, ...)
-        if (filterText not in (None, 'all')):
-            tmplogs = []
-            for log in logs:
-                if (filterText.lower() in log['event'].lower()):
-                    tmplogs.append(log)
-            logs = tmplogs
 
+            # Filter from last found text till the end (e.g. Alarm activated)
+            if offset == fromCursor or (
+                    stopText is not None and stopText in log['event'].lower()):
+                prevCursor = offset
+                break
+        logs.reverse()
+        return logs, nextCursor, prevCursor
 
-        # Convert to Human format
-        if (getFormat == 'text'):
-            tmplogs = []
-            for log in logs:
-                if ('timediff' in log):
-                    tmplogs.append('[{0}] ({1}) {2}'.format(log['time'], log['timediff'], log['event']))
-                else:
-                    tmplogs.append('[{0}] {1}'.format(log['time'], log['event']))
-            logs = tmplogs
+    def _getLogsAfter(self, limit, fromText, selectTypes, filterText,
+                      combineSensors, since, before):
+        """ Reads the log file forward from the since cursor until it
+            finds n logs that match the filters. """
+
+        logs = []
+        nextCursor = since
+        for offset, nextOffset, line in self._readLines(since, before):
+            if len(logs) >= limit:
+                break
+            nextCursor = nextOffset
+            log = self.parseLogLine(line)
+            if log is None:
+                continue
+            log['cursor'] = offset
+
+            # Add endtime to the sensors
+            if (combineSensors):
+                log = self._combineSensorLog(log)
+                if log is None:
+                    continue
+
+            # Filter from last found text till the end (e.g. Alarm activated)
+            if (fromText is not None and
+                    fromText.lower() in log['event'].lower()):
+                logs = []
+
+            if self.matchLog(log, selectTypes, filterText):
+                logs.append(log)
+        return logs, nextCursor, since
+
+    def iterSensorsLog(self, selectTypes='all', filterText=None,
+                       combineSensors=True, fromTime=None, toTime=None):
+        """ Yields the logs from the oldest to the newest that match the
+            filters without loading the whole log file in memory.
+            fromTime and toTime are in the format of the log file, only
+            the lines between them are read. """
 
-        return {"log": logs[-limit:]}
+        selectTypes = self.parseSelectTypes(selectTypes)
+        if (type(combineSensors) != bool):
+            combineSensors = str(combineSensors).lower() != 'false'
+        fromTime = self._parseTime(fromTime)
+        toTime = self._parseTime(toTime)
+        start = 0
+        end = None
+        if fromTime is not None:
+            start = self._findTime(fromTime)
+        if toTime is not None:
+            end = self._findTime(toTime, after=True)
+        for offset, nextOffset, line in self._readLines(start, end):
+            log = self.parseLogLine(line)
+            if log is None:
+                continue
+            if fromTime is not None and log['time'] < fromTime:
+                continue
+            if toTime is not None and log['time'] > toTime:
+                continue
+            log['cursor'] = offset
+            if (combineSensors):
+                log = self._combineSensorLog(log)
+                if log is None:
+                    continue
+            if self.matchLog(log, selectTypes, filterText):
+                yield log
 
+    def exportSensorsLog(self, getFormat='ndjson', chunkSize=65536, **filters):
+        """ Yields the logs that match the filters as chunks of text in
+            the ndjson (one json log per line) or csv format """
 
+        columns = ['time', 'type', 'event', 'timeend', 'timediff', 'cursor']
+        output = io.StringIO()
+        if getFormat == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(columns)
+        for log in self.iterSensorsLog(**filters):
+            log['cursor'] = self._toCursor(log['cursor'])
+            if getFormat == 'csv':
+                log['type'] = ','.join(log['type'])
+                writer.writerow([log.get(column, '') for column in columns])
+            else:
+                output.write(serializer.dumps(log))
+                output.write('\n')
+            if output.tell() >= chunkSize:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        if output.tell() > 0:
+            yield output.getvalue()
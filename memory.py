@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+""" Memory profiles of AlarmPI. The profile is selected in the "memory"
+section of server.json and each of its values can be changed there, e.g.
+for boards with 512 MB or less (Pi Zero):
+    "memory": {"profile": "low", "cache_entries": 4}
+It must be applied before the threads of the alarm are started.
+"""
+
+import threading
+from collections import OrderedDict
+
+from colors import bcolors
+
+PROFILES = {
+    'default': {
+        # Stack of each thread in KB, 0 for the default of the platform
+        'thread_stack_kb': 0,
+        # Entries of each in-memory cache (status payloads, log columns)
+        'cache_entries': 64,
+        'runtime_workers': 4,
+        'latency_traces': 1000,
+        # The settings file is watched by a thread of each Worker, or
+        # checked by the timers of the runtime
+        'watcher_thread': True,
+    },
+    'low': {
+        'thread_stack_kb': 256,
+        'cache_entries': 8,
+        'runtime_workers': 2,
+        'latency_traces': 100,
+        'watcher_thread': False,
+    },
+}
+
+_profile = dict(PROFILES['default'], name='default')
+
+
+def applyProfile(config=None):
+    """ Selects the profile of the memory section of server.json and sets
+        the stack size of the threads that are started after this """
+
+    global _profile
+    config = dict(config or {})
+    name = config.pop('profile', 'default')
+    if name not in PROFILES:
+        print("{0}Unknown memory profile: {2}{1}".format(
+            bcolors.FAIL, bcolors.ENDC, name))
+        name = 'default'
+    profile = dict(PROFILES[name], name=name)
+    profile.update(config)
+    # 0 is the default stack size of the platform, so a profile without a
+    # stack size resets the one of a previous profile
+    try:
+        threading.stack_size(int(profile['thread_stack_kb']) * 1024)
+    except (ValueError, threading.ThreadError) as e:
+        print("{0}Thread stack size: {2}{1}".format(
+            bcolors.FAIL, bcolors.ENDC, str(e)))
+    _profile = profile
+    return profile
+
+
+def getProfile():
+    """ Returns the values of the selected memory profile """
+
+    return _profile
+
+
+class LRUCache():
+    """ Dictionary that keeps at most maxEntries items. When it is full
+    the least recently used item is removed. The default size is the
+    cache_entries of the memory profile.
+    """
+
+    def __init__(self, maxEntries=None):
+        if maxEntries is None:
+            maxEntries = getProfile()['cache_entries']
+        self.maxEntries = max(1, int(maxEntries))
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                return default
+            value = self.items.pop(key)
+            self.items[key] = value
+            return value
+
+    def __getitem__(self, key):
+        with self.lock:
+            value = self.items.pop(key)
+            self.items[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value
+            while len(self.items) > self.maxEntries:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.items.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
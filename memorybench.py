@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+""" Measures the peak memory (RSS) of the alarm with a synthetic workload:
+Workers for several users with many sensors and a long log file, sensor
+events and log queries, e.g.:
+    python memorybench.py --users 3 --sensors 50 --lines 200000 \\
+        --profile low --budget 80
+It exits with an error when the peak is over the budget in MB.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import memory
+
+
+def peakRSS():
+    """ Returns the peak RSS of this process in MB. On Linux it is the
+        VmHWM of the process, because ru_maxrss includes the memory of the
+        parent before the exec. """
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024.0 / 1024.0
+    return peak / 1024.0
+
+
+def writeWorkload(directory, user, sensors, lines):
+    """ Writes the settings and the log file of a user. Returns their
+        paths and the uuids of the sensors. """
+
+    with open('settings_template.json') as f:
+        settings = json.load(f)
+    settings['mqtt']['enable'] = False
+    sensorIds = ['{0}-sensor-{1}'.format(user, index)
+                 for index in range(sensors)]
+    for index, sensor in enumerate(sensorIds):
+        settings['sensors'][sensor] = {
+            'type': 'MQTT', 'name': 'Sensor {0}'.format(index),
+            'enabled': True, 'online': True, 'alert': False}
+    jsonfile = os.path.join(directory, user + '.json')
+    with open(jsonfile, 'w') as f:
+        json.dump(settings, f)
+
+    logfile = os.path.join(directory, user + '.log')
+    randomizer = random.Random(user)
+    startTime = time.mktime((2018, 1, 1, 0, 0, 0, 0, 0, -1))
+    with open(logfile, 'w') as f:
+        for line in range(0, lines, 2):
+            logTime = time.strftime(
+                '%Y-%m-%d %H:%M:%S', time.localtime(startTime + line * 30))
+            if line % 1000 == 0:
+                f.write('(user_action) [{0}] Alarm activated\n'.format(
+                    logTime))
+                continue
+            index = randomizer.randrange(sensors)
+            for status in ('start', 'stop'):
+                f.write('(sensor,{0},{1}) [{2}] Sensor {3}\n'.format(
+                    status, sensorIds[index], logTime, index))
+    return jsonfile, logfile, sensorIds
+
+
+def run(users=2, sensors=50, lines=100000, events=200, profile='low'):
+    """ Runs the workload and returns the peak RSS and the threads """
+
+    memory.applyProfile({'profile': profile})
+    from Worker import Worker
+
+    directory = tempfile.mkdtemp()
+    startTime = time.time()
+    try:
+        workers = []
+        for user in range(users):
+            jsonfile, logfile, sensorIds = writeWorkload(
+                directory, 'user{0}'.format(user), sensors, lines)
+            worker = Worker(jsonfile, logfile, None,
+                            {'obj': lambda *args, **kwargs: None,
+                             'room': 'bench'})
+            workers.append((worker, sensorIds))
+        for worker, sensorIds in workers:
+            for event in range(events):
+                sensor = sensorIds[event % len(sensorIds)]
+                worker.sensorAlert(sensor)
+                worker.sensorStopAlert(sensor)
+            for query in range(10):
+                worker.getSensorsLog(limit=100, selectTypes='sensor',
+                                     filterText='Sensor {0}'.format(query))
+                worker.getSensorsLog(fromText='Alarm activated')
+                worker.getEpisodes(limit=100)
+            for chunk in worker.logs.exportSensorsLog():
+                pass
+        result = {
+            'profile': profile,
+            'users': users,
+            'sensors': sensors,
+            'lines': lines,
+            'peakRSS': round(peakRSS(), 1),
+            'threads': threading.active_count(),
+            'seconds': round(time.time() - startTime, 2)
+        }
+        for worker, sensorIds in workers:
+            worker.settingsWatcher.stop()
+            worker.runtime.cancel(owner=worker.journal)
+        return result
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the peak memory of AlarmPI')
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--sensors', type=int, default=50)
+    parser.add_argument('--lines', type=int, default=100000)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--profile', default='low',
+                        choices=sorted(memory.PROFILES))
+    parser.add_argument('--budget', type=float,
+                        help='fail if the peak RSS is over these MB')
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        result = run(args.users, args.sensors, args.lines, args.events,
+                     args.profile)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print(json.dumps(result))
+    if args.budget is not None and result['peakRSS'] > args.budget:
+        print("Peak RSS {0} MB is over the budget of {1} MB".format(
+            result['peakRSS'], args.budget))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
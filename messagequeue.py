@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+""" Message queues that connect the processes of AlarmPI.
+The url of ui.message_queue in server.json selects the backend:
+    unix:///run/alarmpi     UNIX sockets in this directory (one machine)
+    redis://localhost:6379  Redis (pip install redis)
+The Socket.IO emits of every process are published to the queue, so each
+front-end process delivers them to its own clients. The Socket.IO events
+that the front-end processes receive are sent to the process of the
+Workers on the "alarmpi-commands" channel, signed with the
+ui.message_queue_secret of server.json. Each signed message has its time
+and a random id, so a message that is captured on the queue can't be
+sent again: the old ones and the ones that were already seen are dropped.
+"""
+
+import errno
+import glob
+import hashlib
+import hmac
+import os
+import socket
+import threading
+import time
+import uuid
+
+import socketio
+
+from colors import bcolors
+import serializer
+
+MAX_MESSAGE_SIZE = 1024 * 1024
+# Seconds that a signed message is valid, the clocks of the processes
+# may differ by up to this much
+MAX_MESSAGE_AGE = 60
+
+
+class UnixSocketBus():
+    """ Publish/subscribe between the processes of one machine. Each
+    process binds a datagram socket in the directory and a message is sent
+    to all the sockets of the channel, so there is no broker to run.
+    """
+
+    def __init__(self, directory, channel):
+        self.directory = directory
+        self.channel = channel
+        self.sock = None
+        self.path = None
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        # Only the user of AlarmPI can send to the sockets
+        os.chmod(directory, 0o700)
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, MAX_MESSAGE_SIZE)
+
+    def _bind(self):
+        if self.sock is None:
+            self.path = os.path.join(self.directory, '{0}-{1}.sock'.format(
+                self.channel, uuid.uuid4().hex[:8]))
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, MAX_MESSAGE_SIZE)
+            self.sock.bind(self.path)
+
+    def publish(self, data):
+        message = serializer.dumps(data).encode('utf-8')
+        pattern = os.path.join(self.directory, self.channel + '-*.sock')
+        with self.lock:
+            for path in glob.glob(pattern):
+                try:
+                    self.sender.sendto(message, path)
+                except socket.error as e:
+                    if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                        # The process of this socket has stopped
+                        self._removeStale(path)
+                    else:
+                        print("{0}Message queue: {2}{1}".format(
+                            bcolors.FAIL, bcolors.ENDC, str(e)))
+
+    def _removeStale(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def listen(self):
+        """ Yields the messages of the channel, blocking until one is
+            published """
+
+        self._bind()
+        while True:
+            data = self.sock.recv(MAX_MESSAGE_SIZE)
+            try:
+                yield serializer.loads(data)
+            except ValueError:
+                continue
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self._removeStale(self.path)
+            self.sock = None
+
+
+class RedisBus():
+    """ Publish/subscribe through a Redis server """
+
+    def __init__(self, url, channel):
+        import redis
+        self.channel = channel
+        self.redis = redis.Redis.from_url(url)
+
+    def publish(self, data):
+        self.redis.publish(self.channel, serializer.dumps(data))
+
+    def listen(self):
+        pubsub = self.redis.pubsub()
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            if message['type'] == 'message':
+                yield serializer.loads(message['data'])
+
+    def close(self):
+        pass
+
+
+class UnixSocketManager(socketio.PubSubManager):
+    """ Socket.IO client manager on a UnixSocketBus """
+
+    name = 'unix'
+
+    def __init__(self, url, channel='socketio', write_only=False,
+                 logger=None):
+        super(UnixSocketManager, self).__init__(
+            channel=channel, write_only=write_only, logger=logger)
+        self.bus = createBus(url, channel)
+
+    def _publish(self, data):
+        self.bus.publish(data)
+
+    def _listen(self):
+        for message in self.bus.listen():
+            yield message
+
+
+class SeenMessages():
+    """ The ids of the signed messages that a process has received in the
+    last maxAge seconds, the older messages are dropped anyway """
+
+    def __init__(self, maxAge=MAX_MESSAGE_AGE):
+        self.maxAge = maxAge
+        self.lock = threading.Lock()
+        self.expiries = {}
+
+    def add(self, messageId, sentTime):
+        """ Returns False if the message was already seen """
+
+        now = time.time()
+        with self.lock:
+            for seenId, expiry in list(self.expiries.items()):
+                if expiry < now:
+                    del self.expiries[seenId]
+            if messageId in self.expiries:
+                return False
+            # The message is valid until maxAge after it was sent, or
+            # after now if the clock of the sender is behind
+            self.expiries[messageId] = max(sentTime, now) + self.maxAge
+            return True
+
+
+def signMessage(secret, data):
+    """ Returns the message of the data with its HMAC-SHA256. The signed
+        payload has the time and an id of the message. """
+
+    payload = serializer.dumps({
+        'id': uuid.uuid4().hex,
+        'time': time.time(),
+        'data': data
+    })
+    digest = hmac.new(secret.encode('utf-8'), payload.encode('utf-8'),
+                      hashlib.sha256).hexdigest()
+    return {'payload': payload, 'hmac': digest}
+
+
+def verifyMessage(secret, message, seen=None, maxAge=MAX_MESSAGE_AGE):
+    """ Returns the data of a signed message, or None if it isn't signed
+        with the secret, it was sent more than maxAge seconds ago (or
+        later than that in the future) or it is in the SeenMessages """
+
+    try:
+        payload = message['payload']
+        digest = hmac.new(secret.encode('utf-8'), payload.encode('utf-8'),
+                          hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(digest, str(message['hmac'])):
+            return None
+        signed = serializer.loads(payload)
+        if abs(time.time() - signed['time']) > maxAge:
+            return None
+        if seen is not None and not seen.add(signed['id'], signed['time']):
+            return None
+        return signed['data']
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return None
+
+
+def createBus(url, channel):
+    """ Returns the bus of a message queue url """
+
+    if url.startswith('unix://'):
+        return UnixSocketBus(url[len('unix://'):], channel)
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisBus(url, channel)
+    raise ValueError('Unsupported message queue: ' + url)
+
+
+def socketioOptions(url):
+    """ Returns the options of SocketIO for a message queue url """
+
+    if not url:
+        return {}
+    if url.startswith('unix://'):
+        return {'client_manager': UnixSocketManager(url)}
+    return {'message_queue': url}
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from colors import bcolors
+from latency import getLatencyTracer
+from runtime import getRuntime
+import serializer
+
+
+class MQTTOutbox():
+    """ Queue of the MQTT messages that are waiting to be published.
+    The messages are published from a background thread, so the sensor
+    events never wait for the broker. Retained messages are coalesced by
+    topic (only the last value is sent), so a flapping sensor doesn't send
+    every on/off to the broker. While the broker is disconnected the queue
+    is kept up to maxMessages and saved to the outbox file, so that it
+    survives a restart. The file is written saveDelay seconds after the
+    first message that is queued offline (and when the connection is lost
+    or the alarm stops), not by the thread that publishes.
+    Each message carries the latency traces of the events that sent it, the
+    stage is marked when the message is handed to the MQTT client.
+    """
+
+    def __init__(self, outboxfile=None, maxMessages=1000, coalesceDelay=0.1,
+                 saveDelay=1):
+        self.outboxfile = outboxfile
+        self.maxMessages = maxMessages
+        self.coalesceDelay = coalesceDelay
+        self.saveDelay = saveDelay
+        self.condition = threading.Condition()
+        # Only one thread writes the outbox file at a time
+        self.saveLock = threading.Lock()
+        self.saveScheduled = False
+        self.pending = OrderedDict()
+        self.connected = False
+        self.client = None
+        self.counter = 0
+        self.threadPublish = None
+        self._load()
+
+    def start(self, client):
+        """ Starts publishing the messages with the MQTT client """
+
+        self.client = client
+        if self.threadPublish is None:
+            self.threadPublish = threading.Thread(target=self.runInBackground)
+            self.threadPublish.daemon = True
+            self.threadPublish.start()
+
+    def publish(self, topic, payload, qos=2, retain=True,
+                trace=None, stage=None):
+        """ Adds a message to the queue. A retained message replaces the
+            previous message of the same topic that hasn't been sent yet.
+            With a trace, the stage is marked when the message is sent. """
+
+        with self.condition:
+            if retain:
+                key = topic
+            else:
+                self.counter += 1
+                key = (topic, self.counter)
+            # The traces of a coalesced message are marked with the new one
+            _, traces = self.pending.pop(key, (None, []))
+            if trace is not None:
+                traces = traces + [(trace, stage)]
+            self.pending[key] = ((topic, payload, qos, retain), traces)
+            while len(self.pending) > self.maxMessages:
+                self.pending.popitem(last=False)
+            if not self.connected:
+                self._scheduleSave()
+            self.condition.notify()
+
+    def setConnected(self, connected):
+        """ Called when the client connects or disconnects """
+
+        with self.condition:
+            self.connected = connected
+            self.condition.notify()
+        if not connected:
+            self.save()
+
+    def runInBackground(self):
+        while True:
+            with self.condition:
+                while not (self.connected and self.pending):
+                    self.condition.wait()
+            # Wait for the messages of flapping sensors to be coalesced
+            time.sleep(self.coalesceDelay)
+            with self.condition:
+                messages = list(self.pending.items())
+                self.pending.clear()
+            for index, (key, entry) in enumerate(messages):
+                (topic, payload, qos, retain), traces = entry
+                try:
+                    result = self.client.publish(
+                        topic, payload, qos=qos, retain=retain)
+                    failed = result[0] != 0
+                except Exception as e:
+                    print("{0}MQTT: {2}{1}".format(
+                        bcolors.FAIL, bcolors.ENDC, str(e)))
+                    failed = True
+                if failed:
+                    self._requeue(messages[index:])
+                    self.setConnected(False)
+                    break
+                for trace, stage in traces:
+                    getLatencyTracer().mark(trace, stage)
+            else:
+                self._removeSaved()
+
+    def _requeue(self, messages):
+        """ Puts back the messages that couldn't be published, before the
+            ones that were added in the meantime """
+
+        with self.condition:
+            newer = list(self.pending.items())
+            self.pending.clear()
+            for key, entry in messages + newer:
+                _, traces = self.pending.pop(key, (None, []))
+                self.pending[key] = (entry[0], traces + entry[1])
+
+    def _scheduleSave(self):
+        """ Saves the queue later, called with the condition held """
+
+        if self.outboxfile is None or self.saveScheduled:
+            return
+        self.saveScheduled = getRuntime().schedule(
+            self.saveDelay, 'outbox', self.save, owner=self) is not None
+
+    def save(self):
+        """ Writes the messages that are waiting to the outbox file. The
+            messages are copied with the condition held and written
+            without it, so that publish() doesn't wait for the disk. """
+
+        if self.outboxfile is None:
+            return
+        with self.saveLock:
+            with self.condition:
+                self.saveScheduled = False
+                messages = [message for message, _ in self.pending.values()]
+            try:
+                if not messages:
+                    if os.path.exists(self.outboxfile):
+                        os.remove(self.outboxfile)
+                    return
+                tmpfile = self.outboxfile + '.tmp'
+                with open(tmpfile, 'w') as f:
+                    f.write(serializer.dumps(messages))
+                os.rename(tmpfile, self.outboxfile)
+            except (IOError, OSError) as e:
+                print("{0}MQTT Outbox: {2}{1}".format(
+                    bcolors.FAIL, bcolors.ENDC, str(e)))
+
+    def _removeSaved(self):
+        if self.outboxfile is None:
+            return
+        with self.saveLock:
+            with self.condition:
+                if self.pending or not os.path.exists(self.outboxfile):
+                    return
+                os.remove(self.outboxfile)
+
+    def _load(self):
+        if self.outboxfile is None or not os.path.exists(self.outboxfile):
+            return
+        try:
+            with open(self.outboxfile) as f:
+                messages = serializer.loads(f.read())
+        except (IOError, OSError, ValueError):
+            return
+        # The messages are already in the file
+        self.saveScheduled = True
+        for topic, payload, qos, retain in messages:
+            self.publish(topic, payload, qos, retain)
+        self.saveScheduled = False
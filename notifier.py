@@ -5,33 +5,52 @@ import threading
 import time
 from datetime import datetime
 from colors import bcolors
-import paho.mqtt.client as mqtt
+from mqttoutbox import MQTTOutbox
+from latency import getLatencyTracer
 import random
 
 
+def createMQTTClient():
+    """ Returns the MQTT client. It can be replaced by a fake client,
+        e.g. by replay.py """
+
+    import paho.mqtt.client as mqtt
+    return mqtt.Client(client_id=str(random.randint(1,10000)), clean_session=False)
+
+
 class Notify():
 
-    def __init__(self, settings):
+    def __init__(self, settings, outboxfile=None):
         self.settings = settings
+        self.outbox = MQTTOutbox(outboxfile)
         self.deactivateAlarm = lambda:0
         self.activateAlarm = lambda:0
         self.sensorAlert = lambda:0
         self.sensorStopAlert = lambda:0
+        self.sensorHeartbeat = lambda:0
+        self.sensorAvailability = lambda:0
+        self.messageReceived = lambda topic, message: 0
+        self.availabilityTopics = {}
 
     def setupUpdateUI(self, optsUpdateUI):
         self.optsUpdateUI = optsUpdateUI
         return self.updateUI
 
-    def updateUI(self, event, data):
-        """ Send changes to the UI """
-        self.optsUpdateUI['obj'](event, data, room=self.optsUpdateUI['room'])
+    def updateUI(self, event, data, room=None):
+        """ Send changes to the UI. By default it is sent to all the
+            clients of the user, unless a specific room is given """
+        if room is None:
+            room = self.optsUpdateUI['room']
+        self.optsUpdateUI['obj'](event, data, room=room)
 
     def setupSendStateMQTT(self):
-        """ Start or Stop the MQTT connection based on the settings """
+        """ Start or Stop the MQTT connection based on the settings.
+            The connection is made in the background, so that an unreachable
+            broker doesn't block the startup. """
 
         # self.mqttclient = mqtt.Client("", True, None, mqtt.MQTTv311)
         if not hasattr(self, 'mqttclient'):
-            self.mqttclient = mqtt.Client(client_id=str(random.randint(1,10000)), clean_session=False)
+            self.mqttclient = createMQTTClient()
 
 
         self.mqttclient.disconnect()
@@ -41,22 +60,18 @@ class Notify():
                 mqttHost = self.settings['mqtt']['host']
                 mqttPort = self.settings['mqtt']['port']
                 self.mqttclient.on_message = self.on_message_mqtt
+                self.mqttclient.on_connect = self.on_connect_mqtt
+                self.mqttclient.on_disconnect = self.on_disconnect_mqtt
+                self.mqttclient.will_set(
+                    self.settings['mqtt']['state_topic'] + '/availability',
+                    'offline', qos=1, retain=True)
                 if (self.settings['mqtt']['password'] != ""):
                     self.mqttclient.username_pw_set(
                         username=self.settings['mqtt']['username'],
                         password=self.settings['mqtt']['password'])
-                self.mqttclient.connect(mqttHost, mqttPort, 10)
+                self.mqttclient.connect_async(mqttHost, mqttPort, 10)
                 self.mqttclient.loop_start()
-                print('MQTT subscribing to: {0}'.format(self.settings['mqtt']['command_topic']))
-                self.mqttclient.subscribe(self.settings['mqtt']['command_topic'])
-                for sensor, sensorvalue in self.settings['sensors'].items():
-                    setmqttsensor = '{0}{1}{2}'.format(
-                        self.settings['mqtt']['command_topic'],
-                        '/sensor/',
-                        sensorvalue['name'].lower().replace(' ', '_'))
-                    print('MQTT subscribing to: {0}'.format(setmqttsensor))
-                    self.mqttclient.subscribe(setmqttsensor)
-
+                self.outbox.start(self.mqttclient)
             except Exception as e:
                 print("{0}MQTT: {2}{1}".format(
                     bcolors.FAIL, bcolors.ENDC, str(e)))
@@ -66,9 +81,77 @@ class Notify():
 
         # return self.sendStateMQTT
 
-    def sendStateMQTT(self):
+    def on_connect_mqtt(self, mqttclient, userdata, flags, rc):
+        """ Subscribe to the command topics and send the state of the alarm
+            and the sensors every time the connection to the MQTT server
+            is made """
+
+        if rc != 0:
+            print("{0}MQTT: Connection refused with code {2}{1}".format(
+                bcolors.FAIL, bcolors.ENDC, rc))
+            return
+        print('MQTT subscribing to: {0}'.format(self.settings['mqtt']['command_topic']))
+        self.mqttclient.subscribe(self.settings['mqtt']['command_topic'])
+        for sensor, sensorvalue in self.settings['sensors'].items():
+            self.subscribeSensor(sensor, sensorvalue)
+        self.outbox.publish(
+            self.settings['mqtt']['state_topic'] + '/availability',
+            'online', qos=1, retain=True)
+        self.sendStateMQTT()
+        self.sendSensorsStateMQTT()
+        self.outbox.setConnected(True)
+
+    def on_disconnect_mqtt(self, mqttclient, userdata, rc):
+        """ Keep the messages in the outbox until the connection is made """
+
+        self.outbox.setConnected(False)
+
+    def _sensorCommandTopic(self, sensorvalue):
+        return '{0}{1}{2}'.format(
+            self.settings['mqtt']['command_topic'],
+            '/sensor/',
+            sensorvalue['name'].lower().replace(' ', '_'))
+
+    def sensorTopics(self, sensorvalue):
+        """ Returns the topics that are subscribed for a sensor """
+
+        topics = [self._sensorCommandTopic(sensorvalue)]
+        if sensorvalue.get('availability_topic'):
+            topics.append(sensorvalue['availability_topic'])
+        return topics
+
+    def subscribeSensor(self, sensor, sensorvalue):
+        """ Subscribe to the command and availability topics of a sensor.
+            The retained messages of these topics restore the state of
+            the sensor on startup. """
+
+        if sensorvalue.get('availability_topic'):
+            self.availabilityTopics[sensorvalue['availability_topic']] = sensor
+        if self.settings['mqtt']['enable'] and hasattr(self, 'mqttclient'):
+            for setmqttsensor in self.sensorTopics(sensorvalue):
+                print('MQTT subscribing to: {0}'.format(setmqttsensor))
+                self.mqttclient.subscribe(setmqttsensor)
+
+    def unsubscribeSensor(self, sensor, sensorvalue):
+        """ Unsubscribe from the command and availability topics of
+            a sensor """
+
+        self.availabilityTopics.pop(sensorvalue.get('availability_topic'), None)
+        if self.settings['mqtt']['enable'] and hasattr(self, 'mqttclient'):
+            for setmqttsensor in self.sensorTopics(sensorvalue):
+                print('MQTT unsubscribing from: {0}'.format(setmqttsensor))
+                self.mqttclient.unsubscribe(setmqttsensor)
+
+    def _getQoS(self, messageClass):
+        """ Returns the QoS of the messages for the state of the alarm
+            (state) or for the state of the sensors (sensor) """
+
+        return int(self.settings['mqtt'].get('qos', {}).get(messageClass, 2))
+
+    def sendStateMQTT(self, trace=None):
         """ Send to the MQTT server the state of the alarm
-            (disarmed, triggered, armed_away) """
+            (disarmed, triggered, armed_away). The trace gets the
+            sendStateMQTT stage when the message is published """
         if self.settings['mqtt']['enable']:
             stateTopic = self.settings['mqtt']['state_topic']
             state = 'disarmed'
@@ -76,11 +159,22 @@ class Notify():
                 state = 'triggered'
             elif self.settings['settings']['alarmArmed']:
                 state = 'armed_away'
-            self.mqttclient.publish(stateTopic, state, retain=True, qos=2)
+            self.outbox.publish(stateTopic, state,
+                                qos=self._getQoS('state'), retain=True,
+                                trace=trace, stage='sendStateMQTT')
 
     def sendSensorMQTT(self, topic, state):
         if self.settings['mqtt']['enable']:
-            self.mqttclient.publish(topic, state, retain=True, qos=2)
+            self.outbox.publish(topic, state,
+                                qos=self._getQoS('sensor'), retain=True)
+
+    def sendSensorsStateMQTT(self):
+        """ Send to the MQTT server the state of all the sensors """
+        for sensor, sensorvalue in self.settings['sensors'].items():
+            stateTopic = self.settings['mqtt']['state_topic'] + \
+                '/sensor/' + sensorvalue['name']
+            self.sendSensorMQTT(
+                stateTopic, 'on' if sensorvalue.get('alert') else 'off')
 
     def updateSettings(self, settings):
         self.settings = settings
@@ -92,24 +186,34 @@ class Notify():
         topicArm = self.settings['mqtt']['command_topic']
         topicSensorSet = self.settings['mqtt']['command_topic'] + '/sensor/'
         print(msg.topic + " " + message)
-        try:
-            if msg.topic == self.settings['mqtt']['command_topic']:
-                if message == "DISARM":
-                    self.deactivateAlarm()
-                elif message == "ARM_HOME":
-                    self.activateAlarm('home')
-                elif message == "ARM_AWAY":
-                    self.activateAlarm('away')
-            elif topicSensorSet in msg.topic:
-                sensorName = msg.topic.replace(topicSensorSet, '')
-                for sensor, sensorvalue in self.settings['sensors'].items():
-                    if sensorvalue['name'].lower().replace(' ', '_') == sensorName:
-                        if message.lower() == 'on':
-                            self.sensorAlert(sensor)
-                        else:
-                            self.sensorStopAlert(sensor)
-        except Exception as e:
-            raise e
+        self.messageReceived(msg.topic, message)
+        # The latency of the alarm is measured from here for MQTT sensors
+        with getLatencyTracer().traceEvent('mqtt'):
+            try:
+                if msg.topic == self.settings['mqtt']['command_topic']:
+                    if message == "DISARM":
+                        self.deactivateAlarm()
+                    elif message == "ARM_HOME":
+                        self.activateAlarm('home')
+                    elif message == "ARM_AWAY":
+                        self.activateAlarm('away')
+                elif msg.topic in self.availabilityTopics:
+                    sensor = self.availabilityTopics[msg.topic]
+                    sensorvalue = self.settings['sensors'].get(sensor, {})
+                    self.sensorAvailability(
+                        sensor, message == sensorvalue.get(
+                            'payload_available', 'online'))
+                elif topicSensorSet in msg.topic:
+                    sensorName = msg.topic.replace(topicSensorSet, '')
+                    for sensor, sensorvalue in self.settings['sensors'].items():
+                        if sensorvalue['name'].lower().replace(' ', '_') == sensorName:
+                            self.sensorHeartbeat(sensor)
+                            if message.lower() == 'on':
+                                self.sensorAlert(sensor)
+                            else:
+                                self.sensorStopAlert(sensor)
+            except Exception as e:
+                raise e
 
     def on_disarm_mqtt(self, callback):
         self.deactivateAlarm = callback
@@ -123,3 +227,12 @@ class Notify():
     def on_sensor_set_stopalert(self, callback):
         self.sensorStopAlert = callback
 
+    def on_sensor_heartbeat(self, callback):
+        self.sensorHeartbeat = callback
+
+    def on_sensor_availability(self, callback):
+        self.sensorAvailability = callback
+
+    def on_message_received(self, callback):
+        self.messageReceived = callback
+
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+""" Replays a trace recorded with the "trace" option of server.json into
+a Worker with fake sensors, MQTT client and Socket.IO, e.g.:
+    python replay.py trace.log --speed 10
+The events are sent at their recorded times (1x), N times faster or as
+fast as possible (--speed max), and the logs get the time of the trace
+from a virtual clock. At the end it prints how long the Worker needed for
+each event and how far behind the trace it fell.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import notifier
+import tracer
+from colors import bcolors
+from sensordrivers import registerDriver
+from sensordrivers.base import SensorDriver
+from Worker import Worker
+
+monotonic = tracer.monotonic
+
+
+class sensorReplay(SensorDriver):
+    """ Sensor driver that only reports the events of the trace """
+
+    def add_sensor(self, sensor, settings=None):
+        self.online = True
+
+
+class FakeMQTTMessage():
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload.encode('utf-8')
+
+
+class FakeMQTTClient():
+    """ Connects immediately and keeps the published messages """
+
+    def __init__(self):
+        self.on_message = None
+        self.on_connect = None
+        self.on_disconnect = None
+        self.subscriptions = set()
+        self.published = 0
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        self.on_connect(self, None, {}, 0)
+
+    def disconnect(self):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self, force=False):
+        pass
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        pass
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def subscribe(self, topic):
+        self.subscriptions.add(topic)
+
+    def unsubscribe(self, topic):
+        self.subscriptions.discard(topic)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+        return (0, self.published)
+
+
+class FakeSocketIO():
+    """ Counts the events that are sent to the UI """
+
+    def __init__(self):
+        self.events = {}
+
+    def emit(self, event, data, room=None):
+        self.events[event] = self.events.get(event, 0) + 1
+
+
+class VirtualClock():
+    """ Maps the time of the trace to the real time. With speed None the
+        events are not delayed at all. """
+
+    def __init__(self, startTime, speed=1.0):
+        self.startTime = startTime
+        self.speed = speed
+        self.elapsed = 0
+        self.realStart = monotonic()
+
+    def waitUntil(self, elapsed):
+        """ Sleeps until the time of the event and returns how many
+            seconds the replay is behind the trace """
+
+        self.elapsed = elapsed
+        if self.speed is None:
+            return 0
+        delay = self.realStart + elapsed / self.speed - monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            return 0
+        return -delay
+
+    def now(self, tz=None):
+        return datetime.fromtimestamp(self.startTime + self.elapsed, tz)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class Replay():
+    """ Creates a Worker in a temporary directory with the settings of
+    the trace. The sensors are replaced by replay drivers, mail, VoIP and
+    serene are disabled and the MQTT client and Socket.IO are fakes.
+    """
+
+    def __init__(self, tracefile, speed=1.0):
+        self.tracefile = tracefile
+        self.speed = speed
+        self.header, self.events = tracer.readTrace(tracefile)
+        settings = self.header['settings']
+        settings['mail']['enable'] = False
+        settings['voip']['enable'] = False
+        settings['serene']['enable'] = False
+        for sensorvalue in settings['sensors'].values():
+            sensorvalue['type'] = 'Replay'
+        registerDriver('Replay', sensorReplay)
+
+        self.workdir = tempfile.mkdtemp(prefix='alarmpi-replay-')
+        jsonfile = os.path.join(self.workdir, 'settings.json')
+        with open(jsonfile, 'w') as f:
+            json.dump(settings, f)
+        self.socketio = FakeSocketIO()
+        self.mqttclient = FakeMQTTClient()
+        self._createMQTTClient = notifier.createMQTTClient
+        notifier.createMQTTClient = lambda: self.mqttclient
+        self.worker = Worker(
+            jsonfile,
+            os.path.join(self.workdir, 'alert.log'),
+            None,
+            {'obj': self.socketio.emit, 'room': 'replay'})
+        self.worker.settingsWatcher.stop()
+        self.clock = VirtualClock(self.header['time'], speed)
+        self.worker.now = self.clock.now
+
+    def dispatch(self, kind, sensor, data):
+        """ Sends an event to the Worker the way the real source does.
+            Returns False if the sensor of the event doesn't exist. """
+
+        if kind == tracer.MQTT_MESSAGE:
+            self.worker.mynotify.on_message_mqtt(
+                self.mqttclient, None, FakeMQTTMessage(*data))
+            return True
+        sensorObject = self.worker.sensors.get_all_sensors().get(sensor)
+        if sensorObject is None:
+            return False
+        driver = sensorObject['obj']
+        if kind == tracer.SENSOR_ALERT:
+            driver._notify_alert()
+        elif kind == tracer.SENSOR_ALERT_STOP:
+            driver._notify_alert_stop()
+        elif kind == tracer.SENSOR_ERROR:
+            driver._notify_error()
+        elif kind == tracer.SENSOR_ERROR_STOP:
+            driver._notify_error_stop()
+        return True
+
+    def run(self):
+        """ Replays all the events and returns the statistics """
+
+        times = []
+        kinds = {}
+        skipped = 0
+        maxLag = 0
+        elapsed = 0
+        realStart = monotonic()
+        for elapsed, kind, sensor, data in self.events:
+            maxLag = max(maxLag, self.clock.waitUntil(elapsed))
+            eventStart = monotonic()
+            if not self.dispatch(kind, sensor, data):
+                skipped += 1
+                continue
+            times.append(monotonic() - eventStart)
+            kinds[kind] = kinds.get(kind, 0) + 1
+        realTime = monotonic() - realStart
+        return {
+            'events': len(times),
+            'skipped': skipped,
+            'kinds': kinds,
+            'traceTime': elapsed,
+            'realTime': realTime,
+            'eventsPerSecond': len(times) / realTime if realTime else 0,
+            'maxLag': maxLag,
+            'eventTime': {
+                'mean': sum(times) / len(times) if times else 0,
+                'p50': percentile(times, 50),
+                'p95': percentile(times, 95),
+                'p99': percentile(times, 99),
+                'max': max(times) if times else 0
+            },
+            'uiEvents': dict(self.socketio.events),
+            'mqttPublished': self.mqttclient.published
+        }
+
+    def close(self):
+        self.worker.close()
+        notifier.createMQTTClient = self._createMQTTClient
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def printStats(stats):
+    print("{0}Replayed {2} events ({3} skipped) of {4:.1f}s "
+          "in {5:.1f}s, {6:.0f} events/s, max lag {7:.3f}s{1}".format(
+              bcolors.OKGREEN, bcolors.ENDC, stats['events'],
+              stats['skipped'], stats['traceTime'], stats['realTime'],
+              stats['eventsPerSecond'], stats['maxLag']))
+    print("Event time (ms): " + ", ".join(
+        "{0} {1:.2f}".format(name, stats['eventTime'][name] * 1000)
+        for name in ('mean', 'p50', 'p95', 'p99', 'max')))
+    print("Events: " + json.dumps(stats['kinds'], sort_keys=True))
+    print("UI events: " + json.dumps(stats['uiEvents'], sort_keys=True))
+    print("MQTT published: {0}".format(stats['mqttPublished']))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay a trace of AlarmPI events')
+    parser.add_argument('tracefile')
+    parser.add_argument('--speed', default='1',
+                        help='times faster than the trace or "max"')
+    parser.add_argument('--quiet', action='store_true',
+                        help="don't print the messages of the Worker")
+    args = parser.parse_args()
+    speed = None if args.speed == 'max' else float(args.speed)
+
+    replay = Replay(args.tracefile, speed)
+    stdout = sys.stdout
+    if args.quiet:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        stats = replay.run()
+    finally:
+        sys.stdout = stdout
+        replay.close()
+    printStats(stats)
+
+
+if __name__ == '__main__':
+    main()
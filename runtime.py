@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from collections import deque
+
+from colors import bcolors
+from memory import getProfile
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class Task():
+    """ A function that runs on the pool of the Runtime. The class of the
+    task (e.g. "mail") is used for the statistics and the owner (e.g. the
+    Worker) to cancel all its tasks together.
+    """
+
+    def __init__(self, taskClass, function, args=(), owner=None,
+                 interval=None):
+        self.taskClass = taskClass
+        self.function = function
+        self.args = args
+        self.owner = owner
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        """ The task won't start if it hasn't started yet and it won't
+            be repeated """
+
+        self.cancelled = True
+
+
+class Runtime():
+    """ Runs the background work of the alarm on a bounded pool of threads.
+    The threads are started when they are needed, up to maxWorkers, and at
+    most maxQueued tasks wait for a free thread. The delayed and repeated
+    tasks are kept in a heap by their due time (monotonic clock), so a
+    single scheduler thread waits for all of them.
+    The counters of each task class are also kept for each owner, so each
+    user gets the counters of the tasks of its Worker.
+    """
+
+    def __init__(self, maxWorkers=4, maxQueued=100):
+        self.maxWorkers = maxWorkers
+        self.maxQueued = maxQueued
+        self.lock = threading.Lock()
+        self.workAvailable = threading.Condition(self.lock)
+        self.timersChanged = threading.Condition(self.lock)
+        self.queue = deque()
+        self.scheduled = []
+        self.sequence = itertools.count()
+        self.workers = []
+        self.idleWorkers = 0
+        self.busyWorkers = 0
+        self.running = True
+        self.threadScheduler = None
+        self.classStats = {}
+        self.ownerStats = weakref.WeakKeyDictionary()
+
+    def _stats(self, classStats, taskClass):
+        stats = classStats.get(taskClass)
+        if stats is None:
+            stats = dict.fromkeys(('submitted', 'completed', 'failed',
+                                   'cancelled', 'rejected', 'running'), 0)
+            stats['time'] = 0.0
+            classStats[taskClass] = stats
+        return stats
+
+    def _count(self, task, counter, value=1):
+        """ Adds to a counter of the class of the task and of its owner.
+            Must be called with the lock. """
+
+        self._stats(self.classStats, task.taskClass)[counter] += value
+        if task.owner is None:
+            return
+        try:
+            classStats = self.ownerStats.get(task.owner)
+            if classStats is None:
+                classStats = self.ownerStats[task.owner] = {}
+        except TypeError:
+            # Only the totals are kept for an owner that has no weakref
+            return
+        self._stats(classStats, task.taskClass)[counter] += value
+
+    def submit(self, taskClass, function, args=(), owner=None):
+        """ Runs the function on the pool. Returns the task, or None if
+            the queue is full or the runtime has been shut down. """
+
+        task = Task(taskClass, function, args, owner)
+        with self.lock:
+            if not self._enqueue(task):
+                return None
+        return task
+
+    def schedule(self, delay, taskClass, function, args=(), owner=None,
+                 interval=None):
+        """ Runs the function on the pool after delay seconds and, with an
+            interval, every interval seconds after that """
+
+        task = Task(taskClass, function, args, owner, interval)
+        with self.lock:
+            if not self.running:
+                return None
+            heapq.heappush(self.scheduled,
+                           (monotonic() + delay, next(self.sequence), task))
+            if self.threadScheduler is None:
+                self.threadScheduler = threading.Thread(
+                    target=self._runScheduler, name='runtime-scheduler')
+                self.threadScheduler.daemon = True
+                self.threadScheduler.start()
+            self.timersChanged.notify()
+        return task
+
+    def cancel(self, owner=None, taskClass=None):
+        """ Cancels the waiting and scheduled tasks of an owner and/or of
+            a class. The tasks that are already running are not stopped. """
+
+        cancelled = 0
+        with self.lock:
+            for task in list(self.queue) + [timer[2]
+                                            for timer in self.scheduled]:
+                if ((owner is None or task.owner is owner) and
+                        (taskClass is None or task.taskClass == taskClass) and
+                        not task.cancelled):
+                    task.cancel()
+                    cancelled += 1
+        return cancelled
+
+    def _enqueue(self, task):
+        """ Adds a task to the queue, starting a thread if none is idle.
+            Must be called with the lock. """
+
+        if not self.running or len(self.queue) >= self.maxQueued:
+            self._count(task, 'rejected')
+            print("{0}Runtime: rejected {2} task, {3} tasks waiting{1}".format(
+                bcolors.WARNING, bcolors.ENDC, task.taskClass,
+                len(self.queue)))
+            return False
+        self._count(task, 'submitted')
+        self.queue.append(task)
+        if self.idleWorkers == 0 and len(self.workers) < self.maxWorkers:
+            worker = threading.Thread(
+                target=self._runWorker,
+                name='runtime-worker-{0}'.format(len(self.workers)))
+            worker.daemon = True
+            self.workers.append(worker)
+            worker.start()
+        self.workAvailable.notify()
+        return True
+
+    def _runWorker(self):
+        while True:
+            with self.lock:
+                self.idleWorkers += 1
+                while self.running and not self.queue:
+                    self.workAvailable.wait()
+                self.idleWorkers -= 1
+                if not self.queue:
+                    return
+                task = self.queue.popleft()
+                if task.cancelled:
+                    self._count(task, 'cancelled')
+                    continue
+                self._count(task, 'running')
+                self.busyWorkers += 1
+            startTime = monotonic()
+            failed = False
+            try:
+                task.function(*task.args)
+            except Exception as e:
+                failed = True
+                print("{0}Runtime: {2} task failed: {3}{1}".format(
+                    bcolors.FAIL, bcolors.ENDC, task.taskClass, str(e)))
+            with self.lock:
+                self._count(task, 'running', -1)
+                self.busyWorkers -= 1
+                self._count(task, 'failed' if failed else 'completed')
+                self._count(task, 'time', monotonic() - startTime)
+
+    def _runScheduler(self):
+        with self.lock:
+            while self.running:
+                if not self.scheduled:
+                    self.timersChanged.wait()
+                    continue
+                dueTime, sequence, task = self.scheduled[0]
+                delay = dueTime - monotonic()
+                if delay > 0:
+                    self.timersChanged.wait(delay)
+                    continue
+                heapq.heappop(self.scheduled)
+                if task.cancelled:
+                    self._count(task, 'cancelled')
+                    continue
+                if task.interval is not None:
+                    heapq.heappush(self.scheduled, (
+                        dueTime + task.interval, next(self.sequence), task))
+                self._enqueue(task)
+
+    def getStats(self, owners=None):
+        """ Returns the number of threads and tasks and the counters of
+            each task class. With owners, the counters are only the ones
+            of their tasks. """
+
+        with self.lock:
+            if owners is None:
+                classes = dict((taskClass, dict(stats)) for taskClass, stats
+                               in self.classStats.items())
+            else:
+                classes = {}
+                for owner in owners:
+                    for taskClass, stats in self.ownerStats.get(
+                            owner, {}).items():
+                        total = self._stats(classes, taskClass)
+                        for counter, value in stats.items():
+                            total[counter] += value
+            return {
+                'workers': len(self.workers),
+                'maxWorkers': self.maxWorkers,
+                'busy': self.busyWorkers,
+                'queued': len(self.queue),
+                'scheduled': len(self.scheduled),
+                'classes': classes
+            }
+
+    def shutdown(self, timeout=10):
+        """ Stops accepting tasks, drops the scheduled ones and waits up to
+            timeout seconds for the queued and running tasks to finish """
+
+        with self.lock:
+            self.running = False
+            for dueTime, sequence, task in self.scheduled:
+                self._count(task, 'cancelled')
+            self.scheduled = []
+            self.workAvailable.notify_all()
+            self.timersChanged.notify_all()
+            workers = list(self.workers)
+        endTime = monotonic() + timeout
+        for worker in workers:
+            worker.join(max(0, endTime - monotonic()))
+
+
+_runtime = None
+_runtimeLock = threading.Lock()
+
+
+def getRuntime():
+    """ Returns the runtime that is shared by all the Workers """
+
+    global _runtime
+    with _runtimeLock:
+        if _runtime is None:
+            _runtime = Runtime(maxWorkers=getProfile()['runtime_workers'])
+    return _runtime
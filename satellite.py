@@ -0,0 +1,561 @@
+#!/usr/bin/env python
+
+""" Satellite nodes run only the sensor drivers on a remote Pi and forward
+the events of their sensors to a central AlarmPI, e.g.:
+    python satellite.py satellite.json --central 192.168.1.10:8765 \\
+        --node garage --password secret
+The central AlarmPI listens when server.json has a "satellite" section and
+the sensors of a node are added to it with the type "Satellite".
+
+The link is a TCP connection with one json message on each line:
+    central {"type": "challenge", "nonce": "9c1e..."}
+    node    {"type": "hello", "node": "garage", "session": "4f2a...",
+             "hmac": "<HMAC-SHA256 of nonce, node and session>"}
+    central {"type": "welcome", "ack": 12}
+    node    {"type": "events", "events": [[13, "<sensor uuid>", "A"], ...]}
+    central {"type": "ack", "ack": 13}
+    node    {"type": "ping"}, answered with an ack
+The events are numbered and the node keeps them until the central
+acknowledges them. After a reconnection the welcome has the last event
+that the central applied, so the node sends again only the rest and no
+event is lost or applied twice. The session changes when the node
+restarts and its numbering starts again.
+The password never goes over the link: the node signs a random nonce of
+the central with it, so a captured hello can't be used again.
+"""
+
+import argparse
+import binascii
+import hashlib
+import hmac
+import itertools
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from colors import bcolors
+from sensors import Sensor
+import serializer
+import tracer
+
+monotonic = tracer.monotonic
+
+DEFAULT_PORT = 8765
+MAX_LINE_SIZE = 1024 * 1024
+MAX_RECONNECT_DELAY = 30
+
+SENSOR_EVENTS = tracer.SENSOR_EVENTS
+STRING_TYPES = (str, type(u''))
+
+
+def _sendMessage(wfile, message):
+    wfile.write(serializer.dumps(message).encode('utf-8') + b'\n')
+    wfile.flush()
+
+
+def _readMessage(rfile):
+    """ Returns the next message, or None when the connection is closed """
+
+    line = rfile.readline(MAX_LINE_SIZE)
+    if not line:
+        return None
+    if not line.endswith(b'\n'):
+        raise ValueError('Message too long')
+    return serializer.loads(line)
+
+
+def _samePassword(password, expected):
+    return hmac.compare_digest(
+        (password or '').encode('utf-8'), (expected or '').encode('utf-8'))
+
+
+def _signChallenge(password, nonce, node, session):
+    """ Returns the answer of a node to the challenge of the central """
+
+    message = u'\n'.join((nonce, node, session)).encode('utf-8')
+    return hmac.new(password.encode('utf-8'), message,
+                    hashlib.sha256).hexdigest()
+
+
+class SatelliteNode():
+    """ Runs the sensors of a satellite and sends their events to the
+    central AlarmPI. The events wait in a queue until they are
+    acknowledged, so they survive the disconnections (the oldest are
+    dropped after maxQueued). The events that come within batchDelay are
+    sent together, up to batchSize in one message.
+    """
+
+    def __init__(self, settings, host, port=DEFAULT_PORT, node=None,
+                 password='', batchSize=100, batchDelay=0.05,
+                 pingInterval=10, maxQueued=10000):
+        self.settings = settings
+        self.host = host
+        self.port = port
+        self.node = node or socket.gethostname()
+        self.password = password
+        self.batchSize = batchSize
+        self.batchDelay = batchDelay
+        self.pingInterval = pingInterval
+        self.maxQueued = maxQueued
+        self.session = uuid.uuid4().hex
+
+        self.lock = threading.Condition()
+        self.queue = deque()
+        self.sequence = 0
+        self.sentSequence = 0
+        self.states = {}
+        self.stats = dict.fromkeys(
+            ('sent', 'batches', 'acknowledged', 'dropped', 'connections'), 0)
+        self.sensors = None
+        self.sock = None
+        self.wfile = None
+        self.connected = False
+        self.running = False
+        self.stopped = threading.Event()
+        self.threadSend = None
+
+    def startSensors(self):
+        """ Starts the drivers of the sensors in the settings """
+
+        self.sensors = Sensor()
+        self.sensors.on_alert(self._recordCallback(tracer.SENSOR_ALERT))
+        self.sensors.on_alert_stop(
+            self._recordCallback(tracer.SENSOR_ALERT_STOP))
+        self.sensors.on_error(self._recordCallback(tracer.SENSOR_ERROR))
+        self.sensors.on_error_stop(
+            self._recordCallback(tracer.SENSOR_ERROR_STOP))
+        self.sensors.add_sensors(self.settings)
+        with self.lock:
+            for sensor, properties in self.sensors.get_all_sensors().items():
+                driver = properties['obj']
+                self.states[sensor] = {
+                    'online': driver.getOnlineStatus() is not False,
+                    'alert': driver.getAlertStatus() is True
+                }
+
+    def _recordCallback(self, kind):
+        return lambda sensor: self.record(sensor, kind)
+
+    def record(self, sensor, kind):
+        """ Queues an event (tracer.SENSOR_ALERT, ...) of a sensor """
+
+        with self.lock:
+            state = self.states.setdefault(
+                sensor, {'online': True, 'alert': False})
+            if kind in (tracer.SENSOR_ALERT, tracer.SENSOR_ALERT_STOP):
+                state['alert'] = kind == tracer.SENSOR_ALERT
+                state['online'] = True
+            elif kind == tracer.SENSOR_ERROR:
+                state['alert'] = True
+                state['online'] = False
+            else:
+                state['online'] = True
+            self._queue(sensor, kind)
+
+    def _queue(self, sensor, kind):
+        """ Adds an event to the queue. Must be called with the lock. """
+
+        self.sequence += 1
+        self.queue.append([self.sequence, sensor, kind])
+        if len(self.queue) > self.maxQueued:
+            self.queue.popleft()
+            self.stats['dropped'] += 1
+        self.lock.notify_all()
+
+    def _queueStates(self):
+        """ Queues the current state of all the sensors, the central sets
+            them offline while the node is disconnected """
+
+        with self.lock:
+            for sensor, state in self.states.items():
+                self._queue(sensor, tracer.SENSOR_ERROR_STOP
+                            if state['online'] else tracer.SENSOR_ERROR)
+                if state['online']:
+                    self._queue(sensor, tracer.SENSOR_ALERT
+                                if state['alert'] else
+                                tracer.SENSOR_ALERT_STOP)
+
+    def _pending(self):
+        """ Returns the events that haven't been sent on this connection.
+            Must be called with the lock. """
+
+        if not self.queue:
+            return []
+        start = max(0, self.sentSequence - self.queue[0][0] + 1)
+        return list(itertools.islice(
+            self.queue, start, start + self.batchSize))
+
+    def _acknowledge(self, sequence):
+        with self.lock:
+            while self.queue and self.queue[0][0] <= sequence:
+                self.queue.popleft()
+                self.stats['acknowledged'] += 1
+
+    def start(self):
+        """ Starts the sensors, if they haven't been started, and the
+            connection to the central AlarmPI """
+
+        if self.sensors is None:
+            self.startSensors()
+        self.running = True
+        self.threadSend = threading.Thread(
+            target=self._run, name='satellite-' + self.node)
+        self.threadSend.daemon = True
+        self.threadSend.start()
+
+    def _run(self):
+        delay = 1
+        while self.running:
+            try:
+                self._connect()
+                delay = 1
+                self._sendEvents()
+            except (socket.error, ValueError) as e:
+                if self.running:
+                    print("{0}Satellite: connection to {2}:{3} lost: {4}{1}"
+                          .format(bcolors.WARNING, bcolors.ENDC,
+                                  self.host, self.port, str(e)))
+            self._disconnect()
+            if self.stopped.wait(delay):
+                break
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), 10)
+        with self.lock:
+            self.sock = sock
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        rfile = sock.makefile('rb')
+        self.wfile = sock.makefile('wb')
+        challenge = _readMessage(rfile)
+        if challenge is None or challenge.get('type') != 'challenge':
+            raise ValueError((challenge or {}).get('error', 'no challenge'))
+        _sendMessage(self.wfile, {
+            'type': 'hello',
+            'node': self.node,
+            'session': self.session,
+            'hmac': _signChallenge(self.password, challenge['nonce'],
+                                   self.node, self.session)
+        })
+        welcome = _readMessage(rfile)
+        if welcome is None or welcome.get('type') != 'welcome':
+            raise ValueError((welcome or {}).get('error', 'no welcome'))
+        sock.settimeout(None)
+        self._acknowledge(welcome['ack'])
+        with self.lock:
+            self.sentSequence = welcome['ack']
+            self.connected = True
+            self.stats['connections'] += 1
+            connection = self.stats['connections']
+        print("{0}Satellite: connected to {2}:{3} as {4}{1}".format(
+            bcolors.OKGREEN, bcolors.ENDC, self.host, self.port, self.node))
+        self._queueStates()
+        threadRead = threading.Thread(
+            target=self._readAcks, args=(rfile, connection),
+            name='satellite-acks')
+        threadRead.daemon = True
+        threadRead.start()
+
+    def _readAcks(self, rfile, connection):
+        try:
+            while True:
+                message = _readMessage(rfile)
+                if message is None:
+                    break
+                if message.get('type') == 'ack':
+                    self._acknowledge(message['ack'])
+        except (socket.error, ValueError):
+            pass
+        with self.lock:
+            if self.stats['connections'] == connection:
+                self.connected = False
+            self.lock.notify_all()
+
+    def _sendEvents(self):
+        """ Sends the queued events until the connection is lost """
+
+        lastSent = monotonic()
+        while self.running:
+            with self.lock:
+                if self.connected and not self._pending():
+                    self.lock.wait(self.pingInterval)
+                if not self.connected:
+                    raise socket.error('closed by the central AlarmPI')
+                batch = self._pending()
+            if not batch:
+                if self.running and monotonic() - lastSent >= \
+                        self.pingInterval:
+                    _sendMessage(self.wfile, {'type': 'ping'})
+                    lastSent = monotonic()
+                continue
+            if len(batch) < self.batchSize and self.batchDelay:
+                # The events that come together (e.g. a zone) share a batch
+                time.sleep(self.batchDelay)
+                with self.lock:
+                    batch = self._pending()
+            with self.lock:
+                self.sentSequence = batch[-1][0]
+                self.stats['sent'] += len(batch)
+                self.stats['batches'] += 1
+            _sendMessage(self.wfile, {'type': 'events', 'events': batch})
+            lastSent = monotonic()
+
+    def _disconnect(self):
+        with self.lock:
+            self.connected = False
+            sock, self.sock = self.sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+
+    def getStats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats.update({
+                'connected': self.connected,
+                'queued': len(self.queue),
+                'sequence': self.sequence
+            })
+        return stats
+
+    def close(self):
+        """ Stops the connection and the sensors """
+
+        self.running = False
+        self.stopped.set()
+        with self.lock:
+            self.lock.notify_all()
+        self._disconnect()
+        if self.threadSend is not None:
+            self.threadSend.join(5)
+        if self.sensors is not None:
+            for sensor in list(self.sensors.get_all_sensors()):
+                self.sensors.del_sensor(sensor)
+
+
+class _SatelliteHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.satellites.handleConnection(
+            self.request, self.rfile, self.wfile)
+
+
+class _SatelliteTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SatelliteServer():
+    """ Receives the events of the satellite nodes in the central AlarmPI
+    and passes them to the Satellite sensors of the Workers. The last
+    applied event of each node is kept, so the events that a node sends
+    again after a reconnection are ignored.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.drivers = {}
+        self.states = {}
+        self.nodes = {}
+        self.password = ''
+        self.timeout = 30
+        self.server = None
+
+    def attach(self, node, sensor, driver):
+        """ Adds a driver for a sensor of a node. Returns the last state
+            of the sensor, or None if the node is not connected. """
+
+        with self.lock:
+            self.drivers.setdefault((node, sensor), []).append(driver)
+            if not self.nodes.get(node, {}).get('connected'):
+                return None
+            return dict(self.states.get((node, sensor)) or {}) or None
+
+    def detach(self, node, sensor, driver):
+        with self.lock:
+            drivers = self.drivers.get((node, sensor), [])
+            if driver in drivers:
+                drivers.remove(driver)
+            if not drivers:
+                self.drivers.pop((node, sensor), None)
+
+    def start(self, host='0.0.0.0', port=DEFAULT_PORT, password='',
+              timeout=30):
+        """ Listens for the satellite nodes. A node that sends nothing
+            for timeout seconds is disconnected (they ping every 10s).
+            Raises ValueError without a password, because the nodes can
+            change the state of the sensors. """
+
+        if not password:
+            raise ValueError("The satellite server needs a password")
+        self.password = password
+        self.timeout = timeout
+        self.server = _SatelliteTCPServer((host, port), _SatelliteHandler)
+        self.server.satellites = self
+        threadServer = threading.Thread(
+            target=self.server.serve_forever, name='satellite-server')
+        threadServer.daemon = True
+        threadServer.start()
+        print("{0}Satellite: listening on port {2}{1}".format(
+            bcolors.OKGREEN, bcolors.ENDC, self.server.server_address[1]))
+        return self.server.server_address[1]
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def handleConnection(self, sock, rfile, wfile):
+        """ Runs the protocol with a node until it disconnects """
+
+        sock.settimeout(self.timeout)
+        nonce = binascii.hexlify(os.urandom(16)).decode('ascii')
+        try:
+            _sendMessage(wfile, {'type': 'challenge', 'nonce': nonce})
+            hello = _readMessage(rfile)
+        except (socket.error, ValueError):
+            return
+        if (hello is None or hello.get('type') != 'hello' or
+                not hello.get('node') or
+                not isinstance(hello['node'], STRING_TYPES) or
+                not isinstance(hello.get('session'), STRING_TYPES) or
+                not isinstance(hello.get('hmac'), STRING_TYPES) or
+                not _samePassword(hello['hmac'], _signChallenge(
+                    self.password, nonce, hello['node'], hello['session']))):
+            _sendMessage(wfile, {'type': 'error', 'error': 'unauthorized'})
+            return
+        node = hello['node']
+        with self.lock:
+            state = self.nodes.setdefault(node, {
+                'session': None, 'ack': 0, 'connection': 0,
+                'connected': False, 'events': 0, 'batches': 0,
+                'lock': threading.Lock()
+            })
+        with state['lock']:
+            if state['session'] != hello.get('session'):
+                state['session'] = hello.get('session')
+                state['ack'] = 0
+            state['connection'] += 1
+            state['connected'] = True
+            connection = state['connection']
+        print("{0}Satellite: node {2} connected{1}".format(
+            bcolors.OKGREEN, bcolors.ENDC, node))
+        try:
+            _sendMessage(wfile, {'type': 'welcome', 'ack': state['ack']})
+            while True:
+                message = _readMessage(rfile)
+                if message is None:
+                    break
+                if message.get('type') == 'events':
+                    self._applyEvents(node, state, message['events'])
+                _sendMessage(wfile, {'type': 'ack', 'ack': state['ack']})
+        except (socket.error, ValueError, KeyError, TypeError) as e:
+            print("{0}Satellite: node {2}: {3}{1}".format(
+                bcolors.WARNING, bcolors.ENDC, node, str(e)))
+        with state['lock']:
+            if state['connection'] != connection:
+                # The node has already reconnected
+                return
+            state['connected'] = False
+        print("{0}Satellite: node {2} disconnected{1}".format(
+            bcolors.WARNING, bcolors.ENDC, node))
+        for driver in self._nodeDrivers(node):
+            driver.nodeDisconnected()
+
+    def _applyEvents(self, node, state, events):
+        with state['lock']:
+            state['batches'] += 1
+            for sequence, sensor, kind in events:
+                if sequence <= state['ack']:
+                    continue
+                state['ack'] = sequence
+                if kind not in SENSOR_EVENTS:
+                    continue
+                state['events'] += 1
+                with self.lock:
+                    sensorState = self.states.setdefault(
+                        (node, sensor), {'online': True, 'alert': False})
+                    if kind == tracer.SENSOR_ERROR:
+                        sensorState['online'] = False
+                    elif kind == tracer.SENSOR_ERROR_STOP:
+                        sensorState['online'] = True
+                    else:
+                        sensorState['alert'] = kind == tracer.SENSOR_ALERT
+                        sensorState['online'] = True
+                    drivers = list(self.drivers.get((node, sensor), []))
+                for driver in drivers:
+                    driver.satelliteEvent(kind)
+
+    def _nodeDrivers(self, node):
+        with self.lock:
+            return [driver for (driverNode, sensor), drivers
+                    in self.drivers.items() if driverNode == node
+                    for driver in drivers]
+
+    def getStats(self, nodes=None):
+        """ Returns the connection and the counters of each node, or only
+            of the given nodes """
+
+        with self.lock:
+            return dict((node, {
+                'connected': state['connected'],
+                'ack': state['ack'],
+                'events': state['events'],
+                'batches': state['batches']
+            }) for node, state in self.nodes.items()
+                if nodes is None or node in nodes)
+
+
+_satelliteServer = None
+_satelliteServerLock = threading.Lock()
+
+
+def getSatelliteServer():
+    """ Returns the satellite server that is shared by all the Workers """
+
+    global _satelliteServer
+    with _satelliteServerLock:
+        if _satelliteServer is None:
+            _satelliteServer = SatelliteServer()
+    return _satelliteServer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Forward the events of the sensors to a central AlarmPI')
+    parser.add_argument('settings', help='json file with the sensors')
+    parser.add_argument('--central', required=True,
+                        help='host:port of the central AlarmPI')
+    parser.add_argument('--node', help='name of this node (the hostname)')
+    parser.add_argument('--password', required=True)
+    args = parser.parse_args(argv)
+
+    with open(args.settings) as f:
+        settings = serializer.loads(f.read())
+    host, _, port = args.central.rpartition(':')
+    if not host:
+        host, port = args.central, DEFAULT_PORT
+    node = SatelliteNode(settings, host, int(port), args.node, args.password)
+    node.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        node.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+""" Registry of the sensor drivers.
+The drivers are registered by their sensor type with the path of their
+class ("module:class") and the module is imported only when the first
+sensor of this type is added. Drivers of other packages are discovered
+through the "alarmpi.sensors" entry points, e.g.:
+    entry_points={'alarmpi.sensors': ['Modbus = mypackage:sensorModbus']}
+"""
+
+import importlib
+
+from colors import bcolors
+
+DRIVERS = {
+    'GPIO': 'sensordrivers.gpio:sensorGPIO',
+    'Hikvision': 'sensordrivers.hikvision:sensorHikvision',
+    'MQTT': 'sensordrivers.mqtt:sensorMQTT',
+    'Satellite': 'sensordrivers.satellite:sensorSatellite',
+}
+_loadedDrivers = {}
+_entryPointsLoaded = False
+
+
+def registerDriver(sensorType, driver):
+    """ Registers a driver class, or the path of the class as
+        "module:class", for a sensor type """
+
+    DRIVERS[sensorType] = driver
+    _loadedDrivers.pop(sensorType, None)
+
+
+def _loadEntryPoints():
+    """ Adds the drivers of the alarmpi.sensors entry points """
+
+    global _entryPointsLoaded
+    _entryPointsLoaded = True
+    try:
+        from importlib.metadata import entry_points
+        entryPoints = entry_points()
+        if hasattr(entryPoints, 'select'):
+            entryPoints = entryPoints.select(group='alarmpi.sensors')
+        else:
+            entryPoints = entryPoints.get('alarmpi.sensors', [])
+    except ImportError:
+        try:
+            import pkg_resources
+            entryPoints = pkg_resources.iter_entry_points('alarmpi.sensors')
+        except ImportError:
+            entryPoints = []
+    for entryPoint in entryPoints:
+        DRIVERS.setdefault(entryPoint.name, entryPoint)
+
+
+def getDriver(sensorType):
+    """ Returns the driver class of a sensor type, importing its module
+        if it is the first time. Returns None for unknown types. """
+
+    if sensorType in _loadedDrivers:
+        return _loadedDrivers[sensorType]
+    if sensorType not in DRIVERS and not _entryPointsLoaded:
+        _loadEntryPoints()
+    driver = DRIVERS.get(sensorType)
+    if driver is None:
+        return None
+    try:
+        if isinstance(driver, str):
+            moduleName, className = driver.split(':')
+            driver = getattr(importlib.import_module(moduleName), className)
+        elif hasattr(driver, 'load'):
+            driver = driver.load()
+    except Exception as e:
+        print("{0}Failed to load the {2} sensor driver: {3}{1}".format(
+            bcolors.FAIL, bcolors.ENDC, sensorType, str(e)))
+        return None
+    _loadedDrivers[sensorType] = driver
+    return driver
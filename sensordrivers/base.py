@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+
+class SensorDriver(object):
+    """ Common interface of the sensor drivers.
+    A driver is created for each sensor with its uuid (sensorName). The
+    Sensor class calls add_sensor with the values of the sensor from the
+    settings and, if settingsKey is set, with this part of the settings
+    (e.g. the mqtt settings). The driver calls the _notify_* methods when
+    the sensor changes state.
+    """
+
+    settingsKey = None
+
+    def __init__(self, sensorName):
+        # Global Required Variables
+        self.sensorName = sensorName
+        self.online = None
+        self.alert = False
+        self._event_alert = []
+        self._event_alert_stop = []
+        self._event_error = []
+        self._event_error_stop = []
+
+    def getOnlineStatus(self):
+        return self.online
+
+    def getAlertStatus(self):
+        return self.alert
+
+    def add_sensor(self, sensor, settings=None):
+        raise NotImplementedError
+
+    def del_sensor(self):
+        pass
+
+    def reload(self, settings=None):
+        pass
+
+    def heartbeat(self):
+        """ Called when a message is received from the sensor """
+        pass
+
+    def set_availability(self, online):
+        """ Called when the sensor reports that it is online or offline """
+        pass
+
+    # ------------------------------
+    def on_alert(self, callback):
+        self._event_alert.append(callback)
+
+    def on_alert_stop(self, callback):
+        self._event_alert_stop.append(callback)
+
+    def on_error(self, callback):
+        self._event_error.append(callback)
+
+    def on_error_stop(self, callback):
+        self._event_error_stop.append(callback)
+
+    def _notify_alert(self):
+        self.alert = True
+        for callback in self._event_alert:
+            callback(self.sensorName)
+
+    def _notify_alert_stop(self):
+        self.alert = False
+        for callback in self._event_alert_stop:
+            callback(self.sensorName)
+
+    def _notify_error(self):
+        self.online = False
+        for callback in self._event_error:
+            callback(self.sensorName)
+
+    def _notify_error_stop(self):
+        self.online = True
+        for callback in self._event_error_stop:
+            callback(self.sensorName)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+try:
+    import RPi.GPIO as GPIO
+except Exception as e:
+    print(e)
+
+from colors import bcolors
+from sensordrivers.base import SensorDriver
+from latency import getLatencyTracer
+
+
+class outputGPIO():
+    def enableOutputPin(self, *pins):
+        for pin in pins:
+            GPIO.setup(pin, GPIO.OUT)
+            state = GPIO.input(pin)
+            if state == GPIO.LOW:
+                GPIO.output(pin, GPIO.HIGH)
+
+    def disableOutputPin(self, *pins):
+        for pin in pins:
+            GPIO.setup(pin, GPIO.OUT)
+            if GPIO.input(pin) == GPIO.HIGH:
+                GPIO.output(pin, GPIO.LOW)
+            GPIO.setup(pin, GPIO.IN)
+
+
+class sensorGPIO(SensorDriver):
+    def __init__(self, sensorName):
+        super(sensorGPIO, self).__init__(sensorName)
+        # GPIO Setup
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+
+        self.online = True
+        self.alert = None
+
+        # Other Variables
+        self.gpioState = None
+        self.pin = None
+
+    def setAlertStatus(self):
+        self.gpioState = GPIO.input(self.pin)
+        self.alert = False
+        if self.gpioState == 1:
+            self.alert = True
+
+    def add_sensor(self, sensor, settings=None):
+        self.pin = int(sensor['pin'])
+        GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.remove_event_detect(self.pin)
+        GPIO.add_event_detect(
+            self.pin, GPIO.BOTH,
+            callback=self._checkInputPinState,
+            bouncetime=600)
+        self._checkInputPinState(self.pin)
+        self.setAlertStatus()
+
+    def del_sensor(self):
+        GPIO.remove_event_detect(self.pin)
+
+    def _checkInputPinState(self, inputPin):
+        nowState = GPIO.input(self.pin)
+        if nowState != self.gpioState:
+            with getLatencyTracer().traceEvent('gpio', self.sensorName):
+                if nowState == 1:
+                    self._notify_alert()
+                else:
+                    self._notify_alert_stop()
+        else:
+            print("{0}GPIO {2}: Wrong state change. Ignoring!!!{1}"
+                  .format(bcolors.STRIKE, bcolors.ENDC, str(inputPin)))
+
+    # ------------------------------
+    def _notify_alert(self):
+        self.setAlertStatus()
+        for callback in self._event_alert:
+            callback(self.sensorName)
+
+    def _notify_alert_stop(self):
+        self.setAlertStatus()
+        for callback in self._event_alert_stop:
+            callback(self.sensorName)
+
+    def _notify_error(self):
+        pass
+
+    def _notify_error_stop(self):
+        pass
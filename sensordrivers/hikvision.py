@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+import threading
+import time
+import re
+
+import requests
+
+from colors import bcolors
+from runtime import getRuntime
+from latency import getLatencyTracer
+from sensordrivers.base import SensorDriver
+
+
+class sensorHikvision(SensorDriver):
+    def __init__(self, sensorName):
+        super(sensorHikvision, self).__init__(sensorName)
+
+        # Other Variables
+        self.alertTime = 8
+        self.threadRunforever = None
+        self.runforever = None
+        self.hasBeenNotified = False
+        self.sensor = None
+        self.stopTask = None
+
+    def add_sensor(self, sensor, settings=None):
+        self.sensor = sensor
+        self.reload()
+
+    def reload(self, settings=None):
+        self.runforever = False
+        ip = self.sensor['ip']
+        username = self.sensor['user']
+        password = self.sensor['pass']
+        # The stream blocks for as long as the camera is connected, so it
+        # has its own thread instead of a thread of the runtime
+        self.threadRunforever = threading.Thread(target=self.runInBackground,
+                                                 args=[self.sensor,
+                                                       ip,
+                                                       username,
+                                                       password],
+                                                 name='hikvision-stream')
+        self.threadRunforever.daemon = True
+        self.threadRunforever.start()
+        self._notify_alert_stop()
+
+    def runInBackground(self, sensor, ip, username, password):
+        self.runforever = True
+        streamURL = 'http://' + ip + '/ISAPI/Event/notification/alertStream'
+        authorization = requests.auth.HTTPBasicAuth(username, password)
+        while self.runforever:
+            try:
+                response = requests.get(streamURL,
+                                        auth=authorization,
+                                        timeout=15,
+                                        stream=True)
+                if not self.online:
+                    self._notify_error_stop()
+                for chunk in response.iter_lines():
+                    if chunk:
+                        chunk = chunk.decode("utf-8")
+                        match = re.match(r'<eventType>(.*)</eventType>', chunk)
+                        if match:
+                            if match.group(1) == 'linedetection':
+                                if not self.hasBeenNotified:
+                                    with getLatencyTracer().traceEvent(
+                                            'hikvision', self.sensorName):
+                                        self._notify_alert()
+            except Exception as e:
+                print(e)
+                if self.online:
+                    self._notify_error()
+                print("{0}Hikvision: {2}{1}".format(
+                    bcolors.FAIL, bcolors.ENDC, str(e)))
+                time.sleep(5)
+
+    def del_sensor(self):
+        self.runforever = False
+        if self.stopTask is not None:
+            self.stopTask.cancel()
+
+    # ------------------------------
+    def _notify_alert(self):
+        self.hasBeenNotified = True
+        self.alert = True
+        self.stopTask = getRuntime().schedule(
+            self.alertTime, 'hikvision', self._notify_alert_stop)
+        for callback in self._event_alert:
+            callback(self.sensorName)
+
+    def _notify_alert_stop(self):
+        self.alert = False
+        self.hasBeenNotified = False
+        for callback in self._event_alert_stop:
+            callback(self.sensorName)
+
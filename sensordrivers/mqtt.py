@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+from sensordrivers.base import SensorDriver
+from timerwheel import getTimerWheel
+
+
+class sensorMQTT(SensorDriver):
+    """ Sensor that receives its state from MQTT messages.
+    If the sensor has a timeout, it goes offline when no message has been
+    received for this number of seconds. If it has an availability_topic,
+    the online/offline messages of this topic (e.g. the Last Will of the
+    device) set it online or offline.
+    """
+
+    settingsKey = 'mqtt'
+
+    def __init__(self, sensorName):
+        super(sensorMQTT, self).__init__(sensorName)
+
+        # Other Variables
+        self.sensor = None
+        self.timeout = None
+
+    def add_sensor(self, sensor, settings=None):
+        self.sensor = sensor
+        self.timeout = float(sensor.get('timeout') or 0) or None
+        if self.timeout is not None:
+            getTimerWheel().schedule(self, self.timeout, self._expired)
+        elif not sensor.get('availability_topic'):
+            self._notify_error()
+
+    def del_sensor(self):
+        getTimerWheel().cancel(self)
+
+    def heartbeat(self):
+        """ Called on every message from the sensor """
+
+        if self.timeout is not None:
+            getTimerWheel().schedule(self, self.timeout, self._expired)
+        if self.online is not True:
+            self._notify_error_stop()
+
+    def set_availability(self, online):
+        if online:
+            self.heartbeat()
+        elif self.online is not False:
+            self._notify_error()
+
+    def _expired(self):
+        if self.online is not False:
+            self._notify_error()
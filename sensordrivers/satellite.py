@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+from sensordrivers.base import SensorDriver
+from satellite import getSatelliteServer
+import tracer
+from latency import getLatencyTracer
+
+
+class sensorSatellite(SensorDriver):
+    """ Sensor of a satellite node (see satellite.py). The node is the name
+    of the satellite and node_sensor the uuid of the sensor in the settings
+    of the satellite. The sensor is offline while the node is disconnected.
+    """
+
+    def __init__(self, sensorName):
+        super(sensorSatellite, self).__init__(sensorName)
+
+        # Other Variables
+        self.node = None
+        self.nodeSensor = None
+
+    def add_sensor(self, sensor, settings=None):
+        self.node = sensor['node']
+        self.nodeSensor = sensor['node_sensor']
+        state = getSatelliteServer().attach(self.node, self.nodeSensor, self)
+        if state is None or not state['online']:
+            self._notify_error()
+        else:
+            self.online = True
+            if state['alert']:
+                self._notify_alert()
+
+    def del_sensor(self):
+        getSatelliteServer().detach(self.node, self.nodeSensor, self)
+
+    def satelliteEvent(self, kind):
+        """ Called with the events that the node sends. The events that
+            don't change the state are the ones the node sends again after
+            a reconnection, so they are ignored. """
+
+        with getLatencyTracer().traceEvent('satellite', self.sensorName):
+            self._satelliteEvent(kind)
+
+    def _satelliteEvent(self, kind):
+        if kind == tracer.SENSOR_ALERT:
+            if self.alert is not True or self.online is not True:
+                self.online = True
+                self._notify_alert()
+        elif kind == tracer.SENSOR_ALERT_STOP:
+            if self.alert is not False or self.online is not True:
+                self.online = True
+                self._notify_alert_stop()
+        elif kind == tracer.SENSOR_ERROR:
+            if self.online is not False:
+                self._notify_error()
+        elif self.online is not True:
+            self._notify_error_stop()
+
+    def nodeDisconnected(self):
+        if self.online is not False:
+            self._notify_error()
+
+    def _notify_error(self):
+        # The alert is unknown until the node sends the state again
+        self.alert = None
+        super(sensorSatellite, self)._notify_error()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+""" Serialization of the settings, the REST responses and the Socket.IO
+payloads. It uses orjson when it is installed and the json module of the
+standard library otherwise. dumps and loads accept the arguments of
+json.dumps and json.loads, so this module can also be given to SocketIO
+as its json module.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Arguments of json.dumps that only change the formatting
+_FORMAT_OPTIONS = ('separators', 'indent', 'sort_keys', 'ensure_ascii')
+
+
+def dumps(obj, **kwargs):
+    """ Returns the compact json of an object. The formatting arguments
+        are ignored, use dumpsPretty for the files that people read. """
+
+    options = dict((key, value) for key, value in kwargs.items()
+                   if key not in _FORMAT_OPTIONS)
+    if orjson is not None and not options:
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            # e.g. keys that are not strings or very large integers
+            pass
+    options['separators'] = (',', ':')
+    return json.dumps(obj, **options)
+
+
+def dumpsPretty(obj):
+    """ Returns the json of an object indented and with sorted keys """
+
+    return json.dumps(obj, sort_keys=True, indent=4, separators=(',', ': '))
+
+
+def loads(s, **kwargs):
+    """ Returns the object of a json string """
+
+    if orjson is not None and not kwargs:
+        try:
+            return orjson.loads(s)
+        except ValueError:
+            # Let json raise its own error or accept what orjson doesn't
+            pass
+    if isinstance(s, bytes):
+        s = s.decode('utf-8')
+    return json.loads(s, **kwargs)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import threading
+import time
+
+from colors import bcolors
+from runtime import getRuntime
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+
+class SettingsWatcher():
+    """ Watches a file for changes made by other programs (e.g. an editor)
+    and calls the callback with its new content. It uses inotify on the
+    directory of the file, so that it also works with editors that replace
+    the file, and falls back to checking the modification time if inotify
+    is not available. Without useThread the modification time is checked
+    by a timer of the runtime, so that the watcher has no thread.
+    """
+
+    def __init__(self, filename, callback, pollInterval=2, useThread=True):
+        self.filename = os.path.abspath(filename)
+        self.callback = callback
+        self.pollInterval = pollInterval
+        self.useThread = useThread
+        self.running = False
+        self.lastModified = None
+
+    def start(self):
+        self.running = True
+        if not self.useThread:
+            self.lastModified = self._getModified()
+            getRuntime().schedule(self.pollInterval, 'settings', self._poll,
+                                  owner=self, interval=self.pollInterval)
+            return
+        threadWatcher = threading.Thread(target=self.runInBackground)
+        threadWatcher.daemon = True
+        threadWatcher.start()
+
+    def stop(self):
+        """ Stops calling the callback. The thread ends on the next check
+            or change of the file. """
+
+        self.running = False
+        if not self.useThread:
+            getRuntime().cancel(owner=self)
+
+    def runInBackground(self):
+        try:
+            self._watchInotify()
+        except Exception as e:
+            print("{0}Settings watcher: {2}, using polling instead{1}".format(
+                bcolors.WARNING, bcolors.ENDC, str(e)))
+            self._watchPolling()
+
+    def _watchInotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        fd = libc.inotify_init()
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        directory, name = os.path.split(self.filename)
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(fd, directory.encode(), mask) < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+        name = name.encode()
+        while self.running:
+            data = os.read(fd, 4096)
+            changed = False
+            position = 0
+            while position < len(data):
+                wd, eventMask, cookie, length = struct.unpack_from(
+                    'iIII', data, position)
+                position += struct.calcsize('iIII')
+                eventName = data[position:position + length].rstrip(b'\0')
+                position += length
+                if eventName == name:
+                    changed = True
+            if changed:
+                self._notifyChange()
+        os.close(fd)
+
+    def _watchPolling(self):
+        lastModified = self._getModified()
+        while self.running:
+            time.sleep(self.pollInterval)
+            modified = self._getModified()
+            if modified != lastModified:
+                lastModified = modified
+                self._notifyChange()
+
+    def _poll(self):
+        modified = self._getModified()
+        if modified != self.lastModified:
+            self.lastModified = modified
+            self._notifyChange()
+
+    def _getModified(self):
+        try:
+            return os.stat(self.filename).st_mtime
+        except OSError:
+            return None
+
+    def _notifyChange(self):
+        if not self.running:
+            return
+        try:
+            with open(self.filename) as f:
+                content = f.read()
+        except (IOError, OSError):
+            return
+        try:
+            self.callback(content)
+        except Exception as e:
+            print("{0}Settings watcher: {2}{1}".format(
+                bcolors.FAIL, bcolors.ENDC, str(e)))
@@ -19,5 +19,11 @@ setup(
     author_email='bkbilly@hotmail.com',
     packages=find_packages(),
     install_requires=REQUIRES,
+    extras_require={
+        'analytics': ['numpy'],
+        'loadtest': ['python-socketio[client]'],
+        'fast': ['orjson'],
+        'msgpack': ['msgpack'],
+    },
     # long_description=open('README.md').read()
 )
@@ -0,0 +1,24 @@
+import json
+import os
+import shutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def createServerConfig(directory):
+    """ Writes a server file with the users of server_template.json to the
+        directory, with their settings and log files in it, so that the
+        tests don't write into the working tree. Returns its path. """
+
+    with open(os.path.join(ROOT, 'server_template.json')) as f:
+        serverJson = json.load(f)
+    for user, properties in serverJson['users'].items():
+        properties['settings'] = os.path.join(
+            directory, user + '.settings.json')
+        properties['logfile'] = os.path.join(directory, user + '.alert.log')
+        shutil.copy(os.path.join(ROOT, 'settings_template.json'),
+                    properties['settings'])
+    serverfile = os.path.join(directory, 'server.json')
+    with open(serverfile, 'w') as f:
+        json.dump(serverJson, f)
+    return serverfile
@@ -0,0 +1,73 @@
+from analytics import LogAnalytics, importNumpy
+import unittest
+import tempfile
+import shutil
+import os
+
+LOG = """(sensor,start,door) [2018-01-01 10:00:00] Door
+(sensor,stop,door) [2018-01-01 10:01:30] Door
+(sensor,start,pir) [2018-01-01 22:00:00] Pir
+(alarm) [2018-01-01 22:00:01] Intruder Alert
+(sensor,start,door) [2018-13-01 10:00:00] Door
+(system) [not a time] Malformed
+(sensor,start,door) [2018-01-02 10:00:00] Door
+(sensor,stop,door) [2018-01-02 10:00:30] Door
+(alarm) [2018-02-03 08:00:00] Intruder Alert
+"""
+
+
+@unittest.skipUnless(importNumpy(), 'numpy is not installed')
+class LogAnalyticsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.tmpdir, 'alert.log')
+        with open(self.logfile, 'w') as f:
+            f.write(LOG)
+        self.analytics = LogAnalytics(self.logfile)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_stats(self):
+        stats = self.analytics.getStats()
+        # The lines with a malformed time are skipped
+        self.assertEqual(stats['events'], 7)
+        self.assertEqual(stats['sensors'], {
+            'door': {'name': 'Door', 'activations': 2, 'openTime': 120,
+                     'meanOpenTime': 60.0},
+            'pir': {'name': 'Pir', 'activations': 1, 'openTime': 0,
+                    'meanOpenTime': None}})
+        self.assertEqual(stats['alarms'], {'2018-01': 1, '2018-02': 1})
+
+        # 2018-01-01 is a Monday, the first row of the heatmap
+        heatmap = stats['heatmap']
+        self.assertEqual(sum(sum(day) for day in heatmap), 3)
+        self.assertEqual(heatmap[0][10], 1)
+        self.assertEqual(heatmap[0][22], 1)
+        self.assertEqual(heatmap[1][10], 1)
+
+    def test_time_range(self):
+        stats = self.analytics.getStats(fromTime='2018-01-02 00:00:00',
+                                        toTime='2018-01-31 23:59:59',
+                                        sensorNames={'door': 'Front door'})
+        self.assertEqual(stats['events'], 2)
+        self.assertEqual(stats['sensors'], {
+            'door': {'name': 'Front door', 'activations': 1, 'openTime': 30,
+                     'meanOpenTime': 30.0}})
+        self.assertEqual(stats['alarms'], {})
+        self.assertTrue('error' in self.analytics.getStats(fromTime='never'))
+
+    def test_new_lines(self):
+        self.analytics.getStats()
+        with open(self.logfile, 'a') as f:
+            f.write('(sensor,start,door) [2018-02-05 10:00:00] Door\n')
+            f.write('(sensor,stop,door) [2018-02-05 10:00:20] Door\n')
+        stats = self.analytics.getStats()
+        self.assertEqual(stats['events'], 9)
+        self.assertEqual(stats['sensors']['door']['activations'], 3)
+        self.assertEqual(stats['sensors']['door']['openTime'], 140)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+from journal import StateJournal
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+
+class JournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journalfile = os.path.join(self.tmpdir, 'settings.journal')
+        self.settings = {
+            'settings': {'alarmArmed': False, 'alarmTriggered': False},
+            'sensors': {'uuid1': {'alert': False, 'online': False}}
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_replay(self):
+        journal = StateJournal(self.journalfile)
+        journal.append([(('settings', 'alarmArmed'), True)])
+        journal.append([(('sensors', 'uuid1', 'alert'), True),
+                        (('sensors', 'uuid1', 'online'), True),
+                        (('sensors', 'removed', 'alert'), True)])
+        self.assertEqual(journal.entries, 4)
+
+        applied = StateJournal(self.journalfile).replay(self.settings)
+        self.assertEqual(applied, 3)
+        self.assertTrue(self.settings['settings']['alarmArmed'])
+        self.assertEqual(self.settings['sensors'],
+                         {'uuid1': {'alert': True, 'online': True}})
+
+        journal.clear()
+        self.assertEqual(os.path.getsize(self.journalfile), 0)
+        self.assertEqual(StateJournal(self.journalfile).replay({}), 0)
+
+    def test_damaged_tail(self):
+        journal = StateJournal(self.journalfile)
+        journal.append([(('settings', 'alarmArmed'), True)])
+        journal.append([(('settings', 'alarmTriggered'), True)])
+        validSize = os.path.getsize(self.journalfile)
+        journal.append([(('sensors', 'uuid1', 'alert'), True)])
+        # A torn write of the last line and a line with a bad checksum
+        with open(self.journalfile, 'rb+') as f:
+            f.truncate(os.path.getsize(self.journalfile) - 3)
+        with open(self.journalfile, 'ab') as f:
+            f.write(b'00000000 [["settings","alarmArmed"],false]\n')
+
+        applied = StateJournal(self.journalfile).replay(self.settings)
+        self.assertEqual(applied, 2)
+        self.assertTrue(self.settings['settings']['alarmTriggered'])
+        self.assertFalse(self.settings['sensors']['uuid1']['alert'])
+        self.assertEqual(os.path.getsize(self.journalfile), validSize)
+
+    def test_worker_restart(self):
+        from Worker import Worker
+        shutil.copy('settings_template.json',
+                    os.path.join(self.tmpdir, 'settings.json'))
+        jsonfile = os.path.join(self.tmpdir, 'settings.json')
+        logfile = os.path.join(self.tmpdir, 'alert.log')
+        self.updateUI = {'obj': lambda *args, **kwargs: None, 'room': 'test'}
+        worker = Worker(jsonfile, logfile, 'play.wav', self.updateUI)
+        worker.settingsWatcher.stop()
+        worker.activateAlarm()
+        worker.runtime.cancel(owner=worker.journal)
+        with open(jsonfile) as f:
+            self.assertFalse('"alarmArmed":true' in f.read())
+
+        worker = Worker(jsonfile, logfile, 'play.wav', self.updateUI)
+        worker.settingsWatcher.stop()
+        worker.runtime.cancel(owner=worker.journal)
+        self.assertTrue(worker.settings['settings']['alarmArmed'])
+        self.assertEqual(worker.journal.entries, 0)
+        with open(jsonfile) as f:
+            self.assertTrue('"alarmArmed":true' in f.read())
+
+    def test_settings_file_changed(self):
+        from Worker import Worker
+        jsonfile = os.path.join(self.tmpdir, 'settings.json')
+        shutil.copy('settings_template.json', jsonfile)
+        with open(jsonfile) as f:
+            oldContent = f.read()
+        updateUI = {'obj': lambda *args, **kwargs: None, 'room': 'test'}
+        worker = Worker(jsonfile, os.path.join(self.tmpdir, 'alert.log'),
+                        'play.wav', updateUI)
+        worker.settingsWatcher.stop()
+        worker.runtime.cancel(owner=worker.journal)
+        worker.activateAlarm()
+
+        # Another program edits the old snapshot: the armed alarm of the
+        # journal is kept and written with its change
+        settings = json.loads(oldContent)
+        settings['mail']['messageSubject'] = 'Edited'
+        worker.settingsFileChanged(json.dumps(settings))
+        self.assertTrue(worker.settings['settings']['alarmArmed'])
+        self.assertEqual(worker.settings['mail']['messageSubject'], 'Edited')
+        self.assertEqual(worker.journal.entries, 0)
+        with open(jsonfile) as f:
+            written = json.load(f)
+        self.assertTrue(written['settings']['alarmArmed'])
+
+        # A state that the program changes is applied
+        written['settings']['alarmArmed'] = False
+        worker.settingsFileChanged(json.dumps(written))
+        self.assertFalse(worker.settings['settings']['alarmArmed'])
+
+        # The watcher reports an older write of the Worker after a newer one
+        worker.activateAlarm()
+        worker.compactJournal()
+        with open(jsonfile) as f:
+            olderWrite = f.read()
+        worker.deactivateAlarm()
+        worker.compactJournal()
+        worker.settingsFileChanged(olderWrite)
+        self.assertFalse(worker.settings['settings']['alarmArmed'])
+        self.assertEqual(worker.journal.entries, 0)
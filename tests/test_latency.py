@@ -0,0 +1,86 @@
+from latency import LatencyTracer, getLatencyTracer
+from Worker import Worker
+import unittest
+import tempfile
+import shutil
+import json
+import time
+import os
+
+
+class FakeClient():
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        return (0, 1)
+
+
+class LatencyTests(unittest.TestCase):
+
+    def test_histograms(self):
+        tracer = LatencyTracer(maxTraces=2)
+        self.assertEqual(tracer.current(), None)
+        for sensor in ('s1', 's2', 's3'):
+            with tracer.traceEvent('gpio', sensor) as trace:
+                self.assertTrue(tracer.current() is trace)
+                tracer.mark(tracer.current(), 'sensorAlert')
+                tracer.mark(tracer.current(), 'sensorAlert')
+            self.assertEqual(tracer.current(), None)
+        with tracer.traceEvent('mqtt'):
+            # A trace that doesn't reach any stage is not kept
+            pass
+        tracer.mark(None, 'sensorAlert')
+
+        traces = tracer.getTraces()
+        self.assertEqual([trace['sensor'] for trace in traces], ['s3', 's2'])
+        self.assertEqual(list(traces[0]['stages']), ['sensorAlert'])
+        histogram = tracer.getHistograms()['sensorAlert']
+        self.assertEqual(histogram['count'], 3)
+        self.assertEqual(sum(count for bound, count
+                             in histogram['buckets']), 3)
+        self.assertTrue(histogram['p50'] <= histogram['p99'] <= 1)
+
+        # The histograms and the traces of the sensors of one user
+        histograms = tracer.getHistograms(sensors={'s1', 's2'})
+        self.assertEqual(histograms['sensorAlert']['count'], 2)
+        self.assertEqual(tracer.getHistograms(sensors=set()), {})
+        self.assertEqual([trace['sensor'] for trace in
+                          tracer.getTraces(sensors={'s1', 's2'})], ['s2'])
+
+    def test_worker_stages(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open('settings_template.json') as f:
+                settings = json.load(f)
+            settings['sensors']['s1'] = {
+                'type': 'MQTT', 'name': 'Door', 'enabled': True,
+                'online': True, 'alert': False}
+            jsonfile = os.path.join(tmpdir, 'settings.json')
+            with open(jsonfile, 'w') as f:
+                json.dump(settings, f)
+            worker = Worker(jsonfile, os.path.join(tmpdir, 'alert.log'),
+                            'play.wav', {'obj': lambda *args, **kwargs: None,
+                                         'room': 'test'})
+            worker.settingsWatcher.stop()
+            # The stage is marked when the outbox publishes the state
+            worker.settings['mqtt']['enable'] = True
+            worker.mynotify.outbox.start(FakeClient())
+            worker.mynotify.outbox.setConnected(True)
+            worker.activateAlarm()
+            with getLatencyTracer().traceEvent('test') as trace:
+                worker.sensorAlert('s1')
+            endTime = time.time() + 5
+            while ('sendStateMQTT' not in trace.stages and
+                   time.time() < endTime):
+                time.sleep(0.01)
+            worker.deactivateAlarm()
+            worker.runtime.cancel(owner=worker.journal)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertEqual(trace.sensor, 's1')
+        self.assertEqual(
+            sorted(trace.stages), ['checkIntruderAlert', 'sendStateMQTT',
+                                   'sensorAlert', 'updateUI'])
+        self.assertTrue(trace.stages['sensorAlert'] <=
+                        trace.stages['sendStateMQTT'])
+        self.assertTrue(getLatencyTracer().getTraces(sensor='s1'))
@@ -0,0 +1,55 @@
+from alarmpi import AlarmPiServer
+from loadtest import LoadTest
+from tests import createServerConfig
+from werkzeug.serving import make_server
+import unittest
+import threading
+import tempfile
+import shutil
+import os
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+
+@unittest.skipUnless(socketio, 'the Socket.IO client is not installed')
+class LoadTestTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.myserver = AlarmPiServer()
+        self.myserver.setServerConfig(createServerConfig(self.tmpdir))
+        app = self.myserver.create_app()
+        self.myserver.startMyApp()
+        self.worker = self.myserver.users['test1']['obj']
+        self.worker.addSensor({'test-loadtest': {
+            'type': 'MQTT', 'name': 'Load test', 'state_topic': 'loadtest'}})
+        self.httpserver = make_server('127.0.0.1', 0, app, threaded=True)
+        thread = threading.Thread(target=self.httpserver.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.httpserver.shutdown()
+        self.myserver.stopWorkers()
+        shutil.rmtree(self.tmpdir)
+
+    def test_fanout(self):
+        loadtest = LoadTest(
+            'http://127.0.0.1:{0}'.format(self.httpserver.server_port),
+            'test1', 'secret', clients=3, rate=20, events=4,
+            sensor='test-loadtest', pid=os.getpid())
+        try:
+            stats = loadtest.run()
+        finally:
+            loadtest.close()
+
+        self.assertEqual(stats['clients'], 3)
+        for event in ('settingsChanged', 'sensorLogEntry'):
+            self.assertEqual(stats['fanout'][event]['received'], 12)
+            self.assertEqual(stats['fanout'][event]['dropped'], 0)
+        self.assertTrue('rssPerClient' in stats)
+        self.assertTrue(self.worker.settings['sensors']['test-loadtest']
+                        ['enabled'])
@@ -0,0 +1,110 @@
+from logs import Logs
+import unittest
+import tempfile
+import shutil
+import random
+import os
+
+
+class LogIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.tmpdir, 'alert.log')
+        open(self.logfile, 'w').close()
+        self.logs = Logs(self.logfile)
+        randomizer = random.Random(1)
+        for second in range(300):
+            logTime = '2018-01-01 00:{0:02d}:{1:02d}'.format(
+                second // 60, second % 60)
+            if second % 50 == 0:
+                self.logs.writeLog('user_action', logTime, 'Alarm activated')
+                continue
+            sensor = randomizer.randrange(12)
+            status = 'start' if second % 2 else 'stop'
+            self.logs.writeLog('sensor,{0},s{1}'.format(status, sensor),
+                               logTime, 'Sensor {0}'.format(sensor))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def scanLogs(self, **query):
+        """ Returns the logs of the query without using the index """
+
+        logs = Logs(self.logfile)
+        logs.index.getCandidates = lambda text, before=None: None
+        logs.index.getLastMatch = lambda text: (False, None)
+        return logs.getSensorsLog(**query)
+
+    def test_same_results_as_scan(self):
+        queries = [
+            {'filterText': 'Sensor 1'},
+            {'filterText': 'sensor 11', 'selectTypes': 'sensor'},
+            {'filterText': 'nothing'},
+            {'filterText': 'Se'},
+            {'fromText': 'Alarm activated'},
+            {'fromText': 'alarm', 'filterText': 'Sensor 3'},
+            {'fromText': 'Sensor 5', 'limit': 10},
+            {'fromText': 'Sensor 5', 'combineSensors': 'false'},
+            {'filterText': 'Sensor 2', 'limit': 3},
+        ]
+        for query in queries:
+            result = self.logs.getSensorsLog(**query)
+            self.assertEqual(result, self.scanLogs(**query), query)
+            page = dict(query, before=result['prev'])
+            self.assertEqual(self.logs.getSensorsLog(**page),
+                             self.scanLogs(**page), page)
+
+    def test_last_alarm_activated(self):
+        log = self.logs.writeLog('user_action', '2018-01-01 01:00:00',
+                                 'Alarm activated')
+        self.logs.writeLog('sensor,start,s1', '2018-01-01 01:00:01',
+                           'Sensor 1')
+        self.assertEqual(self.logs.index.getLastMatch('Alarm activated'),
+                         (True, log['cursor']))
+        result = self.logs.getSensorsLog(fromText='Alarm activated')
+        self.assertEqual(result['log'], [
+            '[2018-01-01 01:00:00] Alarm activated',
+            '[2018-01-01 01:00:01] Sensor 1'])
+        self.assertEqual(result['prev'], log['cursor'])
+
+        # A new text is watched after its first search
+        self.logs.getSensorsLog(fromText='Sensor 7')
+        watched, cursor = self.logs.index.getLastMatch('Sensor 7')
+        self.assertTrue(watched)
+        self.assertEqual(self.logs.index.getCandidates('sensor 7')[0],
+                         cursor)
+
+    def test_saved_and_trimmed(self):
+        self.logs.index.save()
+        self.assertTrue(os.path.exists(self.logfile + '.index'))
+        self.logs.writeLog('system', '2018-01-01 01:00:00', 'Restarted')
+
+        # Only the lines after the saved index are added to it
+        logs = Logs(self.logfile)
+        self.assertEqual(logs.index.size, os.path.getsize(self.logfile))
+        self.assertEqual(logs.getSensorsLog(filterText='restarted')['log'],
+                         ['[2018-01-01 01:00:00] Restarted'])
+
+        for second in range(1000):
+            self.logs.writeLog('system', '2018-01-01 03:00:00', 'Trim')
+        self.logs.trimLogFile()
+        self.assertEqual(self.logs.index.getLastMatch('alarm activated'),
+                         (True, None))
+        self.assertEqual(self.logs.getSensorsLog(filterText='sensor')['log'],
+                         [])
+        query = {'filterText': 'trim', 'limit': 2000}
+        self.assertEqual(len(self.logs.getSensorsLog(**query)['log']), 1000)
+        self.assertEqual(self.logs.getSensorsLog(**query),
+                         self.scanLogs(**query))
+
+        # The saved index is rebuilt when the log file is replaced
+        with open(self.logfile, 'w') as f:
+            f.write('(system) [2018-01-01 02:00:00] Another log\n')
+        logs = Logs(self.logfile)
+        self.assertEqual(logs.getSensorsLog(filterText='log')['log'],
+                         ['[2018-01-01 02:00:00] Another log'])
+
+
+if __name__ == '__main__':
+    unittest.main()
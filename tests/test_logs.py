@@ -0,0 +1,161 @@
+from logs import Logs
+import unittest
+import tempfile
+import shutil
+import os
+
+
+class LogsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.tmpdir, 'alert.log')
+        open(self.logfile, 'w').close()
+        self.logs = Logs(self.logfile)
+        for second in range(10):
+            self.logs.writeLog(
+                'system', '2018-01-01 00:00:0{0}'.format(second),
+                'Event {0}'.format(second))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cursors(self):
+        page = self.logs.getSensorsLog(limit=4, getFormat='json')
+        self.assertEqual([log['event'] for log in page['log']],
+                         ['Event 6', 'Event 7', 'Event 8', 'Event 9'])
+
+        older = self.logs.getSensorsLog(limit=4, before=page['prev'])
+        self.assertEqual(len(older['log']), 4)
+        self.assertTrue(older['log'][-1].endswith('Event 5'))
+
+        newer = self.logs.getSensorsLog(since=page['next'])
+        self.assertEqual(newer['log'], [])
+        self.logs.writeLog('alarm', '2018-01-01 00:00:10', 'Event 10')
+        newer = self.logs.getSensorsLog(since=page['next'])
+        self.assertEqual(newer['log'], ['[2018-01-01 00:00:10] Event 10'])
+        self.assertEqual(newer['next'], os.path.getsize(self.logfile))
+
+    def test_cursors_after_trim(self):
+        for second in range(1000):
+            self.logs.writeLog('system', '2018-01-01 01:00:00',
+                               'Trimmed {0}'.format(second))
+        page = self.logs.getSensorsLog(limit=2, getFormat='json')
+        oldest = self.logs.getSensorsLog(limit=1, since=0)
+        self.logs.trimLogFile()
+
+        # The cursors of the logs that are kept don't change
+        self.assertEqual(self.logs.getSensorsLog(limit=2, getFormat='json'),
+                         page)
+        self.assertEqual(self.logs.getSensorsLog(
+            limit=1, before=page['prev'])['log'],
+            ['[2018-01-01 01:00:00] Trimmed 997'])
+        self.logs.writeLog('alarm', '2018-01-01 02:00:00', 'After the trim')
+        self.assertEqual(self.logs.getSensorsLog(since=page['next'])['log'],
+                         ['[2018-01-01 02:00:00] After the trim'])
+
+        # The cursors of the logs that were removed are the start of the file
+        self.assertEqual(self.logs.getSensorsLog(
+            before=oldest['next'])['log'], [])
+        self.assertEqual(self.logs.getSensorsLog(
+            limit=1, since=oldest['next'])['log'],
+            ['[2018-01-01 01:00:00] Trimmed 0'])
+
+    def test_episodes(self):
+        self.logs.writeLog('sensor,start,door', '2018-01-01 00:01:00', 'Door')
+        self.logs.writeLog('sensor,start,pir', '2018-01-01 00:01:05', 'Pir')
+        self.logs.writeLog('sensor,stop,door', '2018-01-01 00:02:30', 'Door')
+
+        episodes = self.logs.getEpisodes(sensorUUID='door')['episodes']
+        self.assertEqual(len(episodes), 1)
+        self.assertEqual(episodes[0]['duration'], 90)
+        openEpisodes = self.logs.getEpisodes(onlyOpen=True)['episodes']
+        self.assertEqual([episode['sensor'] for episode in openEpisodes],
+                         ['pir'])
+
+        sensorLogs = self.logs.getSensorsLog(selectTypes='sensor')['log']
+        self.assertEqual(sensorLogs, [
+            '[2018-01-01 00:01:00] (1 min, 30 sec) Door',
+            '[2018-01-01 00:01:05] Pir'])
+
+    def test_ended_sensor_log(self):
+        start = self.logs.writeLog('sensor,start,door', '2018-01-01 00:01:00',
+                                   'Door')
+        self.assertIsNone(self.logs.getEndedSensorLog(start))
+        stop = self.logs.writeLog('sensor,stop,door', '2018-01-01 00:01:10',
+                                  'Door')
+        endedLog = self.logs.getEndedSensorLog(stop)
+        self.assertEqual(endedLog['cursor'], start['cursor'])
+        self.assertEqual(endedLog['timeend'], '2018-01-01 00:01:10')
+        self.assertEqual(endedLog['timediff'], '10 sec')
+        # The same start log is in the json logs of the subscription
+        self.assertEqual(self.logs.getSensorsLog(
+            limit=1, getFormat='json')['log'], [endedLog])
+
+    def test_sensor_history(self):
+        for day, minute in (('01', 0), ('02', 0), ('02', 10), ('02', 20)):
+            self.logs.writeLog(
+                'sensor,start,door', '2018-01-{0} 00:{1}:00'.format(
+                    day, minute), 'Door')
+            self.logs.writeLog(
+                'sensor,stop,door', '2018-01-{0} 00:{1}:30'.format(
+                    day, minute), 'Door')
+        self.logs.writeLog('sensor,start,door', '2018-01-02 00:30:00', 'Door')
+
+        history = self.logs.getSensorHistory('door', limit=2,
+                                             today='2018-01-02')
+        self.assertEqual([(activation['start'], activation['duration'])
+                          for activation in history['activations']],
+                         [('2018-01-02 00:30:00', None),
+                          ('2018-01-02 00:20:00', 30)])
+        self.assertEqual(history['activations'][1]['timediff'], '30 sec')
+        self.assertEqual(history['summary'], {
+            'activations': 5, 'activationsToday': 4,
+            'lastSeen': '2018-01-02 00:30:00', 'meanOpenTime': 30.0})
+        self.assertEqual(self.logs.getSensorHistory(
+            'door', today='2018-01-03')['summary']['activationsToday'], 0)
+        self.assertEqual(self.logs.getSensorHistory('pir')['activations'],
+                         [])
+
+    def test_time_range(self):
+        # Several logs for each minute of a day
+        for minute in range(1440):
+            for second in range(0, 60, 20):
+                self.logs.writeLog(
+                    'system', '2018-01-02 {0:02d}:{1:02d}:{2:02d}'.format(
+                        minute // 60, minute % 60, second), 'Minute')
+        reads = []
+        parseLogLine = self.logs.parseLogLine
+        self.logs.parseLogLine = lambda line: reads.append(line) or \
+            parseLogLine(line)
+
+        start = self.logs._findTime('2018-01-02 02:00')
+        self.assertLess(len(reads), 100)
+        self.assertTrue(self.logs._readLineAt(start).startswith(
+            '(system) [2018-01-02 02:00:00]'))
+        self.assertEqual(self.logs._findTime('2018-01-01'), 0)
+        self.assertEqual(self.logs._findTime('2018-01-03'),
+                         os.path.getsize(self.logfile))
+
+        result = self.logs.getSensorsLog(
+            limit=1000, getFormat='json', fromTime='2018-01-02T02:00',
+            toTime='2018-01-02 04:00:00')
+        times = [log['time'] for log in result['log']]
+        self.assertEqual(len(times), 361)
+        self.assertEqual(times[0], '2018-01-02 02:00:00')
+        self.assertEqual(times[-1], '2018-01-02 04:00:00')
+        self.assertEqual(result['prev'], start)
+
+        older = self.logs.getSensorsLog(
+            limit=10, fromTime='2018-01-02 02:00', before=result['prev'])
+        self.assertEqual(older['log'], [])
+        newer = self.logs.getSensorsLog(
+            limit=10, getFormat='json', fromTime='2018-01-02 02:00',
+            toTime='2018-01-02 04:00', since=0)
+        self.assertEqual(newer['log'][0]['time'], '2018-01-02 02:00:00')
+
+        exported = list(self.logs.iterSensorsLog(
+            fromTime='2018-01-02 23:59', toTime='2018-01-03'))
+        self.assertEqual([log['time'] for log in exported], [
+            '2018-01-02 23:59:00', '2018-01-02 23:59:20',
+            '2018-01-02 23:59:40'])
@@ -0,0 +1,66 @@
+from memory import LRUCache
+from episodes import Episodes
+import memory
+import unittest
+import subprocess
+import threading
+import json
+import sys
+import os
+
+# Peak RSS in MB of the low profile with the workload of test_peak_rss,
+# about twice the 33 MB that it needs with Python 3 on x86_64
+DEFAULT_MEMORY_BUDGET = 64
+
+
+class MemoryTests(unittest.TestCase):
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertFalse('b' in cache)
+        self.assertEqual((cache['a'], cache['c'], len(cache)), (1, 3, 2))
+        self.assertEqual(cache.evictions, 1)
+        cache.clear()
+        self.assertEqual(cache.get('a', 0), 0)
+
+    def test_profile(self):
+        try:
+            profile = memory.applyProfile({'profile': 'low',
+                                           'cache_entries': 3})
+            self.assertEqual(profile['cache_entries'], 3)
+            self.assertFalse(profile['watcher_thread'])
+            self.assertEqual(LRUCache().maxEntries, 3)
+            self.assertEqual(threading.stack_size(), 256 * 1024)
+        finally:
+            memory.applyProfile()
+        self.assertEqual(memory.getProfile()['name'], 'default')
+        self.assertEqual(threading.stack_size(), 0)
+
+    def test_episode_records(self):
+        episodes = Episodes()
+        episodes.addLog({'type': ['sensor', 'start', 'door'],
+                         'event': 'Door', 'time': '2018-01-01 00:00:00',
+                         'cursor': 0})
+        episodes.addLog({'type': ['sensor', 'stop', 'door'],
+                         'event': 'Door', 'time': '2018-01-01 00:00:30',
+                         'cursor': 10})
+        episode = episodes.get(0)
+        self.assertFalse(hasattr(episode, '__dict__'))
+        self.assertEqual(dict(episode)['duration'], 30)
+
+    def test_peak_rss(self):
+        budget = float(os.environ.get('ALARMPI_MEMORY_BUDGET',
+                                      DEFAULT_MEMORY_BUDGET))
+        try:
+            output = subprocess.check_output([
+                sys.executable, 'memorybench.py', '--users', '2',
+                '--sensors', '20', '--lines', '40000', '--profile', 'low',
+                '--budget', str(budget)])
+        except subprocess.CalledProcessError as e:
+            self.fail(e.output.decode('utf-8'))
+        result = json.loads(output.decode('utf-8').splitlines()[0])
+        self.assertTrue(result['peakRSS'] <= budget)
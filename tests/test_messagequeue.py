@@ -0,0 +1,178 @@
+from alarmpi import AlarmPiServer
+from messagequeue import UnixSocketBus, SeenMessages, signMessage, \
+    verifyMessage
+from tests import createServerConfig
+import unittest
+import tempfile
+import shutil
+import stat
+import os
+import threading
+import time
+from werkzeug.serving import make_server
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+
+class MessageQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.servers = []
+        self.httpservers = []
+
+    def tearDown(self):
+        for httpserver in self.httpservers:
+            httpserver.shutdown()
+        for myserver in self.servers:
+            myserver.stopWorkers()
+        shutil.rmtree(self.tmpdir)
+
+    def createServer(self, frontend=False):
+        myserver = AlarmPiServer()
+        myserver.setServerConfig(createServerConfig(self.tmpdir))
+        myserver.serverJson['ui']['message_queue'] = 'unix://' + self.tmpdir
+        myserver.serverJson['ui']['message_queue_secret'] = 'bus secret'
+        myserver.frontend = frontend
+        app = myserver.create_app()
+        myserver.startMyApp()
+        self.servers.append(myserver)
+        httpserver = make_server('127.0.0.1', 0, app, threaded=True)
+        thread = threading.Thread(target=httpserver.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.httpservers.append(httpserver)
+        return myserver, 'http://127.0.0.1:{0}'.format(httpserver.server_port)
+
+    def waitFor(self, condition):
+        for retry in range(100):
+            if condition():
+                return True
+            time.sleep(0.02)
+        return False
+
+    def test_unix_socket_bus(self):
+        received = []
+        listener = UnixSocketBus(self.tmpdir, 'test')
+        messages = listener.listen()
+
+        def listen():
+            received.append(next(messages))
+        thread = threading.Thread(target=listen)
+        thread.daemon = True
+        thread.start()
+        while listener.sock is None:
+            time.sleep(0.01)
+
+        UnixSocketBus(self.tmpdir, 'test').publish({'event': 'test'})
+        thread.join(2)
+        listener.close()
+        self.assertEqual(received, [{'event': 'test'}])
+        self.assertEqual(stat.S_IMODE(os.stat(self.tmpdir).st_mode), 0o700)
+
+    def test_frontend_bootstrap(self):
+        mainServer, mainUrl = self.createServer()
+        frontendServer, frontendUrl = self.createServer(frontend=True)
+        self.assertTrue(self.waitFor(
+            lambda: frontendServer.replyBus.sock is not None))
+        headers = {'Authorization': 'Basic dGVzdDE6c2VjcmV0'}
+        expected = mainServer.getBootstrapSnapshot('test1')
+
+        client = frontendServer.app.test_client()
+        response = client.get('/bootstrap.json', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data.decode('utf-8'), expected['body'])
+        self.assertEqual(int(response.headers['X-State-Version']),
+                         expected['version'])
+
+        # The routes that need the Workers are served by the main process
+        for path in ('/getSensors.json', '/getSensorsLog.json',
+                     '/activateAlarmOnline', '/sensors/door/history'):
+            response = client.get(path, headers=headers)
+            self.assertEqual(response.status_code, 503, path)
+        self.assertEqual(client.get('/myjs.js', headers=headers).status_code,
+                         200)
+
+    def test_signed_commands(self):
+        command = {'event': 'join', 'args': [{}], 'user': 'test1',
+                   'sid': 'abc'}
+        message = signMessage('bus secret', command)
+        self.assertEqual(verifyMessage('bus secret', message), command)
+        self.assertIsNone(verifyMessage('other secret', message))
+        self.assertIsNone(verifyMessage('bus secret', command))
+        forged = dict(message, payload=message['payload'].replace(
+            'test1', 'admin'))
+        self.assertIsNone(verifyMessage('bus secret', forged))
+
+    def test_replayed_commands(self):
+        command = {'event': 'join', 'args': [{}], 'user': 'test1',
+                   'sid': 'abc'}
+        seen = SeenMessages()
+        message = signMessage('bus secret', command)
+        self.assertEqual(verifyMessage('bus secret', message, seen), command)
+        self.assertIsNone(verifyMessage('bus secret', message, seen))
+        self.assertEqual(
+            verifyMessage('bus secret', signMessage('bus secret', command),
+                          seen), command)
+        # A captured message is too old after maxAge
+        self.assertIsNone(verifyMessage('bus secret', message, maxAge=-1))
+
+    def test_unsigned_command(self):
+        mainServer, mainUrl = self.createServer()
+        called = []
+        mainServer.socketHandlers['testCommand'] = \
+            lambda *args: called.append(args)
+        commands = []
+        mainServer.commandBus = type('Bus', (), {
+            'listen': lambda bus: iter(commands)})()
+        commands.append({'event': 'testCommand', 'args': [1], 'user': None,
+                         'sid': 'abc'})
+        commands.append(signMessage('other secret', commands[0]))
+        commands.append(signMessage('bus secret', dict(commands[0],
+                                                       args=[2])))
+        commands.append(commands[-1])
+        mainServer.runCommands()
+        self.assertEqual(called, [(2,)])
+
+    def test_no_secret(self):
+        myserver = AlarmPiServer()
+        myserver.setServerConfig(createServerConfig(self.tmpdir))
+        myserver.serverJson['ui']['message_queue'] = 'unix://' + self.tmpdir
+        myserver.frontend = True
+        myserver.create_app()
+        with self.assertRaises(RuntimeError):
+            myserver.startMyApp()
+
+    @unittest.skipUnless(socketio, 'the Socket.IO client is not installed')
+    def test_frontend(self):
+        mainServer, mainUrl = self.createServer()
+        frontendServer, frontendUrl = self.createServer(frontend=True)
+        self.assertFalse('obj' in frontendServer.users['test1'])
+        worker = mainServer.users['test1']['obj']
+
+        received = {'sensorsLog': [], 'sensorLogEntry': []}
+        client = socketio.Client(reconnection=False)
+        for event in received:
+            client.on(event, received[event].append)
+        client.connect(frontendUrl, headers={
+            'Authorization': 'Basic dGVzdDE6c2VjcmV0'})
+        self.assertTrue(self.waitFor(
+            lambda: frontendServer.replyBus.sock is not None))
+        # The join reply is the bootstrap snapshot of the main process
+        snapshot = mainServer.getBootstrapSnapshot('test1')
+        self.assertEqual(client.call('join', {}),
+                         (snapshot['version'], snapshot['body']))
+        client.emit('subscribeLogs', {'limit': '5', 'type': 'alarm'})
+        self.assertTrue(self.waitFor(lambda: received['sensorsLog']))
+        self.assertTrue(worker.logSubscribers)
+
+        worker.writeLog('alarm', 'From the Worker')
+        self.assertTrue(self.waitFor(lambda: received['sensorLogEntry']))
+        self.assertTrue(
+            received['sensorLogEntry'][0].endswith('From the Worker'))
+
+        client.disconnect()
+        self.assertTrue(self.waitFor(lambda: not worker.logSubscribers))
@@ -0,0 +1,96 @@
+from mqttoutbox import MQTTOutbox
+from latency import Trace
+import unittest
+import tempfile
+import shutil
+import time
+import os
+
+
+class FakeClient():
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, qos, retain))
+        return (0, len(self.published))
+
+
+class MQTTOutboxTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outboxfile = os.path.join(self.tmpdir, 'settings.outbox')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def waitPublished(self, client, count):
+        for retry in range(100):
+            if len(client.published) >= count:
+                break
+            time.sleep(0.01)
+
+    def test_offline_coalescing(self):
+        outbox = MQTTOutbox(self.outboxfile, coalesceDelay=0)
+        for state in ['on', 'off', 'on', 'off']:
+            outbox.publish('home/alarm/sensor/Door', state, qos=1)
+        outbox.publish('home/alarm', 'armed_away', qos=2)
+        # The file is written later, not on every message
+        self.assertFalse(os.path.exists(self.outboxfile))
+        outbox.setConnected(False)
+        self.assertTrue(os.path.exists(self.outboxfile))
+
+        # The outbox is restored after a restart
+        outbox = MQTTOutbox(self.outboxfile, coalesceDelay=0)
+        client = FakeClient()
+        outbox.start(client)
+        outbox.setConnected(True)
+        self.waitPublished(client, 2)
+        self.assertEqual(client.published, [
+            ('home/alarm/sensor/Door', 'off', 1, True),
+            ('home/alarm', 'armed_away', 2, True)])
+
+    def test_trace_marked_on_publish(self):
+        outbox = MQTTOutbox(coalesceDelay=0)
+        client = FakeClient()
+        outbox.start(client)
+        first, second = Trace('gpio'), Trace('gpio')
+        outbox.publish('home/alarm', 'armed_away', trace=first,
+                       stage='sendStateMQTT')
+        outbox.publish('home/alarm', 'triggered', trace=second,
+                       stage='sendStateMQTT')
+        time.sleep(0.05)
+        # Only queued while the broker is disconnected
+        self.assertEqual(first.stages, {})
+
+        outbox.setConnected(True)
+        self.waitPublished(client, 1)
+        for retry in range(100):
+            if 'sendStateMQTT' in second.stages:
+                break
+            time.sleep(0.01)
+        self.assertEqual(client.published, [
+            ('home/alarm', 'triggered', 2, True)])
+        self.assertIn('sendStateMQTT', first.stages)
+        self.assertIn('sendStateMQTT', second.stages)
+
+    def test_delayed_save(self):
+        outbox = MQTTOutbox(self.outboxfile, saveDelay=0.05)
+        outbox.publish('home/alarm', 'armed_away')
+        for retry in range(100):
+            if os.path.exists(self.outboxfile):
+                break
+            time.sleep(0.01)
+        self.assertEqual(MQTTOutbox(self.outboxfile).pending.keys(),
+                         outbox.pending.keys())
+
+        # Nothing is left to save once the messages are sent
+        outbox.start(FakeClient())
+        outbox.setConnected(True)
+        for retry in range(100):
+            if not os.path.exists(self.outboxfile):
+                break
+            time.sleep(0.01)
+        self.assertFalse(os.path.exists(self.outboxfile))
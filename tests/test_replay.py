@@ -0,0 +1,86 @@
+from tracer import EventTracer, readTrace
+from replay import Replay
+import tracer
+import unittest
+import pytz
+import tempfile
+import shutil
+import json
+import os
+
+
+class ReplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tracefile = os.path.join(self.tmpdir, 'trace.log.gz')
+        with open('settings_template.json') as f:
+            self.settings = json.load(f)
+        self.settings['mqtt']['password'] = 'secret'
+        self.sensor = 'uuid1'
+        self.settings['sensors'][self.sensor] = {
+            'type': 'GPIO', 'name': 'Door', 'pin': 12, 'enabled': True,
+            'online': False, 'alert': False}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def recordTrace(self):
+        trace = EventTracer(self.tracefile, self.settings)
+        trace.record(tracer.SENSOR_ALERT, self.sensor)
+        trace.record(tracer.SENSOR_ALERT_STOP, self.sensor)
+        trace.recordMQTT(self.settings['mqtt']['command_topic'], 'ARM_AWAY')
+        trace.record(tracer.SENSOR_ALERT, 'removed-sensor')
+        trace.close()
+
+    def test_trace(self):
+        self.recordTrace()
+        header, events = readTrace(self.tracefile)
+        self.assertEqual(header['settings']['mqtt']['password'], '')
+        self.assertEqual(
+            [event[1:] for event in events],
+            [('A', self.sensor, None),
+             ('a', self.sensor, None),
+             ('M', None, [self.settings['mqtt']['command_topic'], 'ARM_AWAY']),
+             ('A', 'removed-sensor', None)])
+
+    def test_trace_after_restart(self):
+        self.recordTrace()
+        with open(self.tracefile, 'rb') as f:
+            previous = f.read()
+        trace = EventTracer(self.tracefile, self.settings)
+        trace.close()
+        rotated = [name for name in os.listdir(self.tmpdir)
+                   if name != 'trace.log.gz']
+        self.assertEqual(len(rotated), 1)
+        self.assertTrue(rotated[0].startswith('trace.log.'))
+        self.assertTrue(rotated[0].endswith('.gz'))
+        with open(os.path.join(self.tmpdir, rotated[0]), 'rb') as f:
+            self.assertEqual(f.read(), previous)
+        header, events = readTrace(os.path.join(self.tmpdir, rotated[0]))
+        self.assertEqual(len(list(events)), 4)
+        header, events = readTrace(self.tracefile)
+        self.assertEqual(list(events), [])
+
+    def test_replay(self):
+        self.recordTrace()
+        replay = Replay(self.tracefile, speed=None)
+        try:
+            stats = replay.run()
+            logs = replay.worker.getSensorsLog(
+                limit=10, getFormat='json', combineSensors='false')['log']
+            armed = replay.worker.settings['settings']['alarmArmed']
+            timezone = pytz.timezone(
+                replay.worker.settings['settings']['timezone'])
+        finally:
+            replay.close()
+
+        self.assertEqual(stats['events'], 3)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(stats['kinds'], {'A': 1, 'a': 1, 'M': 1})
+        self.assertTrue(armed)
+        self.assertEqual([log['event'] for log in logs[-3:]],
+                         ['Door', 'Door', 'Alarm activated'])
+        self.assertEqual(logs[-1]['time'], replay.clock.now(timezone).strftime(
+            "%Y-%m-%d %H:%M:%S"))
+        self.assertFalse(os.path.exists(replay.workdir))
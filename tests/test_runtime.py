@@ -0,0 +1,116 @@
+from runtime import Runtime
+import unittest
+import threading
+import time
+import tempfile
+import shutil
+import os
+
+
+class RuntimeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.runtime = Runtime(maxWorkers=2, maxQueued=2)
+
+    def tearDown(self):
+        self.runtime.shutdown(timeout=1)
+
+    def waitFor(self, condition):
+        for retry in range(100):
+            if condition():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_bounded_pool(self):
+        release = threading.Event()
+        done = []
+
+        def task(name):
+            release.wait(5)
+            done.append(name)
+
+        owner = object()
+        for name in range(2):
+            self.runtime.submit('voip', task, args=(name,), owner=owner)
+        self.assertTrue(self.waitFor(
+            lambda: self.runtime.getStats()['busy'] == 2))
+        for name in range(2, 4):
+            self.runtime.submit('voip', task, args=(name,), owner=owner)
+        self.assertIsNone(self.runtime.submit('voip', task, args=(4,)))
+        self.assertEqual(self.runtime.cancel(owner=owner), 2)
+        release.set()
+        self.assertTrue(self.waitFor(lambda: len(done) == 2))
+
+        stats = self.runtime.getStats()
+        self.assertEqual(stats['workers'], 2)
+        self.assertEqual(sorted(done), [0, 1])
+        self.assertTrue(self.waitFor(
+            lambda: self.runtime.getStats()['classes']['voip']['cancelled']
+            == 2))
+        voip = self.runtime.getStats()['classes']['voip']
+        self.assertEqual(voip['completed'], 2)
+        self.assertEqual(voip['rejected'], 1)
+
+    def test_owner_stats(self):
+        class Owner():
+            pass
+        owners = [Owner(), Owner()]
+        for index, owner in enumerate(owners):
+            for task in range(index + 1):
+                self.runtime.submit('mail', lambda: None, owner=owner)
+        self.assertTrue(self.waitFor(
+            lambda: self.runtime.getStats()['classes']['mail']['completed']
+            == 3))
+        stats = self.runtime.getStats(owners=owners[:1])
+        self.assertEqual(stats['classes']['mail']['submitted'], 1)
+        self.assertEqual(stats['classes']['mail']['completed'], 1)
+        self.assertEqual(self.runtime.getStats(owners=[])['classes'], {})
+
+    def test_scheduler(self):
+        called = []
+        self.runtime.schedule(0.1, 'alert', called.append, args=('later',))
+        self.runtime.schedule(0.02, 'alert', called.append, args=('sooner',))
+        cancelled = self.runtime.schedule(0.05, 'alert', called.append,
+                                          args=('cancelled',))
+        repeated = self.runtime.schedule(0, 'trim', called.append,
+                                         args=('repeat',), interval=0.03)
+        cancelled.cancel()
+        self.assertTrue(self.waitFor(lambda: 'later' in called))
+        repeated.cancel()
+        self.assertEqual([name for name in called if name != 'repeat'],
+                         ['sooner', 'later'])
+        self.assertTrue(called.count('repeat') >= 3)
+
+        self.runtime.shutdown(timeout=1)
+        self.assertIsNone(self.runtime.schedule(0, 'alert', called.append))
+        self.assertIsNone(self.runtime.submit('alert', called.append))
+
+    def test_alarm_with_full_pool(self):
+        from Worker import Worker
+        tmpdir = tempfile.mkdtemp()
+        try:
+            jsonfile = os.path.join(tmpdir, 'settings.json')
+            shutil.copy('settings_template.json', jsonfile)
+            worker = Worker(jsonfile, os.path.join(tmpdir, 'alert.log'),
+                            'play.wav', {'obj': lambda *args, **kwargs: None,
+                                         'room': 'test'})
+            worker.settingsWatcher.stop()
+            worker.runtime.cancel(owner=worker.journal)
+
+            # The shared pool rejects everything: the siren and the
+            # notifications still run
+            self.runtime.shutdown(timeout=1)
+            worker.runtime = self.runtime
+            called = []
+            worker.enableSerene = lambda trace=None: called.append('serene')
+            worker.sendMail = lambda trace=None: called.append('mail')
+            worker.callVoip = lambda trace=None: called.append('voip')
+            worker.settings['sensors']['door'] = {
+                'name': 'Door', 'alert': True, 'enabled': True}
+            worker.settings['settings']['alarmArmed'] = True
+            worker.checkIntruderAlert()
+            self.assertTrue(self.waitFor(lambda: len(called) == 3))
+            self.assertEqual(sorted(called), ['mail', 'serene', 'voip'])
+        finally:
+            shutil.rmtree(tmpdir)
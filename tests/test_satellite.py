@@ -0,0 +1,181 @@
+from satellite import getSatelliteServer, SatelliteNode, _sendMessage, \
+    _readMessage, _signChallenge, SatelliteServer
+from sensors import Sensor
+import unittest
+import tempfile
+import shutil
+import socket
+import subprocess
+import sys
+import json
+import time
+import os
+
+# A satellite process with a sensor that goes in alert after it starts
+NODE_SCRIPT = """
+import sys, threading, satellite
+from sensordrivers import registerDriver
+from sensordrivers.base import SensorDriver
+
+class sensorPulse(SensorDriver):
+    def add_sensor(self, sensor, settings=None):
+        self.online = True
+        threading.Timer(0.5, self._notify_alert).start()
+
+registerDriver('Pulse', sensorPulse)
+satellite.main(sys.argv[1:])
+"""
+
+
+class SatelliteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = getSatelliteServer()
+        self.port = self.server.start('127.0.0.1', 0, 'secret')
+        self.events = []
+        self.central = Sensor()
+        for name in ('alert', 'alert_stop', 'error', 'error_stop'):
+            getattr(self.central, 'on_' + name)(self.recordEvent(name))
+
+    def tearDown(self):
+        for sensor in list(self.central.get_all_sensors()):
+            self.central.del_sensor(sensor)
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def recordEvent(self, name):
+        return lambda sensor: self.events.append((sensor, name))
+
+    def addCentralSensors(self, sensors):
+        self.central.add_sensors({'sensors': dict(
+            (sensor, {'type': 'Satellite', 'name': sensor, 'node': node,
+                      'node_sensor': nodeSensor})
+            for sensor, (node, nodeSensor) in sensors.items())})
+
+    def waitFor(self, condition, timeout=10):
+        endTime = time.time() + timeout
+        while not condition() and time.time() < endTime:
+            time.sleep(0.02)
+        self.assertTrue(condition())
+
+    def waitDisconnected(self, node):
+        self.waitFor(lambda: not self.server.getStats()[node]['connected'])
+
+    def test_no_password(self):
+        server = SatelliteServer()
+        for password in ('', None):
+            with self.assertRaises(ValueError):
+                server.start('127.0.0.1', 0, password)
+        self.assertIsNone(server.server)
+
+    def test_forward_and_reconnect(self):
+        self.addCentralSensors({'door': ('garage1', 's1')})
+        node = SatelliteNode({'sensors': {}}, '127.0.0.1', self.port,
+                             'garage1', 'secret', batchDelay=0.01)
+        node.start()
+        try:
+            node.record('s1', 'A')
+            node.record('s1', 'a')
+            self.waitFor(lambda: ('door', 'alert_stop') in self.events)
+            self.assertEqual(self.events, [
+                ('door', 'error'), ('door', 'alert'),
+                ('door', 'alert_stop')])
+            self.waitFor(lambda: node.getStats()['queued'] == 0)
+
+            # The link drops: the sensor goes offline, the events of the
+            # meantime are sent after the reconnection
+            del self.events[:]
+            node.sock.shutdown(socket.SHUT_RDWR)
+            self.waitFor(lambda: ('door', 'error') in self.events)
+            node.record('s1', 'A')
+            self.waitFor(lambda: ('door', 'alert') in self.events)
+            self.waitFor(lambda: node.getStats()['queued'] == 0)
+            self.assertEqual(self.events, [
+                ('door', 'error'), ('door', 'alert')])
+            self.assertEqual(node.getStats()['connections'], 2)
+            self.assertTrue(self.server.getStats()['garage1']['connected'])
+        finally:
+            node.close()
+
+    def test_resume(self):
+        self.addCentralSensors({'door': ('garage', 's1')})
+
+        def connect(session, password='secret', nonce=None):
+            sock = socket.create_connection(('127.0.0.1', self.port))
+            rfile = sock.makefile('rb')
+            wfile = sock.makefile('wb')
+            challenge = _readMessage(rfile)
+            self.assertEqual(challenge['type'], 'challenge')
+            _sendMessage(wfile, {
+                'type': 'hello', 'node': 'garage', 'session': session,
+                'hmac': _signChallenge(password, nonce or challenge['nonce'],
+                                       'garage', session)})
+            return sock, rfile, wfile, _readMessage(rfile)
+
+        sock, rfile, wfile, welcome = connect('s', 'wrong')
+        self.assertEqual(welcome['type'], 'error')
+        sock.shutdown(socket.SHUT_RDWR)
+        sock.close()
+        # The answer to another challenge is not accepted
+        sock, rfile, wfile, welcome = connect('s', nonce='0' * 32)
+        self.assertEqual(welcome['type'], 'error')
+        sock.shutdown(socket.SHUT_RDWR)
+        sock.close()
+        self.assertFalse('garage' in self.server.getStats())
+
+        sock, rfile, wfile, welcome = connect('s')
+        self.assertEqual(welcome, {'type': 'welcome', 'ack': 0})
+        _sendMessage(wfile, {'type': 'events', 'events': [
+            [1, 's1', 'e'], [2, 's1', 'A']]})
+        self.assertEqual(_readMessage(rfile)['ack'], 2)
+        sock.shutdown(socket.SHUT_RDWR)
+        sock.close()
+        self.waitDisconnected('garage')
+
+        # The events are sent again with a new one, only the new is applied
+        sock, rfile, wfile, welcome = connect('s')
+        self.assertEqual(welcome['ack'], 2)
+        _sendMessage(wfile, {'type': 'events', 'events': [
+            [2, 's1', 'A'], [3, 's1', 'a']]})
+        self.assertEqual(_readMessage(rfile)['ack'], 3)
+        sock.shutdown(socket.SHUT_RDWR)
+        sock.close()
+        self.waitDisconnected('garage')
+
+        # A restarted node has a new session
+        sock, rfile, wfile, welcome = connect('t')
+        self.assertEqual(welcome['ack'], 0)
+        sock.shutdown(socket.SHUT_RDWR)
+        sock.close()
+
+        self.waitFor(lambda: len(self.events) == 6)
+        self.assertEqual(self.events, [
+            ('door', 'error'), ('door', 'error_stop'), ('door', 'alert'),
+            ('door', 'error'), ('door', 'alert_stop'), ('door', 'error')])
+
+    def test_processes(self):
+        self.addCentralSensors({'door1': ('node1', 'p1'),
+                                'door2': ('node2', 'p2')})
+        processes = []
+        for node, sensor in (('node1', 'p1'), ('node2', 'p2')):
+            settingsfile = os.path.join(self.tmpdir, node + '.json')
+            with open(settingsfile, 'w') as f:
+                json.dump({'sensors': {sensor: {
+                    'type': 'Pulse', 'name': sensor}}}, f)
+            processes.append(subprocess.Popen(
+                [sys.executable, '-c', NODE_SCRIPT, settingsfile,
+                 '--central', '127.0.0.1:{0}'.format(self.port),
+                 '--node', node, '--password', 'secret'],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+        try:
+            self.waitFor(lambda: ('door1', 'alert') in self.events and
+                         ('door2', 'alert') in self.events, timeout=20)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.communicate()
+        self.waitFor(lambda: self.events.count(('door1', 'error')) == 2)
+        stats = self.server.getStats()
+        self.assertFalse(stats['node1']['connected'])
+        self.assertEqual(self.events.count(('door2', 'alert')), 1)
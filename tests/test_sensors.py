@@ -0,0 +1,114 @@
+from sensors import Sensor
+from sensordrivers import registerDriver
+from sensordrivers.base import SensorDriver
+from timerwheel import TimerWheel, getTimerWheel
+import sensordrivers
+import timerwheel
+import threading
+import unittest
+import sys
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class sensorFake(SensorDriver):
+    settingsKey = 'fake'
+
+    def add_sensor(self, sensor, settings=None):
+        self.settings = settings
+        self._notify_alert()
+
+
+class SensorRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        # The registry and the imported modules are restored after each
+        # test, so the other tests don't see the Fake driver and the
+        # result doesn't depend on the modules they have imported
+        patches = [
+            mock.patch.dict(sensordrivers.DRIVERS),
+            mock.patch.dict(sensordrivers._loadedDrivers),
+            mock.patch.object(sensordrivers, '_entryPointsLoaded', False),
+            mock.patch.dict(sys.modules)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        sys.modules.pop('sensordrivers.gpio', None)
+
+    def test_registered_driver(self):
+        registerDriver('Fake', sensorFake)
+        alerts = []
+        sensors = Sensor()
+        sensors.on_alert(alerts.append)
+        sensors.add_sensors({
+            'fake': {'option': 1},
+            'sensors': {
+                'uuid1': {'type': 'Fake', 'name': 'Fake sensor'},
+                'uuid2': {'type': 'Unknown', 'name': 'Unknown sensor'}
+            }
+        })
+
+        self.assertEqual(alerts, ['uuid1'])
+        self.assertEqual(list(sensors.get_all_sensors()), ['uuid1'])
+        self.assertEqual(
+            sensors.get_all_sensors()['uuid1']['obj'].settings, {'option': 1})
+        # The drivers of the other types are not imported
+        self.assertFalse('sensordrivers.gpio' in sys.modules)
+
+
+class TimerWheelTests(unittest.TestCase):
+
+    def test_rounds_and_reschedule(self):
+        wheel = TimerWheel(tick=3600, slots=2)
+        expired = []
+        wheel.schedule('door', 3 * 3600, lambda: expired.append('door'))
+        wheel.schedule('pir', 3600, lambda: expired.append('pir'))
+        for callback in wheel.advance():
+            callback()
+        self.assertEqual(expired, ['pir'])
+
+        wheel.schedule('door', 2 * 3600, lambda: expired.append('door'))
+        for tick in range(2):
+            for callback in wheel.advance():
+                callback()
+        self.assertEqual(expired, ['pir', 'door'])
+        self.assertEqual(len(wheel), 0)
+
+
+    def test_shared_wheel(self):
+        wheels = []
+        with mock.patch.object(timerwheel, '_timerWheel', None):
+            threads = [threading.Thread(
+                target=lambda: wheels.append(getTimerWheel()))
+                for thread in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(wheels), 8)
+        self.assertTrue(all(wheel is wheels[0] for wheel in wheels))
+
+
+class SensorMQTTTests(unittest.TestCase):
+
+    def test_availability(self):
+        errors = []
+        sensors = Sensor()
+        sensors.on_error(lambda sensor: errors.append('offline'))
+        sensors.on_error_stop(lambda sensor: errors.append('online'))
+        sensors.add_sensors({
+            'mqtt': {},
+            'sensors': {
+                'uuid1': {'type': 'MQTT', 'name': 'Window',
+                          'availability_topic': 'window/status'}
+            }
+        })
+        self.assertEqual(errors, [])
+        sensors.set_availability('uuid1', False)
+        sensors.heartbeat('uuid1')
+        sensors.heartbeat('uuid1')
+        self.assertEqual(errors, ['offline', 'online'])
@@ -0,0 +1,30 @@
+import serializer
+import unittest
+import json
+from collections import OrderedDict
+
+
+class SerializerTests(unittest.TestCase):
+
+    def check(self):
+        data = OrderedDict([('b', [1, 2.5, None]), ('a', {'x': True})])
+        text = serializer.dumps(data, indent=4, sort_keys=True)
+        self.assertEqual(text, '{"b":[1,2.5,null],"a":{"x":true}}')
+        self.assertEqual(serializer.loads(text), json.loads(text))
+        self.assertEqual(serializer.loads(text.encode('utf-8')), data)
+        self.assertEqual(serializer.dumps({1: 'one'}), '{"1":"one"}')
+        self.assertEqual(serializer.dumpsPretty({'b': 1, 'a': 2}),
+                         '{\n    "a": 2,\n    "b": 1\n}')
+        with self.assertRaises(ValueError):
+            serializer.loads('{')
+
+    def test_serializer(self):
+        self.check()
+
+    def test_without_orjson(self):
+        orjson = serializer.orjson
+        serializer.orjson = None
+        try:
+            self.check()
+        finally:
+            serializer.orjson = orjson
@@ -1,7 +1,13 @@
 from alarmpi import AlarmPiServer
+from analytics import importNumpy
+from tests import createServerConfig
 import unittest
+import tempfile
+import shutil
 from base64 import b64encode
 import json
+import gzip
+import threading
 
 
 class FlaskBookshelfTests(unittest.TestCase):
@@ -16,10 +22,12 @@ class FlaskBookshelfTests(unittest.TestCase):
 
     def setUp(self):
         # creates a test client
+        self.tmpdir = tempfile.mkdtemp()
         myserver = AlarmPiServer()
-        myserver.setServerConfig('server.json')
+        myserver.setServerConfig(createServerConfig(self.tmpdir))
         app = myserver.create_app()
         myserver.startMyApp()
+        self.myserver = myserver
 
         self.client = app.test_client()
         # propagate the exceptions to the test client
@@ -28,7 +36,8 @@ class FlaskBookshelfTests(unittest.TestCase):
             b"test1:secret").decode("ascii")}
 
     def tearDown(self):
-        pass
+        self.myserver.stopWorkers()
+        shutil.rmtree(self.tmpdir)
 
     def test_sensors(self):
         response = self.client.get(
@@ -43,6 +52,162 @@ class FlaskBookshelfTests(unittest.TestCase):
         self.assertTrue('triggered' in mydata)
         self.assertTrue('alarmArmed' in mydata)
 
+    def test_status_versions(self):
+        worker = self.myserver.users['test1']['obj']
+        response = self.client.get('/getAlarmStatus.json',
+                                   headers=self.headers)
+        etag = response.headers['ETag']
+        version = int(response.headers['X-State-Version'])
+        self.assertEqual(json.loads(response.data.decode('ascii')),
+                         {'alert': False})
+
+        headers = dict(self.headers)
+        headers['If-None-Match'] = etag
+        response = self.client.get('/getAlarmStatus.json', headers=headers)
+        self.assertEqual(response.status_code, 304)
+
+        timer = threading.Timer(0.1, worker.stateChanged)
+        timer.start()
+        response = self.client.get(
+            '/getAlarmStatus.json?wait={0}&timeout=5'.format(version),
+            headers=headers)
+        timer.join()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response.headers['X-State-Version']),
+                         version + 1)
+
+        headers['Accept-Encoding'] = 'gzip'
+        response = self.client.get('/getSensors.json', headers=headers)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue('sensors' in json.loads(
+            gzip.decompress(response.data).decode('utf-8')))
+
+    def test_bootstrap(self):
+        response = self.client.get('/bootstrap.json', headers=self.headers)
+        version = int(response.headers['X-State-Version'])
+        bootstrap = json.loads(response.data.decode('utf-8'))
+        # The passwords of the settings are not in it
+        self.assertEqual(sorted(bootstrap), ['serene', 'status'])
+        self.assertTrue('sensors' in bootstrap['status'])
+
+        # The join reply is the same cached snapshot
+        self.client.get('/login', headers=self.headers)
+        socketClient = self.myserver.socketio.test_client(
+            self.myserver.app, flask_test_client=self.client)
+        self.assertEqual(socketClient.emit('join', {}, callback=True),
+                         [version, response.data.decode('utf-8')])
+        socketClient.disconnect()
+
+    def test_latency_of_the_user(self):
+        from latency import getLatencyTracer
+        tracer = getLatencyTracer()
+        with tracer.traceEvent('test', 'sensor-of-another-user') as trace:
+            tracer.mark(trace, 'sensorAlert')
+        # The limit is parsed like the limit of the logs
+        response = self.client.get('/getLatency.json?traces=all',
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        latency = json.loads(response.data.decode('utf-8'))
+        self.assertFalse(any(trace['sensor'] == 'sensor-of-another-user'
+                             for trace in latency['traces']))
+
+    def test_runtime_stats_of_the_user(self):
+        from runtime import getRuntime
+
+        class Owner():
+            pass
+        otherUser = Owner()
+        self.assertTrue(getRuntime().submit('test-other-user', lambda: None,
+                                            owner=otherUser))
+        response = self.client.get('/getRuntimeStats.json',
+                                   headers=self.headers)
+        stats = json.loads(response.data.decode('utf-8'))
+        self.assertTrue('classes' in stats)
+        self.assertFalse('test-other-user' in stats['classes'])
+
+    def test_satellites_of_the_user(self):
+        import satellite
+        server = satellite.getSatelliteServer()
+        server.nodes['node-of-another-user'] = {
+            'connected': True, 'ack': 0, 'events': 0, 'batches': 0}
+        try:
+            response = self.client.get('/getSatellites.json',
+                                       headers=self.headers)
+        finally:
+            del server.nodes['node-of-another-user']
+        self.assertEqual(json.loads(response.data.decode('utf-8')), {})
+
+    def test_sensor_history(self):
+        worker = self.myserver.users['test1']['obj']
+        sensor = 'history-sensor'
+        worker.settings['sensors'][sensor] = {'name': 'History'}
+        try:
+            worker.writeLog('sensor,start,' + sensor, 'History')
+            worker.writeLog('sensor,stop,' + sensor, 'History')
+            response = self.client.get(
+                '/sensors/{0}/history?limit=5'.format(sensor),
+                headers=self.headers)
+        finally:
+            del worker.settings['sensors'][sensor]
+        history = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(history['activations'][0]['sensor'], sensor)
+        self.assertEqual(history['summary']['lastSeen'],
+                         history['activations'][0]['end'])
+        response = self.client.get('/sensors/unknown/history',
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_set_settings(self):
+        self.client.get('/login', headers=self.headers)
+        socketClient = self.myserver.socketio.test_client(
+            self.myserver.app, flask_test_client=self.client)
+        reply = socketClient.emit('setSettings', {
+            'mail': {'smtpPort': 'wrong'}}, callback=True)
+        self.assertTrue('smtpPort' in reply['error'])
+        worker = self.myserver.users['test1']['obj']
+        reply = socketClient.emit('setSettings', {
+            'serene': dict(worker.getSereneSettings())}, callback=True)
+        self.assertEqual(reply, {'changed': []})
+        socketClient.disconnect()
+
+    def test_set_section_settings(self):
+        self.client.get('/login', headers=self.headers)
+        socketClient = self.myserver.socketio.test_client(
+            self.myserver.app, flask_test_client=self.client)
+        reply = socketClient.emit('setMQTTSettings', {'port': 0},
+                                  callback=True)
+        self.assertTrue('port' in reply['error'])
+        reply = socketClient.emit('setUISettings', {
+            'password': 'secret', 'port': 5000, 'https': False,
+            'timezone': 'Nowhere'}, callback=True)
+        self.assertTrue('Nowhere' in reply['error'])
+        reply = socketClient.emit('setUISettings', {
+            'password': 'secret', 'port': 'wrong', 'https': False},
+            callback=True)
+        self.assertTrue('port' in reply['error'])
+        worker = self.myserver.users['test1']['obj']
+        reply = socketClient.emit('setSereneSettings',
+                                  dict(worker.getSereneSettings()),
+                                  callback=True)
+        self.assertEqual(reply, {'changed': []})
+        socketClient.disconnect()
+
+    def test_export_settings(self):
+        response = self.client.get('/exportSettings.json',
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        text = response.data.decode('utf-8')
+        self.assertTrue(text.startswith('{\n    "mail": {'))
+        self.assertTrue('sensors' in json.loads(text))
+
+    def test_latency(self):
+        response = self.client.get('/getLatency.json?traces=5',
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        latency = json.loads(response.data.decode('utf-8'))
+        self.assertTrue('stages' in latency)
+        self.assertTrue(len(latency['traces']) <= 5)
+
     def test_logs(self):
         response = self.client.get(
             '/getSensorsLog.json',
@@ -51,6 +216,105 @@ class FlaskBookshelfTests(unittest.TestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_export_logs(self):
+        worker = self.myserver.users['test1']['obj']
+        worker.writeLog('alarm', 'Exported')
+        response = self.client.get(
+            '/exportSensorsLog?type=alarm&gzip=True',
+            headers=self.headers,
+            follow_redirects=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(response.data).decode('utf-8').splitlines()
+        self.assertEqual(json.loads(lines[-1])['event'], 'Exported')
+
+        response = self.client.get(
+            '/exportSensorsLog?format=csv',
+            headers=self.headers,
+            follow_redirects=True
+        )
+        lines = response.data.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'time,type,event,timeend,timediff,cursor')
+
+    def test_sensors_stats(self):
+        response = self.client.get(
+            '/getSensorsStats.json?from=2018-01-01 00:00:00',
+            headers=self.headers,
+            follow_redirects=True
+        )
+        mydata = json.loads(response.data.decode('ascii'))
+
+        self.assertEqual(response.status_code, 200)
+        if importNumpy():
+            self.assertTrue('sensors' in mydata)
+            self.assertTrue('heatmap' in mydata)
+        else:
+            self.assertEqual(mydata, {'error': 'numpy is not installed'})
+
+    def test_settings_file_changed(self):
+        worker = self.myserver.users['test1']['obj']
+        sensors = worker.sensors.get_all_sensors()
+        settings = json.loads(json.dumps(worker.settings))
+        settings['sensors']['test-mqtt'] = {
+            'type': 'MQTT', 'name': 'Window', 'state_topic': 'window',
+            'enabled': True, 'online': False, 'alert': False}
+        worker.settingsFileChanged(json.dumps(settings))
+        driver = sensors['test-mqtt']['obj']
+
+        settings['sensors']['test-mqtt']['name'] = 'Window 2'
+        worker.settingsFileChanged(json.dumps(settings))
+        self.assertTrue(sensors['test-mqtt']['obj'] is driver)
+        self.assertEqual(worker.settings['sensors']['test-mqtt']['name'],
+                         'Window 2')
+
+        settings['sensors']['test-mqtt']['state_topic'] = 'window2'
+        worker.settingsFileChanged(json.dumps(settings))
+        self.assertFalse(sensors['test-mqtt']['obj'] is driver)
+
+        worker.delSensor('test-mqtt')
+        self.assertFalse('test-mqtt' in sensors)
+
+    def test_logs_subscription(self):
+        self.client.get('/login', headers=self.headers)
+        socketClient = self.myserver.socketio.test_client(
+            self.myserver.app, flask_test_client=self.client)
+        socketClient.emit('subscribeLogs', {'limit': '5', 'type': 'alarm'})
+        received = socketClient.get_received()
+        self.assertEqual(received[-1]['name'], 'sensorsLog')
+
+        worker = self.myserver.users['test1']['obj']
+        worker.writeLog('system', 'Not subscribed')
+        worker.writeLog('alarm', 'Subscribed')
+        received = socketClient.get_received()
+        entries = [msg['args'][0] for msg in received
+                   if msg['name'] == 'sensorLogEntry']
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(entries[0].endswith('Subscribed'))
+
+        socketClient.disconnect()
+        self.assertEqual(worker.logSubscribers, {})
+
+    def test_logs_subscription_stop(self):
+        self.client.get('/login', headers=self.headers)
+        socketClient = self.myserver.socketio.test_client(
+            self.myserver.app, flask_test_client=self.client)
+        socketClient.emit('subscribeLogs', {'limit': '5', 'type': 'sensor',
+                                            'format': 'json'})
+        socketClient.get_received()
+
+        # The stop log sends the start log again, with its duration
+        worker = self.myserver.users['test1']['obj']
+        worker.writeLog('sensor,start,live-door', 'Door')
+        worker.writeLog('sensor,stop,live-door', 'Door')
+        entries = [msg['args'][0] for msg in socketClient.get_received()
+                   if msg['name'] == 'sensorLogEntry']
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]['cursor'], entries[1]['cursor'])
+        self.assertFalse('timediff' in entries[0])
+        self.assertTrue('timediff' in entries[1])
+        socketClient.disconnect()
+
 # getAlarmStatus.json
 # getSensorsLog.json
 # getSereneSettings.json
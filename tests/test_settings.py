@@ -0,0 +1,76 @@
+from Worker import Worker
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+
+class UpdateSettingsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.jsonfile = os.path.join(self.tmpdir, 'settings.json')
+        shutil.copy('settings_template.json', self.jsonfile)
+        updateUI = {'obj': lambda *args, **kwargs: None, 'room': 'test'}
+        self.worker = Worker(self.jsonfile,
+                             os.path.join(self.tmpdir, 'alert.log'),
+                             'play.wav', updateUI)
+        self.worker.settingsWatcher.stop()
+        self.worker.runtime.cancel(owner=self.worker.journal)
+
+        self.calls = []
+        self.worker.mynotify.setupSendStateMQTT = \
+            lambda: self.calls.append('mqtt')
+        writeNewSettingsToFile = self.worker.writeNewSettingsToFile
+
+        def countWrites(settings):
+            self.calls.append('write')
+            writeNewSettingsToFile(settings)
+        self.worker.writeNewSettingsToFile = countWrites
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def readSettings(self):
+        with open(self.jsonfile) as f:
+            return json.load(f)
+
+    def test_update(self):
+        mail = dict(self.worker.settings['mail'], smtpPort=465)
+        changed = self.worker.updateSettings({
+            'serene': dict(self.worker.settings['serene']),
+            'mail': mail,
+            'mqtt': {'qos': {'state': 1}},
+            'timezone': 'Europe/London'})
+        self.assertEqual(changed, ['mail', 'mqtt', 'timezone'])
+        # The QoS doesn't need a new connection
+        self.assertEqual(self.calls, ['write'])
+        settings = self.readSettings()
+        self.assertEqual(settings['mail']['smtpPort'], 465)
+        self.assertEqual(settings['settings']['timezone'], 'Europe/London')
+        self.assertEqual(settings['mqtt']['host'], '')
+        self.assertTrue(self.worker.getSensorsLog(limit=1)['log'][0].endswith(
+            'Settings for MQTT, Mail, UI changed'))
+
+        del self.calls[:]
+        self.assertEqual(self.worker.updateSettings({'mail': mail}), [])
+        self.worker.updateSettings({'mqtt': {'host': 'localhost'}})
+        self.assertEqual(self.calls, ['write', 'mqtt'])
+
+    def test_invalid(self):
+        for changes in ({'mail': {'smtpPort': '465'}},
+                        {'serene': {'pin': 40}},
+                        {'mqtt': {'enable': 'true'}},
+                        {'timezone': 'Nowhere'},
+                        {'sensors': {}}):
+            # Nothing is changed when one of the sections is wrong
+            with self.assertRaises(ValueError):
+                self.worker.updateSettings(dict(
+                    changes, voip={'domain': 'example.com'}))
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.worker.settings['voip']['domain'], '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import math
+import threading
+import time
+
+from colors import bcolors
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class TimerWheel():
+    """ Runs callbacks after a delay using one thread for all the timers.
+    The timers are kept in a ring of slots, one slot for each tick, so
+    scheduling, rescheduling and cancelling a timer costs the same no
+    matter how many timers exist. Each timer has a key and scheduling a
+    key again replaces its previous timer.
+    """
+
+    def __init__(self, tick=1.0, slots=64):
+        self.tick = tick
+        self.slots = [{} for slot in range(slots)]
+        self.position = 0
+        self.timers = {}
+        self.lock = threading.Lock()
+        self.threadTick = None
+
+    def schedule(self, key, delay, callback):
+        """ Calls the callback after delay seconds (rounded up to the tick)
+            unless the key is scheduled again or cancelled before """
+
+        ticks = max(1, int(math.ceil(float(delay) / self.tick)))
+        with self.lock:
+            self._cancel(key)
+            slot = (self.position + ticks) % len(self.slots)
+            rounds = (ticks - 1) // len(self.slots)
+            self.slots[slot][key] = [rounds, callback]
+            self.timers[key] = slot
+            if self.threadTick is None:
+                self.threadTick = threading.Thread(target=self.runInBackground)
+                self.threadTick.daemon = True
+                self.threadTick.start()
+
+    def cancel(self, key):
+        with self.lock:
+            self._cancel(key)
+
+    def _cancel(self, key):
+        slot = self.timers.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def __len__(self):
+        return len(self.timers)
+
+    def runInBackground(self):
+        nextTick = monotonic() + self.tick
+        while True:
+            time.sleep(max(0, nextTick - monotonic()))
+            nextTick += self.tick
+            for callback in self.advance():
+                try:
+                    callback()
+                except Exception as e:
+                    print("{0}Timer: {2}{1}".format(
+                        bcolors.FAIL, bcolors.ENDC, str(e)))
+
+    def advance(self):
+        """ Moves the wheel by one tick and returns the expired callbacks """
+
+        expired = []
+        with self.lock:
+            self.position = (self.position + 1) % len(self.slots)
+            slot = self.slots[self.position]
+            for key, timer in list(slot.items()):
+                if timer[0] > 0:
+                    timer[0] -= 1
+                else:
+                    del slot[key]
+                    del self.timers[key]
+                    expired.append(timer[1])
+        return expired
+
+
+_timerWheel = None
+_timerWheelLock = threading.Lock()
+
+
+def getTimerWheel():
+    """ Returns the timer wheel that is shared by all the sensors """
+
+    global _timerWheel
+    with _timerWheelLock:
+        if _timerWheel is None:
+            _timerWheel = TimerWheel()
+    return _timerWheel
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+import gzip
+import json
+import os
+import threading
+import time
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+SENSOR_ALERT = 'A'
+SENSOR_ALERT_STOP = 'a'
+SENSOR_ERROR = 'E'
+SENSOR_ERROR_STOP = 'e'
+MQTT_MESSAGE = 'M'
+SENSOR_ID = 'S'
+
+SENSOR_EVENTS = (SENSOR_ALERT, SENSOR_ALERT_STOP,
+                 SENSOR_ERROR, SENSOR_ERROR_STOP)
+
+_SECRETS = (('mail', 'password'), ('voip', 'password'),
+            ('mqtt', 'password'))
+
+
+class EventTracer():
+    """ Records the events that enter the alarm (the sensor events and the
+    MQTT command messages) to a trace file, so that they can be replayed
+    later with replay.py.
+    The first line of the file is a header with the settings (without the
+    passwords) and each next line is a json list that starts with the
+    milliseconds since the previous event (monotonic clock) and the kind
+    of the event. The sensor uuids are written once and then referenced
+    by their number. Files that end with .gz are compressed.
+    The trace of the previous run is kept with the time it was last written,
+    e.g. trace.log.20240101-120000.gz, so that a restart after a crash
+    doesn't overwrite the trace of the incident.
+    """
+
+    def __init__(self, tracefile, settings=None):
+        self.tracefile = tracefile
+        self.lock = threading.Lock()
+        self.sensorIds = {}
+        self.rotate()
+        if tracefile.endswith('.gz'):
+            self.file = gzip.open(tracefile, 'wt')
+        else:
+            self.file = open(tracefile, 'w')
+        self.lastTime = monotonic()
+        self._write({
+            'version': 1,
+            'time': time.time(),
+            'settings': self._removeSecrets(settings)
+        })
+
+    def rotate(self):
+        """ Renames the trace of the previous run. Returns the new name """
+
+        if not os.path.isfile(self.tracefile) or \
+                not os.path.getsize(self.tracefile):
+            return None
+        base, ext = self.tracefile, ''
+        if base.endswith('.gz'):
+            base, ext = base[:-3], '.gz'
+        stamp = time.strftime(
+            '%Y%m%d-%H%M%S', time.localtime(os.path.getmtime(self.tracefile)))
+        rotated = '{0}.{1}{2}'.format(base, stamp, ext)
+        count = 1
+        while os.path.exists(rotated):
+            rotated = '{0}.{1}-{2}{3}'.format(base, stamp, count, ext)
+            count += 1
+        os.rename(self.tracefile, rotated)
+        return rotated
+
+    def _removeSecrets(self, settings):
+        if settings is None:
+            return None
+        settings = json.loads(json.dumps(settings))
+        for section, key in _SECRETS:
+            if key in settings.get(section, {}):
+                settings[section][key] = ''
+        for sensorvalue in settings.get('sensors', {}).values():
+            if 'pass' in sensorvalue:
+                sensorvalue['pass'] = ''
+        return settings
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def record(self, kind, sensor=None, data=None):
+        """ Writes an event to the trace """
+
+        with self.lock:
+            if self.file is None:
+                return
+            now = monotonic()
+            delay = int(round((now - self.lastTime) * 1000))
+            # Keep the rounding error, so that the delays don't drift
+            self.lastTime += delay / 1000.0
+            record = [delay, kind]
+            if sensor is not None:
+                sensorId = self.sensorIds.get(sensor)
+                if sensorId is None:
+                    sensorId = len(self.sensorIds)
+                    self.sensorIds[sensor] = sensorId
+                    self._write([0, SENSOR_ID, sensorId, sensor])
+                record.append(sensorId)
+            if data is not None:
+                record.append(data)
+            self._write(record)
+            self.file.flush()
+
+    def recordSensor(self, kind):
+        """ Returns a callback that records a sensor event """
+
+        return lambda sensor: self.record(kind, sensor)
+
+    def recordMQTT(self, topic, payload):
+        self.record(MQTT_MESSAGE, data=[topic, payload])
+
+    def close(self):
+        """ Closes the trace file, the next events are not recorded """
+
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def readTrace(tracefile):
+    """ Returns the header of a trace and a generator of its events as
+        (seconds since the start, kind, sensor uuid, data) """
+
+    if tracefile.endswith('.gz'):
+        f = gzip.open(tracefile, 'rt')
+    else:
+        f = open(tracefile)
+    header = json.loads(f.readline())
+
+    def events():
+        sensors = {}
+        elapsed = 0
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                elapsed += record[0] / 1000.0
+                kind = record[1]
+                if kind == SENSOR_ID:
+                    sensors[record[2]] = record[3]
+                elif kind in SENSOR_EVENTS:
+                    yield elapsed, kind, sensors[record[2]], None
+                else:
+                    yield elapsed, kind, None, record[2]
+    return header, events()
@@ -47,16 +47,25 @@ $( document ).ready(function() {
 		}
 	}
 
-	startAgain();
-
 	$('#logtype').change(function() {
-		refreshLogs();
+		subscribeLogs();
 	});
 	$('#loglimit').change(function() {
-		refreshLogs();
+		subscribeLogs();
 	});
 
-	socket.emit('join', {})
+	socket.on('connect', function(){
+		// The reply of join is the bootstrap snapshot, without it (e.g.
+		// the main process doesn't answer) it is loaded from bootstrap.json
+		socket.emit('join', {}, function(version, bootstrap){
+			if (bootstrap) {
+				loadBootstrap(JSON.parse(bootstrap));
+			} else {
+				startAgain();
+			}
+		});
+		subscribeLogs();
+	});
 
 	socket.on('sensorsChanged', function(msg){
 		console.log("THIS IS A TEST OF A ROOM1");
@@ -74,31 +83,32 @@ $( document ).ready(function() {
 		console.log("THIS IS A TEST OF A ROOM4");
 		addSensorLog(msg);
 	});
+	socket.on('sensorLogEntry', function(msg){
+		addSensorLogEntry(msg);
+	});
 });
 
 function startAgain(){
+	$.getJSON("bootstrap.json").done(loadBootstrap);
+}
+
+function loadBootstrap(data){
 	$("#sensors").empty();
-	$.getJSON("getSensors.json").done(function(data){
-		$.each(data.sensors, function(sensor, item){
-			var sensorHTML = sensorHTMLTemplate
-			sensorHTML = sensorHTML.replace(/\{sensor\}/g, sensor)
-			sensorHTML = sensorHTML.replace(/\{sensorname\}/g, item.name)
-			$(sensorHTML).appendTo("#sensors");
-		});
-		refreshStatus(data);
-	});
-	refreshLogs()
-	$.getJSON("getSereneSettings.json").done(function(data){
-		allproperties['serenePin'] = data.pin;
+	$.each(data.status.sensors, function(sensor, item){
+		var sensorHTML = sensorHTMLTemplate
+		sensorHTML = sensorHTML.replace(/\{sensor\}/g, sensor)
+		sensorHTML = sensorHTML.replace(/\{sensorname\}/g, item.name)
+		$(sensorHTML).appendTo("#sensors");
 	});
+	refreshStatus(data.status);
+	allproperties['serenePin'] = data.serene.pin;
 }
 
-function refreshLogs(){
+function subscribeLogs(){
 	loglimit = $("#loglimit").val();
 	logtype = $("#logtype").val();
-	$.getJSON("getSensorsLog.json?saveLimit=True&limit="+loglimit+"&type="+logtype).done(function(data){
-		addSensorLog(data);
-	});
+	socket.emit('subscribeLogs', {"limit": loglimit, "type": logtype,
+	                              "format": "json"});
 }
 function refreshStatus(data){
 	console.log("refreshing status")
@@ -150,14 +160,34 @@ function setAlarmStatus(data){
 }
 
 
+function formatLogEntry(log){
+	if (log.timediff)
+		return "[" + log.time + "] (" + log.timediff + ") " + log.event;
+	return "[" + log.time + "] " + log.event;
+}
+
 function addSensorLog(msg){
 	$("#systemListLog").empty();
 	$.each(msg.log, function(i, tmplog){
-		$("#systemListLog").prepend("<li>"+tmplog+"</li>");
+		$("<li>").attr("data-cursor", tmplog.cursor)
+			.text(formatLogEntry(tmplog)).prependTo("#systemListLog");
 	});
 }
 
 
+function addSensorLogEntry(tmplog){
+	// A sensor start log is sent again with its duration when it stops
+	var entry = $("#systemListLog li[data-cursor='" + tmplog.cursor + "']");
+	if (entry.length) {
+		entry.text(formatLogEntry(tmplog));
+		return;
+	}
+	$("<li>").attr("data-cursor", tmplog.cursor)
+		.text(formatLogEntry(tmplog)).prependTo("#systemListLog");
+	$("#systemListLog li").slice($("#loglimit").val()).remove();
+}
+
+
 function changeSensorState(checkbox, sensor){
 	console.log(checkbox);
 	console.log(checkbox.checked);
@@ -168,6 +198,7 @@ function changeSensorState(checkbox, sensor){
 
 function changeSensorSettings(sensor, type){
 	$("#sensorListLog").empty();
+	$("#sensorSummary").empty();
 	if (type === 'newSensor') {
 		var currentName = ""
 		var zones = ""
@@ -181,9 +212,17 @@ function changeSensorSettings(sensor, type){
 		$("#sensorType").hide()
 		$("#delSensorBTN").attr("onclick","deleteSensor('"+ sensor +"')");
 		$("#delSensorBTN").show();
-		$.getJSON("/getSensorsLog.json?limit=100&type=sensor&filterText=" + currentName).done(function(data){
-			$.each(data.log, function(i, tmplog){
-				$("#sensorListLog").prepend("<li>"+tmplog+"</li>");
+		$.getJSON("/sensors/" + encodeURIComponent(sensor) + "/history?limit=100").done(function(data){
+			var summary = data.summary;
+			var meanOpenTime = summary.meanOpenTime === null ? "-" : summary.meanOpenTime + " sec";
+			$("#sensorSummary").text("Today: " + summary.activationsToday +
+				", Last seen: " + (summary.lastSeen || "-") +
+				", Mean open time: " + meanOpenTime);
+			$.each(data.activations, function(i, activation){
+				var tmplog = "[" + activation.start + "] ";
+				if (activation.timediff !== undefined)
+					tmplog += "(" + activation.timediff + ") ";
+				$("#sensorListLog").append($("<li>").text(tmplog + activation.name));
 			});
 		});
 	}
@@ -267,11 +306,12 @@ function closeConfigWindow(){
 
 function settingsMenu(){
 	$("#settingsModal").show();
-	$.getJSON("getSereneSettings.json").done(function(data){
-		$("#myonoffswitchSerene").prop('checked', data.enable);
-		addPinsToSelect('#inputSerenePin', data.pin);
-	});
-	$.getJSON("getAllSettings.json").done(function(data){
+	// The settings have passwords, so they are not in the bootstrap
+	$.when($.getJSON("getSereneSettings.json"),
+	       $.getJSON("getAllSettings.json")).done(function(serene, all){
+		$("#myonoffswitchSerene").prop('checked', serene[0].enable);
+		addPinsToSelect('#inputSerenePin', serene[0].pin);
+		var data = all[0];
 		$("#settMail-enable").prop('checked', data.mail.enable);
 		$("#settMail-username").val(data.mail.username);
 		$("#settMail-password").val(data.mail.password);
@@ -348,16 +388,18 @@ function saveSettings(){
 	messageMQTT.state_topic = $("#settMQTT-state_topic").val();
 	messageMQTT.command_topic = $("#settMQTT-command_topic").val();
 
-	console.log(messageSerene);
-	console.log(messageMail);
-	console.log(messageVoip);
-	console.log(messageUI);
-	console.log(messageMQTT);
-	socket.emit('setSereneSettings', messageSerene);
-	socket.emit('setMailSettings', messageMail);
-	socket.emit('setVoipSettings', messageVoip);
-	socket.emit('setUISettings', messageUI);
-	socket.emit('setMQTTSettings', messageMQTT);
+	var message = {
+		"serene": messageSerene,
+		"mail": messageMail,
+		"voip": messageVoip,
+		"ui": messageUI,
+		"mqtt": messageMQTT
+	}
+	console.log(message);
+	socket.emit('setSettings', message, function(reply){
+		if (reply && reply.error)
+			alert(reply.error);
+	});
 	closeConfigWindow();
 }
 